@@ -0,0 +1,99 @@
+"""Benchmark of aligning commonplace_js results in the system tests.
+
+Compares the former approach of replacing substrings of the re-encoded JSON with the key mapping walker and
+with mapping while decoding, on the parse result of the todo file of the parse golden test.
+
+Example:
+    python -m benchmarks.align_bench --repeat 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from functools import reduce
+
+import requests
+
+from system_tests.sys_test_util import (COMMONPLACE_JS_MAPPING, TESTDATA_DIR, align_commonplace_js_result, start_test_server)
+
+DEFAULT_PORT = 3100
+LEGACY_REPLACEMENTS = [
+    ('"docPos"', '"doc_pos"'),
+    ('"lineNum"', '"line_num"'),
+    ('"timeOfDay"', '"time_of_day"'),
+    ('"workState"', '"work_state"'),
+    ('"subMoments"', '"sub_moments"'),
+    ('"sub_moments": null', '"sub_moments": []'),
+    ('"comments": null', '"comments": []'),
+    (".000", ""),
+    (".999", ".999999"),
+    ('"recurrence": {', '"recurrence": {'),
+    ('"recurrence": "', '"recurrence_type": "'),
+    ("refDate", "ref_date"),
+    ("inProgress", "in_progress"),
+    ("recurrenceType", "recurrence_type"),
+    ("originDocPos", "origin_doc_pos"),
+    ("subInstances", "sub_instances"),
+    ("endsInRange", "ends_in_range"),
+]
+
+
+def legacy_align(data):
+    j = json.dumps(data, indent=2, sort_keys=True)
+    aligned = reduce(lambda c, r: c.replace(r[0], r[1]), LEGACY_REPLACEMENTS, j)
+    return json.loads(aligned)
+
+
+APPROACHES = {
+    "replace": lambda text: legacy_align(json.loads(text)),
+    "walker": lambda text: align_commonplace_js_result(json.loads(text)),
+    "decode_hook": lambda text: json.loads(text, object_pairs_hook=COMMONPLACE_JS_MAPPING.object_pairs_hook),
+}
+
+
+def fetch_parse_result(url: str) -> str:
+    with open(os.path.join(TESTDATA_DIR, "test_todo.txt"), "r", encoding="utf8") as file:
+        todo = file.read()
+    resp = requests.post(f"{url}/parse?fixed_time=2022-05-22&localTime=true",
+                         data=todo.encode("utf8"),
+                         headers={"Content-Type": "application/octet-stream"})
+    resp.raise_for_status()
+    return resp.text
+
+
+def measure(text: str, repeat: int) -> dict:
+    expected = APPROACHES["replace"](text)
+    results = {}
+    for name, align in APPROACHES.items():
+        assert align(text) == expected, f"{name} gives a different result"
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            align(text)
+            times.append((time.perf_counter() - start) * 1000)
+        results[name] = {"min_ms": min(times), "median_ms": statistics.median(times)}
+        print(f"{name:>12} min {min(times):8.2f} ms median {statistics.median(times):8.2f} ms", file=sys.stderr)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks aligning commonplace_js results.")
+    parser.add_argument("--url", help="URL of a running test server. By default, a server is started for the benchmark.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port of the started test server")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per approach")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as todo_dir:
+        with nullcontext() if args.url else start_test_server(args.port, todo_dir):
+            text = fetch_parse_result(args.url or f"http://127.0.0.1:{args.port}")
+
+    print(json.dumps({"response_bytes": len(text), "results": measure(text, args.repeat)}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""Load and latency benchmark of the commonplace_js test server.
+
+Runs every endpoint against synthesized todo files of increasing size and reports throughput, latency percentiles
+and the server's memory as JSON. With a baseline, fails when a result regressed past the threshold.
+Running with several numbers of server worker threads shows how throughput scales with the cores.
+
+Example:
+    python -m benchmarks.server_bench --lines 1000,10000 --concurrency 1,4 --output bench.json
+    python -m benchmarks.server_bench --lines 1000,10000 --concurrency 1,4 --baseline bench.json
+    python -m benchmarks.server_bench --lines 10000 --endpoints parse --concurrency 8 --workers 0,1,2,4
+"""
+import argparse
+import base64
+import gzip
+import json
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+import requests
+
+from benchmarks.todo_synth import synthesize_todo
+from system_tests.sys_test_util import start_test_server
+
+ENDPOINTS = {
+    "parse": "/parse?fixed_time={fixed_time}",
+    "instances": "/instances?fixed_time={fixed_time}&start={start}&end={end}",
+    "format": "/format?fixed_time={fixed_time}",
+    "folding": "/folding?fixed_time={fixed_time}",
+    "outline": "/outline?fixed_time={fixed_time}",
+    "preview": "/preview?fixed_time={fixed_time}",
+}
+FIXED_TIME = "2022-06-05"
+INSTANCES_START = "2022-06-01"
+INSTANCES_END = "2022-06-30"
+DEFAULT_PORT = 3100
+# Higher is better for these metrics, lower for all others
+HIGHER_IS_BETTER = {"throughput"}
+COMPARED_METRICS = ["throughput", "p50_ms", "p95_ms", "rss_mb"]
+
+
+@dataclass
+class BenchResult:
+    endpoint: str
+    lines: int
+    concurrency: int
+    # Worker threads of the server, None for a server that wasn't started by the benchmark
+    workers: Optional[int]
+    requests: int
+    throughput: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    rss_mb: Optional[float]
+    peak_rss_mb: Optional[float]
+
+
+class BodyVariants:
+    """Creates the request bodies and their headers. Unless cached bodies are allowed, every body gets a unique
+    last line, so the server's parse cache never hits. Only that line is encoded per request: the base64 content is
+    padded to a multiple of 3 bytes so the encoded line can be appended, and gzip streams can consist of several
+    compressed members."""
+
+    def __init__(self, content: str, encoding: str, unique: bool):
+        data = content.encode("utf8")
+        if encoding == "base64":
+            data += b"\n" * (-len(data) % 3)
+        self.encoding = encoding
+        self.data = self.encode(data)
+        self.headers = {"Content-Type": "application/text" if encoding == "base64" else "application/octet-stream"}
+        if encoding == "gzip":
+            self.headers["Content-Encoding"] = "gzip"
+        self.unique = unique
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def next(self) -> bytes:
+        if not self.unique:
+            return self.data
+
+        with self.lock:
+            self.counter += 1
+            counter = self.counter
+        return self.data + self.encode(f"[] bench request {counter}\n".encode("utf8"))
+
+    def encode(self, data: bytes) -> bytes:
+        if self.encoding == "base64":
+            return base64.b64encode(data)
+        if self.encoding == "gzip":
+            return gzip.compress(data, compresslevel=1)
+        return data
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Returns the nearest-rank percentile of sorted values."""
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def read_rss_mb(pid: Optional[int]) -> Dict[str, Optional[float]]:
+    """Returns the current and peak resident memory of the process. Only available on Linux."""
+    rss = {"VmRSS": None, "VmHWM": None}
+    if pid is None or platform.system() != "Linux":
+        return rss
+
+    with open(f"/proc/{pid}/status", "r", encoding="utf8") as file:
+        for line in file:
+            key, _, value = line.partition(":")
+            if key in rss:
+                rss[key] = int(value.split()[0]) / 1024
+    return rss
+
+
+def run_endpoint(url: str, endpoint: str, bodies: BodyVariants, concurrency: int, count: int) -> List[float]:
+    """Sends count requests to the endpoint, concurrency at a time, and returns their latencies in seconds."""
+    path = ENDPOINTS[endpoint].format(fixed_time=FIXED_TIME, start=INSTANCES_START, end=INSTANCES_END)
+    sessions = threading.local()
+
+    def send(_):
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        body = bodies.next()
+        start = time.perf_counter()
+        resp = sessions.session.post(f"{url}{path}", data=body, headers=bodies.headers)
+        latency = time.perf_counter() - start
+        resp.raise_for_status()
+        return latency
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(send, range(count)))
+
+
+def run_benchmarks(args, url: str, server_pid: Optional[int], workers: Optional[int]) -> List[BenchResult]:
+    results = []
+    for lines in args.lines:
+        content = synthesize_todo(lines, seed=args.seed)
+        bodies = BodyVariants(content, args.encoding, unique=not args.cached)
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                count = max(args.requests, concurrency)
+                run_endpoint(url, endpoint, bodies, concurrency, min(args.warmup, count))
+
+                start = time.perf_counter()
+                latencies = sorted(run_endpoint(url, endpoint, bodies, concurrency, count))
+                elapsed = time.perf_counter() - start
+
+                rss = read_rss_mb(server_pid)
+                result = BenchResult(endpoint=endpoint,
+                                     lines=lines,
+                                     concurrency=concurrency,
+                                     workers=workers,
+                                     requests=count,
+                                     throughput=count / elapsed,
+                                     p50_ms=percentile(latencies, 50) * 1000,
+                                     p95_ms=percentile(latencies, 95) * 1000,
+                                     p99_ms=percentile(latencies, 99) * 1000,
+                                     rss_mb=rss["VmRSS"],
+                                     peak_rss_mb=rss["VmHWM"])
+                print(f"{endpoint:>10} {lines:>8} lines x{concurrency:<3} {workers if workers is not None else '-':>3} workers "
+                      f"{result.throughput:9.1f} req/s "
+                      f"p50 {result.p50_ms:9.1f} ms p95 {result.p95_ms:9.1f} ms p99 {result.p99_ms:9.1f} ms",
+                      file=sys.stderr)
+                results.append(result)
+    return results
+
+
+def compare(results: List[dict], baseline: List[dict], threshold: float) -> List[str]:
+    """Returns the regressions of the results against the baseline, by more than the threshold (e.g. 0.1 for 10%)."""
+    baseline_by_key = {_result_key(b): b for b in baseline}
+    regressions = []
+    for res in results:
+        base = baseline_by_key.get(_result_key(res))
+        if not base:
+            continue
+
+        for metric in COMPARED_METRICS:
+            if res.get(metric) is None or not base.get(metric):
+                continue
+            change = res[metric] / base[metric] - 1
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            if change > threshold:
+                regressions.append(f"{res['endpoint']} with {res['lines']} lines x{res['concurrency']} "
+                                   f"({res.get('workers')} workers): "
+                                   f"{metric} {base[metric]:.1f} -> {res[metric]:.1f} ({change:+.0%} worse)")
+    return regressions
+
+
+def _result_key(res: dict) -> tuple:
+    return res["endpoint"], res["lines"], res["concurrency"], res.get("workers")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmarks the endpoints of the commonplace_js test server.")
+    parser.add_argument("--url", help="URL of a running test server. By default, a server is started for the benchmark.")
+    parser.add_argument("--server-pid", type=int, help="process id of the running test server, to report its memory")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port of the started test server")
+    parser.add_argument("--lines", type=_int_list, default=[1000, 10000, 100000, 1000000], help="comma-separated file sizes")
+    parser.add_argument("--endpoints", type=lambda s: s.split(","), default=list(ENDPOINTS), help="comma-separated endpoints")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4], help="comma-separated numbers of parallel clients")
+    parser.add_argument("--workers",
+                        type=_int_list,
+                        default=[0],
+                        help="comma-separated numbers of server worker threads, 0 to compute on the event loop")
+    parser.add_argument("--requests", type=int, default=20, help="measured requests per endpoint, size and concurrency")
+    parser.add_argument("--warmup", type=int, default=3, help="unmeasured requests before measuring")
+    parser.add_argument("--encoding",
+                        choices=["raw", "gzip", "base64"],
+                        default="raw",
+                        help="how the todo files are sent: UTF-8, gzip compressed or base64 encoded")
+    parser.add_argument("--cached", action="store_true", help="send the same body every time, so the parse cache can hit")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthesized todo files")
+    parser.add_argument("--output", help="file to write the results to, stdout by default")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as regression")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints {', '.join(sorted(unknown))}")
+    return args
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",")]
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    results = []
+    if args.url:
+        results += run_benchmarks(args, args.url, args.server_pid, None)
+    else:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as todo_dir:
+                env = {"WORKERS": str(workers)}
+                # Unique bodies would only fill the parse cache
+                if not args.cached:
+                    env["PARSE_CACHE_SIZE"] = "1"
+                with start_test_server(args.port, todo_dir, env) as server:
+                    results += run_benchmarks(args, f"http://127.0.0.1:{args.port}", server.pid, workers)
+    results = [asdict(r) for r in results]
+
+    output = json.dumps({
+        "fixed_time": FIXED_TIME,
+        "cached": args.cached,
+        "encoding": args.encoding,
+        "results": results
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            file.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf8") as file:
+            regressions = compare(results, json.load(file)["results"], args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import random
+from datetime import date, timedelta
+
+CATEGORY_DELIM = "------------------"
+WORDS = [
+    "lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod", "tempor",
+    "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua", "enim", "minim", "veniam", "quis", "nostrud"
+]
+STATES = ["", "", "", "x", "x", "p", "w"]
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MAX_DEPTH = 3
+
+
+def synthesize_todo(lines: int, base_date: date = date(2022, 6, 5), seed: int = 0) -> str:
+    """Generates a todo file with about the given number of lines, structured like a real one:
+    categories, moments with nested sub moments and comments, every recurrence type, dates, date ranges and times.
+    Dates are spread around the base date. The same arguments always give the same file."""
+    rnd = random.Random(seed)
+    out = []
+    while len(out) < lines:
+        if rnd.random() < 0.02:
+            out += [CATEGORY_DELIM, f" {_words(rnd, 1, 3).capitalize()}", CATEGORY_DELIM, ""]
+        _add_moment(rnd, out, 0, base_date)
+        if rnd.random() < 0.3:
+            out.append("")
+
+    return "\n".join(out[:lines]) + "\n"
+
+
+def _add_moment(rnd: random.Random, out: list, depth: int, base_date: date):
+    indent = "\t" * depth
+    priority = "!" if rnd.random() < 0.05 else ""
+    out.append(f"{indent}[{rnd.choice(STATES)}] {_words(rnd, 1, 6)}{priority}{_date_suffix(rnd, depth, base_date)}")
+
+    for _ in range(rnd.choice([0, 0, 0, 1, 2, 4])):
+        out.append(f"{indent}\t{_words(rnd, 2, 12)}")
+
+    if depth < MAX_DEPTH:
+        for _ in range(rnd.choice([0, 0, 0, 1, 2, 3, 5])):
+            _add_moment(rnd, out, depth + 1, base_date)
+
+
+def _date_suffix(rnd: random.Random, depth: int, base_date: date) -> str:
+    kind = rnd.random()
+    # Recurring moments are usually top-level
+    if kind < 0.1 and depth == 0:
+        return f" ({_recurrence(rnd)}{_time(rnd)})"
+    if kind < 0.35:
+        return f" ({_date(rnd, base_date)}{_time(rnd)})"
+    if kind < 0.45:
+        start = base_date + timedelta(days=rnd.randint(-60, 60))
+        end = start + timedelta(days=rnd.randint(1, 30))
+        return f" ({_format_date(start)}-{_format_date(end)})"
+    if kind < 0.5:
+        return f" (-{_date(rnd, base_date)})"
+    return ""
+
+
+def _recurrence(rnd: random.Random) -> str:
+    kind = rnd.randrange(6)
+    if kind == 0:
+        return "every day"
+    if kind == 1:
+        return f"every {rnd.choice(WEEKDAYS)}"
+    if kind == 2:
+        return f"every {rnd.choice(['2nd', '3rd', '4th'])} {rnd.choice(WEEKDAYS)}"
+    if kind == 3:
+        return f"every {rnd.randint(1, 31)}."
+    if kind == 4:
+        return f"every {rnd.randint(1, 28)}.{rnd.randint(1, 12)}"
+    return "today"
+
+
+def _date(rnd: random.Random, base_date: date) -> str:
+    return _format_date(base_date + timedelta(days=rnd.randint(-365, 365)))
+
+
+def _format_date(dt: date) -> str:
+    return f"{dt.day}.{dt.month}.{dt.year % 100:02d}"
+
+
+def _time(rnd: random.Random) -> str:
+    return f" {rnd.randint(0, 23):02d}:{rnd.choice([0, 15, 30, 45]):02d}" if rnd.random() < 0.2 else ""
+
+
+def _words(rnd: random.Random, min_count: int, max_count: int) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(min_count, max_count)))
@@ -0,0 +1,69 @@
+import * as fs from 'fs'
+import * as path from 'path'
+
+export const TEST_TODO_FILE = path.join(__dirname, '../../../system_tests/testdata/test_todo.txt')
+
+export interface BenchResult {
+    name: string
+    medianMillis: number
+    minMillis: number
+}
+
+export function loadTestTodo(scale = 1): string {
+    return fs.readFileSync(TEST_TODO_FILE).toString().replace(/\r/g, '').repeat(scale)
+}
+
+/**
+ * runs fn a few times for warm-up, then measures the given number of runs.
+ */
+export function measure(name: string, fn: () => unknown, runs = 10, warmupRuns = 2): BenchResult {
+    for (let i = 0; i < warmupRuns; i++) {
+        fn()
+    }
+
+    const times = []
+    for (let i = 0; i < runs; i++) {
+        const start = process.hrtime.bigint()
+        fn()
+        times.push(Number(process.hrtime.bigint() - start) / 1e6)
+    }
+    times.sort((a, b) => a - b)
+
+    return { name, medianMillis: times[Math.floor(times.length / 2)], minMillis: times[0] }
+}
+
+export function report(title: string, results: BenchResult[]) {
+    const baseline = results[0].medianMillis
+    const lines = results.map(r => `  ${r.name.padEnd(40)} median ${r.medianMillis.toFixed(2).padStart(10)} ms, min ${r.minMillis.toFixed(2).padStart(10)} ms, ${(baseline / r.medianMillis).toFixed(2)}x`)
+    console.log(`${title}\n${lines.join('\n')}`)
+}
+
+export interface MemoryResult {
+    name: string
+    retainedBytes: number
+}
+
+/**
+ * returns the heap memory retained by the result of fn. Needs node's --expose-gc to be accurate.
+ */
+export function measureMemory(name: string, fn: () => unknown): MemoryResult {
+    const gc = (global as { gc?: () => void }).gc
+    gc?.()
+    const before = usedMemory()
+    const result = fn()
+    gc?.()
+    const retainedBytes = usedMemory() - before
+    // Keep the result alive until after measuring
+    return result !== undefined ? { name, retainedBytes } : { name, retainedBytes: 0 }
+}
+
+function usedMemory(): number {
+    // Typed arrays are stored outside of the heap
+    const usage = process.memoryUsage()
+    return usage.heapUsed + usage.arrayBuffers
+}
+
+export function reportMemory(title: string, results: MemoryResult[]) {
+    const lines = results.map(r => `  ${r.name.padEnd(40)} ${(r.retainedBytes / 1e6).toFixed(1).padStart(10)} MB`)
+    console.log(`${title}\n${lines.join('\n')}`)
+}
@@ -0,0 +1,23 @@
+import { compactTodos } from '../src/CompactTodos'
+import { formatTodos } from '../src/format'
+import { createParseConfig } from '../src/models'
+import { parseMomentsCompact, parseMomentsString } from '../src/parse'
+import { loadTestTodo, measure, measureMemory, report, reportMemory } from './benchUtil'
+
+test('memory of compact todos', () => {
+    const config = createParseConfig()
+    const content = loadTestTodo(500)
+
+    reportMemory(`retained memory of test_todo.txt x500 (${content.split('\n').length} lines)`, [
+        measureMemory('parseMomentsString', () => parseMomentsString(content, config)),
+        measureMemory('parseMomentsCompact', () => parseMomentsCompact(content, config))
+    ])
+
+    report('parse and format test_todo.txt x500', [
+        measure('parseMomentsString', () => formatTodos(parseMomentsString(content, config), content), 5),
+        measure('parseMomentsCompact', () => formatTodos(parseMomentsCompact(content, config), content), 5)
+    ])
+
+    const todos = parseMomentsString(content, config)
+    expect(JSON.stringify(compactTodos(todos, content))).toEqual(JSON.stringify(parseMomentsCompact(content, config)))
+})
@@ -0,0 +1,26 @@
+import { createParseConfig } from '../src/models'
+import { parseMomentsString } from '../src/parse'
+import { loadTestTodo, measure, report } from './benchUtil'
+
+test('date and time parsing', () => {
+    const content = loadTestTodo(100)
+
+    // Same formats as the default, but quoted so they aren't recognized by the fast path and always go through date-fns
+    const dateFnsConfig = createParseConfig()
+    dateFnsConfig.dateFormats = dateFnsConfig.dateFormats.map(fmt => fmt.replace(/\./g, "'.'"))
+    dateFnsConfig.timeFormat = "HH':'mm"
+    dateFnsConfig.dateCacheSize = 0
+
+    const fastPathConfig = createParseConfig()
+    fastPathConfig.dateCacheSize = 0
+
+    const cachedConfig = createParseConfig()
+
+    report('parseMomentsString of test_todo.txt x100', [
+        measure('date-fns', () => parseMomentsString(content, dateFnsConfig)),
+        measure('fast path', () => parseMomentsString(content, fastPathConfig)),
+        measure('fast path + cache', () => parseMomentsString(content, cachedConfig))
+    ])
+
+    expect(parseMomentsString(content, cachedConfig)).toEqual(parseMomentsString(content, dateFnsConfig))
+})
@@ -0,0 +1,51 @@
+import { cleanDoneMoments } from '../src/clean'
+import { DeleteEdit, Edit, EditType, EOF_OFFSET, InsertEdit } from '../src/models'
+import { applyEdits } from '../src/util'
+import { measure, report } from './benchUtil'
+
+test('applying clean edits', () => {
+    for (const doneMoments of [1000, 5000]) {
+        const content = todoWithDoneMoments(doneMoments)
+        const edits = cleanDoneMoments(content)
+
+        report(`apply ${edits.length} clean edits of ${doneMoments} done moments (${content.length} chars)`, [
+            measure('sentinels and slices', () => applyEditsWithSentinels(content, edits), 5),
+            measure('applyEdits', () => applyEdits(content, edits), 5)
+        ])
+
+        expect(applyEdits(content, edits)).toEqual(applyEditsWithSentinels(content, edits))
+    }
+})
+
+function todoWithDoneMoments(doneMoments: number): string {
+    let content = '------\n cat\n------\n'
+    for (let i = 0; i < doneMoments; i++) {
+        content += `[x] done ${i} (1.2.22)\n\tcomment\n\t[x] sub\n\n[] open ${i}\n`
+    }
+    return content
+}
+
+// The former implementation of the test server, for comparison. It assumes the content has no ~ characters.
+function applyEditsWithSentinels(content: string, edits: Edit[]): string {
+    const inserts = edits.filter(e => e.type === EditType.INSERT)
+        .map(e => ({ ...e, offset: (e as InsertEdit).offset === EOF_OFFSET ? content.length : (e as InsertEdit).offset }))
+    const deletes = edits.filter(e => e.type === EditType.DELETE)
+
+    let updated = content;
+    (deletes as DeleteEdit[]).forEach(del => {
+        updated = updated.slice(0, del.startOffset) + '~'.repeat(del.endOffset - del.startOffset) + updated.slice(del.endOffset)
+    })
+
+    for (let i = 0; i < inserts.length; i++) {
+        const insert = inserts[i] as InsertEdit
+        updated = updated.slice(0, insert.offset) + insert.content + updated.slice(insert.offset)
+        for (let j = i + 1; j < inserts.length; j++) {
+            const nextInsert = inserts[j] as InsertEdit
+            if (nextInsert.offset >= insert.offset) {
+                nextInsert.offset += insert.content.length
+            }
+        }
+    }
+
+    return updated.replace(/~/g, '')
+}
@@ -0,0 +1,55 @@
+import { addDays, compareAsc, endOfDay, endOfWeek, startOfDay, startOfWeek } from 'date-fns'
+import { generateInstances } from '../src/instantiate'
+import { createParseConfig, Instance, PreviewInstance, Todos } from '../src/models'
+import { getMomentIndex } from '../src/MomentIndex'
+import { parseMomentsString } from '../src/parse'
+import { previewMoments } from '../src/preview'
+import { loadTestTodo, measure, report } from './benchUtil'
+
+test('preview of today and the week', () => {
+    const config = createParseConfig()
+    config.fixedTime = new Date(2022, 4, 22)
+    const todos = parseMomentsString(loadTestTodo(100), config)
+
+    report('preview of test_todo.txt x100', [
+        measure('today and week separately', () => remindersInTwoPasses(todos, config.fixedTime as Date)),
+        measure('previewMoments, with overview and calendar', () => previewMoments(todos, config.fixedTime))
+    ])
+
+    // Including the days around daylight saving time changes
+    for (let day = new Date(2022, 2, 1); day < new Date(2022, 11, 1); day = addDays(day, 1)) {
+        const preview = previewMoments(todos, day)
+        const [today, week] = remindersInTwoPasses(todos, day)
+        expect(JSON.stringify(preview.today)).toEqual(JSON.stringify(today))
+        expect(JSON.stringify(preview.week)).toEqual(JSON.stringify(week))
+    }
+})
+
+// The former implementation, generating the instances of today and of the week separately
+function remindersInTwoPasses(todos: Todos, now: Date): [PreviewInstance[], PreviewInstance[]] {
+    return [
+        flattenReminders(momentsEndingInRange(todos, startOfDay(now), endOfDay(now))),
+        flattenReminders(momentsEndingInRange(todos, startOfWeek(now, { weekStartsOn: 1 }), endOfWeek(now, { weekStartsOn: 1 })))
+    ]
+}
+
+function momentsEndingInRange(todos: Todos, start: Date, end: Date): Instance[] {
+    const instances = filterEndingInRange(generateInstances(getMomentIndex(todos), start, end, { predicate: inst => !inst.done }))
+    instances.sort((a, b) => compareAsc(a.start, b.start))
+    return instances
+}
+
+function filterEndingInRange(instances: Instance[]): Instance[] {
+    return instances.flatMap(inst => {
+        const subInstances = filterEndingInRange(inst.subInstances)
+        return subInstances.length || inst.endsInRange ? [{ ...inst, subInstances }] : []
+    })
+}
+
+function flattenReminders(instances: Instance[], parentPath = ''): PreviewInstance[] {
+    return instances.flatMap(inst => {
+        // eslint-disable-next-line @typescript-eslint/no-unused-vars
+        const { subInstances, ...previewInst } = { ...inst, name: parentPath + inst.name }
+        return (inst.endsInRange ? [previewInst] : []).concat(flattenReminders(inst.subInstances, `${parentPath}${inst.name}/`))
+    })
+}
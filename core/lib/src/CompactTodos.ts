@@ -0,0 +1,368 @@
+import {
+    Category, Comment, DocPosition, isRecurringMoment, isSingleMoment, Moment, MomentDateTime, Recurrence, RecurrenceType, RecurringMoment,
+    SingleMoment, Todos, WorkState
+} from './models'
+
+const WORK_STATES = Object.values(WorkState)
+const RECURRENCE_TYPES = Object.values(RecurrenceType)
+
+const SINGLE_KIND = 0
+const RECURRING_KIND = 1
+
+// Date slots of a moment: the start or reference date, the end and the time of day
+const START_SLOT = 0
+const END_SLOT = 1
+const TIME_SLOT = 2
+const DATE_SLOTS = 3
+
+/**
+ * the columns of a CompactTodos. Moments are stored in pre-order, so the sub moments of a moment
+ * follow it and end at its subtreeEnd. Dates are timestamps, NaN for dates that aren't set.
+ */
+export interface MomentColumns {
+    content: string
+    categories: Category[]
+    // Indexes of the top-level moments
+    topLevel: Int32Array
+    lineNums: Int32Array
+    offsets: Int32Array
+    lengths: Int32Array
+    nameOffsets: Int32Array
+    nameLengths: Int32Array
+    // Moment names that aren't a slice of the content
+    otherNames: Map<number, string>
+    workStates: Uint8Array
+    priorities: Int32Array
+    // Index into categories, -1 without category
+    categoryIndexes: Int32Array
+    subtreeEnds: Int32Array
+    kinds: Uint8Array
+    recurrenceTypes: Uint8Array
+    // DATE_SLOTS entries per moment
+    dates: Float64Array
+    dateLineNums: Int32Array
+    dateOffsets: Int32Array
+    dateLengths: Int32Array
+    // Range of the moment's comments in the comment columns
+    commentStarts: Int32Array
+    commentEnds: Int32Array
+    commentLineNums: Int32Array
+    commentOffsets: Int32Array
+    commentLengths: Int32Array
+}
+
+/**
+ * a Todos keeping its moments in typed arrays instead of one object per moment, comment and position.
+ * Names and comments are slices of the parsed content. Moments are returned as views reading from the arrays,
+ * which are only created when accessed.
+ */
+export class CompactTodos implements Todos {
+    private columns: MomentColumns
+    private views: (MomentView | undefined)[]
+    private topLevelViews?: Moment[]
+
+    constructor(columns: MomentColumns) {
+        this.columns = columns
+        this.views = new Array(columns.lineNums.length)
+    }
+
+    get categories(): Category[] {
+        return this.columns.categories
+    }
+
+    get moments(): Moment[] {
+        if (!this.topLevelViews) {
+            this.topLevelViews = Array.from(this.columns.topLevel, i => this.moment(i))
+        }
+        return this.topLevelViews
+    }
+
+    get momentCount(): number {
+        return this.columns.lineNums.length
+    }
+
+    /**
+     * returns the view of the moment at the pre-order index. Views are kept, so the same moment is
+     * always the same object.
+     */
+    moment(index: number): Moment {
+        let view = this.views[index]
+        if (!view) {
+            view = this.columns.kinds[index] === RECURRING_KIND
+                ? new RecurringMomentView(this, this.columns, index)
+                : new SingleMomentView(this, this.columns, index)
+            this.views[index] = view
+        }
+        return view
+    }
+
+    /**
+     * returns the columns, e.g. to send them to another thread and rebuild the todos there.
+     */
+    toColumns(): MomentColumns {
+        return this.columns
+    }
+
+    toJSON(): object {
+        return { categories: this.categories, moments: this.moments }
+    }
+}
+
+class MomentView implements Moment {
+    protected todos: CompactTodos
+    protected columns: MomentColumns
+    protected index: number
+
+    constructor(todos: CompactTodos, columns: MomentColumns, index: number) {
+        this.todos = todos
+        this.columns = columns
+        this.index = index
+    }
+
+    get name(): string {
+        const c = this.columns
+        const offset = c.nameOffsets[this.index]
+        return offset < 0 ? c.otherNames.get(this.index)! : c.content.slice(offset, offset + c.nameLengths[this.index])
+    }
+
+    get comments(): Comment[] {
+        const c = this.columns
+        const comments = []
+        for (let i = c.commentStarts[this.index]; i < c.commentEnds[this.index]; i++) {
+            const offset = c.commentOffsets[i]
+            comments.push({
+                content: c.content.slice(offset, offset + c.commentLengths[i]),
+                docPos: { lineNum: c.commentLineNums[i], offset, length: c.commentLengths[i] }
+            })
+        }
+        return comments
+    }
+
+    get subMoments(): Moment[] {
+        const subMoments = []
+        const end = this.columns.subtreeEnds[this.index]
+        for (let i = this.index + 1; i < end; i = this.columns.subtreeEnds[i]) {
+            subMoments.push(this.todos.moment(i))
+        }
+        return subMoments
+    }
+
+    get workState(): WorkState {
+        return WORK_STATES[this.columns.workStates[this.index]]
+    }
+
+    get priority(): number {
+        return this.columns.priorities[this.index]
+    }
+
+    get category(): Category | null {
+        // Like for parsed moments, this is undefined for moments before the first category
+        return this.columns.categories[this.columns.categoryIndexes[this.index]]
+    }
+
+    get timeOfDay(): MomentDateTime | null {
+        return this.date(TIME_SLOT)
+    }
+
+    get docPos(): DocPosition {
+        const c = this.columns
+        return { lineNum: c.lineNums[this.index], offset: c.offsets[this.index], length: c.lengths[this.index] }
+    }
+
+    protected date(slot: number): MomentDateTime | null {
+        const c = this.columns
+        const i = this.index * DATE_SLOTS + slot
+        if (isNaN(c.dates[i])) {
+            return null
+        }
+        return {
+            dt: new Date(c.dates[i]),
+            docPos: { lineNum: c.dateLineNums[i], offset: c.dateOffsets[i], length: c.dateLengths[i] }
+        }
+    }
+
+    toJSON(): object {
+        return {
+            name: this.name,
+            comments: this.comments,
+            subMoments: this.subMoments,
+            workState: this.workState,
+            priority: this.priority,
+            category: this.category,
+            timeOfDay: this.timeOfDay,
+            docPos: this.docPos
+        }
+    }
+}
+
+class SingleMomentView extends MomentView implements SingleMoment {
+    get start(): MomentDateTime | null {
+        return this.date(START_SLOT)
+    }
+
+    get end(): MomentDateTime | null {
+        return this.date(END_SLOT)
+    }
+
+    toJSON(): object {
+        return { ...super.toJSON(), start: this.start, end: this.end }
+    }
+}
+
+class RecurringMomentView extends MomentView implements RecurringMoment {
+    get recurrence(): Recurrence {
+        return {
+            recurrenceType: RECURRENCE_TYPES[this.columns.recurrenceTypes[this.index]],
+            refDate: this.date(START_SLOT)!
+        }
+    }
+
+    toJSON(): object {
+        return { ...super.toJSON(), recurrence: this.recurrence }
+    }
+}
+
+/**
+ * collects moments into the columns of a CompactTodos. Moments can be added one by one as they are parsed,
+ * so they don't have to exist as objects all at the same time.
+ */
+export class CompactTodosBuilder {
+    private content: string
+    private categories: Category[]
+    private categoryIndexes: Map<Category, number>
+    private topLevel: number[]
+    private moments: number[][]
+    private otherNames: Map<number, string>
+    private dates: number[]
+    private datePositions: number[][]
+    private comments: number[][]
+
+    /**
+     * creates a builder for moments of the content. The categories can still be added to while adding moments.
+     */
+    constructor(content: string, categories: Category[]) {
+        this.content = content
+        this.categories = categories
+        this.categoryIndexes = new Map()
+        this.topLevel = []
+        // lineNum, offset, length, nameOffset, nameLength, workState, priority, category, subtreeEnd, kind,
+        // recurrenceType, commentStart, commentEnd
+        this.moments = Array.from({ length: 13 }, () => [])
+        this.otherNames = new Map()
+        this.dates = []
+        this.datePositions = [[], [], []]
+        this.comments = [[], [], []]
+    }
+
+    /**
+     * adds a top-level moment and its sub moments.
+     */
+    addMoment(mom: Moment) {
+        this.topLevel.push(this.moments[0].length)
+        this.addMomentTree(mom)
+    }
+
+    build(): CompactTodos {
+        const m = this.moments
+        return new CompactTodos({
+            content: this.content,
+            categories: this.categories,
+            topLevel: Int32Array.from(this.topLevel),
+            lineNums: Int32Array.from(m[0]),
+            offsets: Int32Array.from(m[1]),
+            lengths: Int32Array.from(m[2]),
+            nameOffsets: Int32Array.from(m[3]),
+            nameLengths: Int32Array.from(m[4]),
+            otherNames: this.otherNames,
+            workStates: Uint8Array.from(m[5]),
+            priorities: Int32Array.from(m[6]),
+            categoryIndexes: Int32Array.from(m[7]),
+            subtreeEnds: Int32Array.from(m[8]),
+            kinds: Uint8Array.from(m[9]),
+            recurrenceTypes: Uint8Array.from(m[10]),
+            commentStarts: Int32Array.from(m[11]),
+            commentEnds: Int32Array.from(m[12]),
+            dates: Float64Array.from(this.dates),
+            dateLineNums: Int32Array.from(this.datePositions[0]),
+            dateOffsets: Int32Array.from(this.datePositions[1]),
+            dateLengths: Int32Array.from(this.datePositions[2]),
+            commentLineNums: Int32Array.from(this.comments[0]),
+            commentOffsets: Int32Array.from(this.comments[1]),
+            commentLengths: Int32Array.from(this.comments[2])
+        })
+    }
+
+    private addMomentTree(mom: Moment) {
+        const index = this.moments[0].length
+        const recurring = isRecurringMoment(mom)
+        const recurrence = recurring ? (mom as RecurringMoment).recurrence : null
+        const [nameOffset, nameLength] = this.findName(mom, index)
+
+        const columns = this.moments
+        columns[0].push(mom.docPos.lineNum)
+        columns[1].push(mom.docPos.offset)
+        columns[2].push(mom.docPos.length)
+        columns[3].push(nameOffset)
+        columns[4].push(nameLength)
+        columns[5].push(WORK_STATES.indexOf(mom.workState))
+        columns[6].push(mom.priority)
+        columns[7].push(this.categoryIndex(mom.category))
+        columns[8].push(-1)
+        columns[9].push(recurring ? RECURRING_KIND : SINGLE_KIND)
+        columns[10].push(recurrence ? RECURRENCE_TYPES.indexOf(recurrence.recurrenceType) : 0)
+        columns[11].push(this.comments[0].length)
+
+        mom.comments.forEach(com => {
+            this.comments[0].push(com.docPos.lineNum)
+            this.comments[1].push(com.docPos.offset)
+            this.comments[2].push(com.docPos.length)
+        })
+        columns[12].push(this.comments[0].length)
+
+        const singleMom = isSingleMoment(mom) ? mom as SingleMoment : null
+        this.addDate(recurrence ? recurrence.refDate : singleMom?.start ?? null)
+        this.addDate(singleMom?.end ?? null)
+        this.addDate(mom.timeOfDay)
+
+        mom.subMoments.forEach(sub => this.addMomentTree(sub))
+        columns[8][index] = columns[0].length
+    }
+
+    private findName(mom: Moment, index: number): [number, number] {
+        // The name is part of the moment's line, any occurrence in it is the same string
+        const offset = this.content.indexOf(mom.name, mom.docPos.offset)
+        if (offset < 0 || offset + mom.name.length > mom.docPos.offset + mom.docPos.length) {
+            this.otherNames.set(index, mom.name)
+            return [-1, 0]
+        }
+        return [offset, mom.name.length]
+    }
+
+    private categoryIndex(category: Category | null): number {
+        if (!category) {
+            return -1
+        }
+
+        // Index the categories added since the last lookup
+        for (let i = this.categoryIndexes.size; i < this.categories.length && !this.categoryIndexes.has(category); i++) {
+            this.categoryIndexes.set(this.categories[i], i)
+        }
+        return this.categoryIndexes.get(category) ?? -1
+    }
+
+    private addDate(date: MomentDateTime | null) {
+        this.dates.push(date ? date.dt.getTime() : NaN)
+        this.datePositions[0].push(date?.docPos.lineNum ?? 0)
+        this.datePositions[1].push(date?.docPos.offset ?? 0)
+        this.datePositions[2].push(date?.docPos.length ?? 0)
+    }
+}
+
+/**
+ * converts parsed todos of the content into a CompactTodos.
+ */
+export function compactTodos(todos: Todos, content: string): CompactTodos {
+    const builder = new CompactTodosBuilder(content, todos.categories)
+    todos.moments.forEach(mom => builder.addMoment(mom))
+    return builder.build()
+}
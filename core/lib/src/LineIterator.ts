@@ -1,19 +1,113 @@
+import { StringDecoder } from 'string_decoder'
 import { Line } from './models'
 
-export function* splitLikeFile(content: string) {
-    let prev: string | null = null
-    for (const line of content.split(/(\n)/)) {
-        if (prev === null) {
-            prev = line
+export function* splitLikeFile(content: string, start = 0) {
+    let pos = start
+    while (pos < content.length) {
+        const newlinePos = content.indexOf('\n', pos)
+        if (newlinePos < 0) {
+            yield content.slice(pos)
+            return
         }
-        else {
-            yield prev + '\n'
-            prev = null
+        yield content.slice(pos, newlinePos + 1)
+        pos = newlinePos + 1
+    }
+}
+
+/**
+ * lines of a stream of chunks, split like splitLikeFile. Lines have to be read from the stream
+ * with fill or fillUntil before next returns them, next only reports done at the end of the stream.
+ * Lines returned by next are dropped from the buffer.
+ */
+export class ChunkedLines implements Iterator<string> {
+    private chunks: AsyncIterator<Buffer | string>
+    private decoder: StringDecoder
+    private lines: string[]
+    private head: number
+    private partialLine: string
+    private ended: boolean
+
+    constructor(chunks: AsyncIterable<Buffer | string>) {
+        this.chunks = chunks[Symbol.asyncIterator]()
+        this.decoder = new StringDecoder('utf8')
+        this.lines = []
+        this.head = 0
+        this.partialLine = ''
+        this.ended = false
+    }
+
+    /**
+     * reads from the stream until at least count lines are buffered or the stream ended.
+     */
+    async fill(count: number) {
+        while (this.lines.length - this.head < count && await this.read()) {
+            // keep reading
         }
     }
 
-    if (prev) { // deliberately also ignoring empty string
-        yield prev
+    /**
+     * reads from the stream until a buffered line matches or the stream ended.
+     */
+    async fillUntil(matches: (line: string) => boolean) {
+        let i = this.head
+        do {
+            for (; i < this.lines.length; i++) {
+                if (matches(this.lines[i])) {
+                    return
+                }
+            }
+        } while (await this.read())
+    }
+
+    next(): IteratorResult<string, any> {
+        if (this.head < this.lines.length) {
+            const line = this.lines[this.head++]
+            if (this.head >= 64 && this.head * 2 >= this.lines.length) {
+                // Drop the lines read so far, so only the lines ahead are kept in memory
+                this.lines = this.lines.slice(this.head)
+                this.head = 0
+            }
+            return { done: false, value: line }
+        }
+
+        if (!this.ended) {
+            throw new Error('Cannot read past the buffered lines before the end of the stream')
+        }
+        return { done: true, value: null }
+    }
+
+    private async read(): Promise<boolean> {
+        if (this.ended) {
+            return false
+        }
+
+        const chunk = await this.chunks.next()
+        if (chunk.done) {
+            this.ended = true
+            this.addText(this.decoder.end(), true)
+            return false
+        }
+
+        // The decoder keeps incomplete multi-byte characters at the end of a chunk for the next one
+        this.addText(typeof chunk.value === 'string' ? chunk.value : this.decoder.write(chunk.value), false)
+        return true
+    }
+
+    private addText(text: string, last: boolean) {
+        let pos = 0
+        let newlinePos = text.indexOf('\n')
+        while (newlinePos >= 0) {
+            this.lines.push(this.partialLine + text.slice(pos, newlinePos + 1))
+            this.partialLine = ''
+            pos = newlinePos + 1
+            newlinePos = text.indexOf('\n', pos)
+        }
+        this.partialLine += text.slice(pos)
+
+        if (last && this.partialLine) {
+            this.lines.push(this.partialLine)
+            this.partialLine = ''
+        }
     }
 }
 
@@ -28,10 +122,10 @@ export class LineIteratorImpl implements LineIterator {
     private lastLine: string | null
     private undoing: boolean
 
-    constructor(lines: Iterator<string>) {
+    constructor(lines: Iterator<string>, lineNumber = 0, offset = 0) {
         this.lines = lines
-        this.lineNumber = 0
-        this.offset = 0
+        this.lineNumber = lineNumber
+        this.offset = offset
         this.lastLine = null
         this.undoing = false
     }
@@ -0,0 +1,117 @@
+import { isSingleMoment, Moment, SingleMoment, Todos } from './models'
+
+const momentIndexes = new WeakMap<Todos, MomentIndex>()
+
+/**
+ * returns the index over the top-level moments of the todos, creating it on first use.
+ */
+export function getMomentIndex(todos: Todos): MomentIndex {
+    let index = momentIndexes.get(todos)
+    if (!index) {
+        index = new MomentIndex(todos.moments)
+        momentIndexes.set(todos, index)
+    }
+
+    return index
+}
+
+/**
+ * finds the moments that can have instances in a date range without intersecting every moment with it.
+ *
+ * Single moments with a start or end are kept in an interval tree, stored as a binary tree over the moments
+ * sorted by start, where every node also knows the latest end in its subtree. Recurring moments and moments
+ * without dates can have instances in any range and are always returned.
+ */
+export class MomentIndex {
+    private moments: Moment[]
+    // Positions of moments without a date range, ascending
+    private unbounded: number[]
+    // Positions, starts and ends of the dated moments sorted by start, and the latest end of each subtree
+    private positions: Int32Array
+    private starts: Float64Array
+    private ends: Float64Array
+    private maxEnds: Float64Array
+
+    constructor(moments: Moment[]) {
+        this.moments = moments
+        this.unbounded = []
+
+        const dated: number[] = []
+        moments.forEach((mom, i) => {
+            const singleMom = mom as SingleMoment
+            if (isSingleMoment(mom) && (singleMom.start || singleMom.end)) {
+                dated.push(i)
+            }
+            else {
+                this.unbounded.push(i)
+            }
+        })
+
+        const start = (i: number) => (moments[i] as SingleMoment).start?.dt.getTime() ?? -Infinity
+        const end = (i: number) => (moments[i] as SingleMoment).end?.dt.getTime() ?? Infinity
+        dated.sort((a, b) => start(a) - start(b))
+
+        this.positions = Int32Array.from(dated)
+        this.starts = Float64Array.from(dated, start)
+        this.ends = Float64Array.from(dated, end)
+        this.maxEnds = new Float64Array(dated.length)
+        this.computeMaxEnds(0, dated.length)
+    }
+
+    /**
+     * returns the moments that can have instances between start and end (inclusive), in their original order.
+     */
+    overlapping(start: Date, end: Date): Moment[] {
+        const found: number[] = []
+        this.findOverlapping(0, this.positions.length, start.getTime(), end.getTime(), found)
+        found.sort((a, b) => a - b)
+
+        // Merge with the unbounded moments, both are sorted by position
+        const res: Moment[] = []
+        let i = 0
+        let j = 0
+        while (i < found.length || j < this.unbounded.length) {
+            if (j >= this.unbounded.length || (i < found.length && found[i] < this.unbounded[j])) {
+                res.push(this.moments[found[i++]])
+            }
+            else {
+                res.push(this.moments[this.unbounded[j++]])
+            }
+        }
+
+        return res
+    }
+
+    private computeMaxEnds(lo: number, hi: number): number {
+        if (lo >= hi) {
+            return -Infinity
+        }
+
+        const mid = (lo + hi) >> 1
+        this.maxEnds[mid] = Math.max(this.ends[mid], this.computeMaxEnds(lo, mid), this.computeMaxEnds(mid + 1, hi))
+        return this.maxEnds[mid]
+    }
+
+    private findOverlapping(lo: number, hi: number, start: number, end: number, found: number[]) {
+        if (lo >= hi) {
+            return
+        }
+
+        const mid = (lo + hi) >> 1
+        if (this.maxEnds[mid] < start) {
+            // Everything in this subtree ends before the range
+            return
+        }
+
+        this.findOverlapping(lo, mid, start, end, found)
+        if (this.starts[mid] > end) {
+            // This and everything to the right starts after the range
+            return
+        }
+
+        if (this.ends[mid] >= start) {
+            found.push(this.positions[mid])
+        }
+        this.findOverlapping(mid + 1, hi, start, end, found)
+    }
+}
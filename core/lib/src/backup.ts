@@ -1,26 +1,50 @@
 import { format } from 'date-fns'
+import { createHash } from 'crypto'
 import * as fs from 'fs'
 import * as path from 'path'
+import { writeFileAtomic } from './files'
 
+interface BackupEntry {
+    file: string
+    // Hash of the content, unknown for backups found in the backup directory before there was a manifest
+    hash?: string
+}
+
+interface BackupManifest {
+    // Newest first
+    backups: BackupEntry[]
+}
+
+/**
+ * backs up the file to the backup directory, keeping the newest maxBackups backups of it.
+ * The backup is skipped if the file didn't change since its last backup. Backups are copy-on-write clones
+ * where the file system supports them, and a manifest per file lists its backups so pruning doesn't
+ * need to scan the backup directory.
+ */
 export async function backup(file: string, backupDir: string, maxBackups = 3, fixedTime?: Date | null) {
     await fs.promises.mkdir(backupDir, { recursive: true })
 
     const [stem, suffix] = splitFileName(file)
+    const manifest = await readManifest(stem, backupDir) ?? await scanBackups(stem, backupDir)
+    const hash = await hashFile(file)
+    const last = manifest.backups[0]
+    if (last?.hash === hash && await exists(path.join(backupDir, last.file))) {
+        return
+    }
+
     const now = fixedTime || new Date()
     const timestamp = format(now, 'yyyy-MM-dd_HH-mm-ss')
-    const newBackup = path.join(backupDir, `${stem}.${timestamp}${suffix}`)
+    const newBackup = `${stem}.${timestamp}${suffix}`
 
-    await fs.promises.copyFile(file, newBackup, fs.constants.COPYFILE_EXCL)
-    await pruneBackups(stem, backupDir, maxBackups)
-}
+    // Falls back to a regular copy if the file system can't clone
+    await fs.promises.copyFile(file, path.join(backupDir, newBackup), fs.constants.COPYFILE_EXCL | fs.constants.COPYFILE_FICLONE)
 
-async function pruneBackups(stem: string, backupDir: string, maxBackups: number) {
-    const allBackups = await listBackupsNewestFirst(backupDir)
-    await Promise.all(allBackups
-        .filter(b => backupStem(b) === stem)
-        .slice(maxBackups)
-        .map(oldBackup => fs.promises.rm(oldBackup))
+    manifest.backups.unshift({ file: newBackup, hash })
+    await Promise.all(manifest.backups
+        .splice(maxBackups)
+        .map(oldBackup => fs.promises.rm(path.join(backupDir, oldBackup.file), { force: true }))
     )
+    await writeFileAtomic(manifestFile(stem, backupDir), JSON.stringify(manifest))
 }
 
 export async function listBackupsNewestFirst(backupDir: string) {
@@ -28,7 +52,7 @@ export async function listBackupsNewestFirst(backupDir: string) {
 
     const dir = await fs.promises.opendir(backupDir)
     for await (const dirent of dir) {
-        if (dirent.isFile()) {
+        if (dirent.isFile() && !isManifest(dirent.name)) {
             allBackups.push(path.join(backupDir, dirent.name))
         }
     }
@@ -38,6 +62,44 @@ export async function listBackupsNewestFirst(backupDir: string) {
     return allBackups
 }
 
+async function readManifest(stem: string, backupDir: string): Promise<BackupManifest | undefined> {
+    try {
+        const manifest = JSON.parse((await fs.promises.readFile(manifestFile(stem, backupDir))).toString())
+        return Array.isArray(manifest?.backups) ? manifest : undefined
+    }
+    catch {
+        // A missing or damaged manifest is rebuilt from the backup directory
+        return undefined
+    }
+}
+
+async function scanBackups(stem: string, backupDir: string): Promise<BackupManifest> {
+    const backups = (await listBackupsNewestFirst(backupDir))
+        .filter(b => backupStem(b) === stem)
+        .map(b => ({ file: path.basename(b) }))
+    return { backups }
+}
+
+function manifestFile(stem: string, backupDir: string): string {
+    return path.join(backupDir, `.${stem}.manifest.json`)
+}
+
+function isManifest(name: string): boolean {
+    return name.startsWith('.') && name.endsWith('.manifest.json')
+}
+
+async function hashFile(file: string): Promise<string> {
+    const hash = createHash('sha1')
+    for await (const chunk of fs.createReadStream(file)) {
+        hash.update(chunk)
+    }
+    return hash.digest('hex')
+}
+
+async function exists(file: string): Promise<boolean> {
+    return fs.promises.stat(file).then(() => true, () => false)
+}
+
 function splitFileName(file: string): [string, string] {
     const basename = path.basename(file)
     const m = basename.match(/^(.*)(\.[^.]*)$/)
@@ -0,0 +1,20 @@
+/**
+ * tells a long computation that its result isn't needed anymore. Computations check it between
+ * top-level blocks of the document. Compatible with vscode.CancellationToken.
+ */
+export interface CancellationToken {
+    readonly isCancellationRequested: boolean
+}
+
+export class CancelledError extends Error {
+    constructor() {
+        super('Cancelled')
+        this.name = 'CancelledError'
+    }
+}
+
+export function throwIfCancelled(token?: CancellationToken) {
+    if (token?.isCancellationRequested) {
+        throw new CancelledError()
+    }
+}
@@ -0,0 +1,258 @@
+import { isValid, parse } from 'date-fns'
+import { ParseConfig } from './models'
+import { LruCache } from './util'
+
+/**
+ * the date strings parsed with a config. Cleared when the formats of the config or the current day change,
+ * since two-digit years and times depend on the current date.
+ */
+interface DateCache {
+    day: number
+    dateFormats: string[]
+    timeFormat: string
+    dates: LruCache<string, Date | null>
+    times: LruCache<string, Date | null>
+}
+
+interface FormatPart {
+    text: string
+    literal: boolean
+}
+
+// Format tokens recognized without going through date-fns, with the same semantics as date-fns' parse
+const FAST_TOKENS = ['d', 'dd', 'M', 'MM', 'yy', 'yyyy', 'H', 'HH', 'm', 'mm']
+const DAYS_IN_MONTH = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+const dateCaches = new WeakMap<ParseConfig, DateCache>()
+const compiledFormats = new Map<string, FormatPart[] | null>()
+
+export function parseDate(content: string, config: ParseConfig): Date | null {
+    const stripped = content.trim()
+    const now = new Date()
+    const cache = getDateCache(config, now)?.dates
+    let date = cache?.get(stripped)
+    if (date === undefined) {
+        date = null
+        for (const fmt of config.dateFormats) {
+            date = parseFormat(stripped, fmt, now)
+            if (date) {
+                break
+            }
+        }
+        cache?.set(stripped, date)
+    }
+
+    return copyDate(date)
+}
+
+export function parseTime(content: string, config: ParseConfig): Date | null {
+    const stripped = content.trim()
+    const now = new Date()
+    const cache = getDateCache(config, now)?.times
+    let time = cache?.get(stripped)
+    if (time === undefined) {
+        time = parseFormat(stripped, config.timeFormat, now)
+        cache?.set(stripped, time)
+    }
+
+    return copyDate(time)
+}
+
+// Every moment gets its own instance, so mutating one can't change the cache or other moments
+function copyDate(date: Date | null): Date | null {
+    return date && new Date(date.getTime())
+}
+
+function getDateCache(config: ParseConfig, now: Date): DateCache | null {
+    if (config.dateCacheSize <= 0) {
+        return null
+    }
+
+    const day = now.getFullYear() * 10000 + now.getMonth() * 100 + now.getDate()
+    let cache = dateCaches.get(config)
+    if (!cache || cache.day !== day || cache.dateFormats !== config.dateFormats || cache.timeFormat !== config.timeFormat) {
+        cache = {
+            day,
+            dateFormats: config.dateFormats,
+            timeFormat: config.timeFormat,
+            dates: new LruCache(config.dateCacheSize),
+            times: new LruCache(config.dateCacheSize)
+        }
+        dateCaches.set(config, cache)
+    }
+
+    return cache
+}
+
+function parseFormat(content: string, fmt: string, now: Date): Date | null {
+    const parts = compileFormat(fmt)
+    if (!parts) {
+        const date = parse(content, fmt, now)
+        return isValid(date) ? date : null
+    }
+
+    return parseFormatParts(content, parts, now)
+}
+
+/**
+ * splits the format into tokens and literals, or returns null if the format uses tokens
+ * that the fast path doesn't support.
+ */
+function compileFormat(fmt: string): FormatPart[] | null {
+    let parts = compiledFormats.get(fmt)
+    if (parts === undefined) {
+        parts = []
+        const seenTokens = new Set<string>()
+        for (const text of fmt.match(/([a-zA-Z])\1*|[^a-zA-Z']+|'/g) ?? []) {
+            const literal = !/^[a-zA-Z]/.test(text)
+            if (text === "'" || (!literal && (!FAST_TOKENS.includes(text) || seenTokens.has(text[0])))) {
+                parts = null
+                break
+            }
+            seenTokens.add(text[0])
+            parts.push({ text, literal })
+        }
+        compiledFormats.set(fmt, parts)
+    }
+
+    return parts?.length ? parts : null
+}
+
+function parseFormatParts(content: string, parts: FormatPart[], now: Date): Date | null {
+    const values: Record<string, number> = {}
+    let pos = 0
+    for (const part of parts) {
+        if (part.literal) {
+            if (!content.startsWith(part.text, pos)) {
+                return null
+            }
+            pos += part.text.length
+            continue
+        }
+
+        const len = matchNumber(content, pos, part.text)
+        if (!len) {
+            return null
+        }
+        values[part.text[0]] = parseInt(content.slice(pos, pos + len))
+        pos += len
+    }
+
+    if (content.slice(pos).trim()) {
+        return null
+    }
+
+    return toDate(values, parts.some(p => p.text === 'yy'), now)
+}
+
+/**
+ * returns the number of digits matched by the token at pos, mimicking the patterns date-fns uses.
+ */
+function matchNumber(content: string, pos: number, token: string): number {
+    const first = digitAt(content, pos)
+    if (first < 0) {
+        return 0
+    }
+
+    if (token === 'yyyy') {
+        let len = 1
+        while (len < 4 && digitAt(content, pos + len) >= 0) {
+            len++
+        }
+        return len
+    }
+
+    const second = digitAt(content, pos + 1)
+    if (second < 0) {
+        return 1
+    }
+
+    switch (token) {
+        // /^(3[01]|[12]?\d)/
+        case 'd': return (first === 3 && second <= 1) || first === 1 || first === 2 ? 2 : 1
+        // /^(1[0-2]|0?\d)/
+        case 'M': return (first === 1 && second <= 2) || first === 0 ? 2 : 1
+        // /^(2[0-3]|[0-1]?\d)/
+        case 'H': return (first === 2 && second <= 3) || first <= 1 ? 2 : 1
+        // /^[0-5]?\d/
+        case 'm': return first <= 5 ? 2 : 1
+        // /^\d{1,2}/
+        default: return 2
+    }
+}
+
+function digitAt(content: string, pos: number): number {
+    const code = content.charCodeAt(pos) - 48
+    return code >= 0 && code <= 9 ? code : -1
+}
+
+function toDate(values: Record<string, number>, twoDigitYear: boolean, now: Date): Date | null {
+    // Like date-fns, unset fields are taken from now, and setting a field resets all smaller ones
+    let year = now.getFullYear()
+    let month = now.getMonth()
+    let day = now.getDate()
+    let hours = now.getHours()
+    let minutes = now.getMinutes()
+    let seconds = now.getSeconds()
+    let millis = now.getMilliseconds()
+
+    if (values.y !== undefined) {
+        if (!twoDigitYear && values.y <= 0) {
+            return null
+        }
+        year = twoDigitYear ? normalizeTwoDigitYear(values.y, year) : values.y
+        month = 0
+        day = 1
+        hours = minutes = seconds = millis = 0
+    }
+    if (values.M !== undefined) {
+        if (values.M < 1 || values.M > 12) {
+            return null
+        }
+        month = values.M - 1
+        day = 1
+        hours = minutes = seconds = millis = 0
+    }
+    if (values.d !== undefined) {
+        if (values.d < 1 || values.d > daysInMonth(year, month)) {
+            return null
+        }
+        day = values.d
+        hours = minutes = seconds = millis = 0
+    }
+    if (values.H !== undefined) {
+        if (values.H > 23) {
+            return null
+        }
+        hours = values.H
+        minutes = seconds = millis = 0
+    }
+    if (values.m !== undefined) {
+        if (values.m > 59) {
+            return null
+        }
+        minutes = values.m
+        seconds = millis = 0
+    }
+
+    // setFullYear instead of the Date constructor, which would map years 0-99 to 1900-1999
+    const date = new Date(0)
+    date.setFullYear(year, month, day)
+    date.setHours(hours, minutes, seconds, millis)
+    return date
+}
+
+function normalizeTwoDigitYear(twoDigitYear: number, currentYear: number): number {
+    if (currentYear <= 50) {
+        return twoDigitYear || 100
+    }
+
+    const rangeEnd = currentYear + 50
+    const rangeEndCentury = Math.floor(rangeEnd / 100) * 100
+    return twoDigitYear + rangeEndCentury - (twoDigitYear >= rangeEnd % 100 ? 100 : 0)
+}
+
+function daysInMonth(year: number, month: number): number {
+    const leapYear = year % 400 === 0 || (year % 4 === 0 && year % 100 !== 0)
+    return month === 1 && leapYear ? 29 : DAYS_IN_MONTH[month]
+}
@@ -0,0 +1,27 @@
+import * as fs from 'fs'
+import * as path from 'path'
+
+/**
+ * replaces the content of the file by writing a temporary file next to it, syncing it to disk and renaming it
+ * over the file. A crash leaves either the old or the new content, never a partly written file.
+ */
+export async function writeFileAtomic(file: string, content: string): Promise<void> {
+    const mode = await fs.promises.stat(file).then(s => s.mode, () => undefined)
+    const tmpFile = path.join(path.dirname(file), `.${path.basename(file)}.${process.pid}.${Date.now()}.tmp`)
+
+    const handle = await fs.promises.open(tmpFile, 'wx', mode)
+    try {
+        try {
+            await handle.writeFile(content)
+            await handle.sync()
+        }
+        finally {
+            await handle.close()
+        }
+        await fs.promises.rename(tmpFile, file)
+    }
+    catch (e) {
+        await fs.promises.rm(tmpFile, { force: true })
+        throw e
+    }
+}
@@ -1,7 +1,9 @@
 import { addDays, differenceInDays, differenceInHours, startOfDay } from 'date-fns'
 import { generateInstancesOfMoment } from './instantiate'
 import { Moment, Todos, WorkState, SingleMoment, isSingleMoment, isRecurringMoment, RecurringMoment, DocPosition, Outline } from './models'
-import { getBottomLine } from './util'
+import { getMomentIndex } from './MomentIndex'
+import { getBottomLine, WhitespaceIndex } from './util'
+import { CancellationToken, throwIfCancelled } from './cancellation'
 
 export const TODO_FORMAT = 'todo'
 export const TRASH_FORMAT = 'trash'
@@ -21,18 +23,32 @@ export interface FormatStyle {
 }
 
 interface FormatState {
-    rawContent: string
+    whitespace: WhitespaceIndex
     styles: FormatStyle[]
     lastStyle?: FormatStyle
-    fixedTime: Date | null
+    // Days until moments are due, for the ones due soon
+    dueSoon: Map<Moment, number>
 }
 
-export function formatTodos(todos: Todos, rawContent: string, formatType: string = TODO_FORMAT, fixedTime: Date | null = null): FormatStyle[] {
-    const state: FormatState = { rawContent, fixedTime, styles: [] }
+interface DueSoonWindow {
+    today: Date
+    nDaysFromToday: Date
+    nRealHours: number
+}
+
+// Due until 10 (n-1) days in the future
+const DUE_SOON_CUTOFF = 11
+
+export function formatTodos(
+    todos: Todos, rawContent: string, formatType: string = TODO_FORMAT, fixedTime: Date | null = null, token?: CancellationToken
+): FormatStyle[] {
+    const dueSoon = formatType === TODO_FORMAT ? findDueSoon(todos, fixedTime) : new Map()
+    const state: FormatState = { whitespace: new WhitespaceIndex(rawContent), dueSoon, styles: [] }
 
     todos.categories.forEach(cat => addFormatLine(state, CAT_STYLE, cat.docPos))
 
     todos.moments.forEach(mom => {
+        throwIfCancelled(token)
         if (formatType === TODO_FORMAT) {
             formatMoment(state, mom)
         }
@@ -53,7 +69,7 @@ export function formatTodos(todos: Todos, rawContent: string, formatType: string
 
 function formatMoment(state: FormatState, mom: Moment, parentDone = false) {
     const done = parentDone || mom.workState === WorkState.DONE
-    const style = MOM_STYLE + determineBaseStyle(mom, done, state.fixedTime)
+    const style = MOM_STYLE + determineBaseStyle(mom, done, state.dueSoon)
     addFormatLine(state, style, mom.docPos)
 
     if (done) {
@@ -66,15 +82,15 @@ function formatMoment(state: FormatState, mom: Moment, parentDone = false) {
     mom.subMoments.forEach(sub => formatMoment(state, sub, done))
 }
 
-function determineBaseStyle(mom: Moment, done: boolean, fixedTime: Date | null) {
+function determineBaseStyle(mom: Moment, done: boolean, dueSoon: Map<Moment, number>) {
     if (done) {
         return DONE_SUFFIX
     }
 
     let suffix = ''
-    const dueSoon = formatDueSoon(mom, fixedTime)
-    if (dueSoon) {
-        suffix = dueSoon
+    const dueDays = dueSoon.get(mom)
+    if (dueDays !== undefined) {
+        suffix = `${UNTIL_SUFFIX}${dueDays}`
     }
     else if (mom.workState !== WorkState.NEW) {
         suffix = `.${mom.workState}`
@@ -87,6 +103,60 @@ function determineBaseStyle(mom: Moment, done: boolean, fixedTime: Date | null)
     return suffix
 }
 
+/**
+ * returns the days until each moment is due, for all moments that are not done and due within the cutoff.
+ */
+function findDueSoon(todos: Todos, fixedTime: Date | null): Map<Moment, number> {
+    const today = startOfDay(fixedTime || new Date())
+    const nDaysFromToday = addDays(today, DUE_SOON_CUTOFF)
+    const window: DueSoonWindow = {
+        today,
+        nDaysFromToday,
+        nRealHours: differenceInHours(nDaysFromToday, today)
+    }
+
+    const dueSoon = new Map<Moment, number>()
+    const candidates = new Set(getMomentIndex(todos).overlapping(today, nDaysFromToday))
+    addDueSoon(todos.moments, window, dueSoon, candidates)
+    return dueSoon
+}
+
+function addDueSoon(moments: Moment[], window: DueSoonWindow, dueSoon: Map<Moment, number>, candidates?: Set<Moment>) {
+    moments.forEach(mom => {
+        // Done moments and their sub moments are never shown as due
+        if (mom.workState === WorkState.DONE) {
+            return
+        }
+
+        // Top-level moments outside the window can't be due soon, but their sub moments have dates of their own
+        if (!candidates || candidates.has(mom)) {
+            const dueDays = findDueDays(mom, window)
+            if (dueDays < DUE_SOON_CUTOFF) {
+                dueSoon.set(mom, dueDays)
+            }
+        }
+        addDueSoon(mom.subMoments, window, dueSoon)
+    })
+}
+
+function findDueDays(mom: Moment, window: DueSoonWindow): number {
+    const instances = generateInstancesOfMoment(mom, window.today, window.nDaysFromToday, { inclSubs: false })
+    let earliest = DUE_SOON_CUTOFF
+    instances.forEach(inst => {
+        // We need to compare hours here because of daylight saving time.
+        // Instead of 264h (=11 days) it might only be 263h or 265h,
+        // which would lead to the wrong number of days calculated.
+        if (differenceInHours(inst.end, window.today) < window.nRealHours) {
+            const dueDays = differenceInDays(inst.end, window.today)
+            if (dueDays < earliest) {
+                earliest = dueDays
+            }
+        }
+    })
+
+    return earliest
+}
+
 function formatTrashMoment(state: FormatState, mom: Moment) {
     addFormatLine(state, MOM_STYLE, mom.docPos)
     formatDates(state, mom)
@@ -112,35 +182,8 @@ function formatDates(state: FormatState, mom: Moment) {
     }
 }
 
-function formatDueSoon(mom: Moment, fixedTime: Date | null) {
-    // Due until 10 (n-1) days in the future
-    const cutoff = 11
-    const today = startOfDay(fixedTime || new Date())
-    const nDaysFromToday = addDays(today, cutoff)
-    const nRealHours = differenceInHours(nDaysFromToday, today)
-    const instances = generateInstancesOfMoment(mom, today, nDaysFromToday, { inclSubs: false })
-    let earliest = cutoff
-    instances.forEach(inst => {
-        // We need to compare hours here because of daylight saving time.
-        // Instead of 264h (=11 days) it might only be 263h or 265h,
-        // which would lead to the wrong number of days calculated.
-        if (differenceInHours(inst.end, today) < nRealHours) {
-            const dueDays = differenceInDays(inst.end, today)
-            if (dueDays < earliest) {
-                earliest = dueDays
-            }
-        }
-    })
-
-    if (earliest < cutoff) {
-        return `${UNTIL_SUFFIX}${earliest}`
-    }
-
-    return ''
-}
-
 function addFormatLine(state: FormatState, style: string, pos: DocPosition) {
-    if (state.lastStyle && style === state.lastStyle.style && onlyWhitespaceBetween(state.lastStyle.end, pos.offset, state.rawContent)) {
+    if (state.lastStyle && style === state.lastStyle.style && state.whitespace.onlyWhitespaceBetween(state.lastStyle.end, pos.offset)) {
         state.lastStyle.end = pos.offset + pos.length
     }
     else {
@@ -160,15 +203,6 @@ function flushLastStyle(state: FormatState) {
     state.lastStyle = undefined
 }
 
-function onlyWhitespaceBetween(start: number, end: number, rawContent: string) {
-    for (let i = start; i < end; i++) {
-        if (!/\s/.test(rawContent[i])) {
-            return false
-        }
-    }
-    return true
-}
-
 export function foldTodos(todos: Todos): number[][] {
     return todos.moments
         .map(mom => [mom.docPos.lineNum, getBottomLine(mom)])
@@ -1,17 +1,38 @@
-import { parseMomentsString } from './parse'
+import { parseMomentsString, parseMomentsIncremental, parseMomentsAsync, parseMomentsCompact, parseMomentsCancellable } from './parse'
+import { CancellationToken, CancelledError } from './cancellation'
+import { CompactTodos, compactTodos, MomentColumns } from './CompactTodos'
 import { createParseConfig, WorkState, Outline, Edit, EditType, InsertEdit, DeleteEdit, EOF_OFFSET } from './models'
 import { formatTodos, foldTodos, outlineTodos, TODO_FORMAT, TRASH_FORMAT, FormatStyle } from './format'
-import { generateInstances, generateInstancesOfMoment } from './instantiate'
+import { generateInstances, iterateInstances, generateInstancesOfMoment, countRecurring } from './instantiate'
 import { cleanDoneMoments, trashDoneMoments } from './clean'
 import { backup } from './backup'
+import { appendTrash } from './trash'
+import { writeFileAtomic } from './files'
 import { previewMoments } from './preview'
-import { inLocalTimezone, isoTimezoneOffset, getBottomLine } from './util'
+import { PreviewPatch, PreviewSnapshot, snapshotPreview, diffPreview, isEmptyPatch } from './previewPatch'
+import { MomentIndex, getMomentIndex } from './MomentIndex'
+import { inLocalTimezone, isoTimezoneOffset, getBottomLine, diffEdits, applyEdits, WhitespaceIndex, LruCache } from './util'
 
 export {
     createParseConfig,
     parseMomentsString,
+    parseMomentsIncremental,
+    parseMomentsAsync,
+    parseMomentsCompact,
+    parseMomentsCancellable,
+    CancellationToken,
+    CancelledError,
+    CompactTodos,
+    compactTodos,
+    MomentColumns,
+    diffEdits,
+    applyEdits,
     generateInstances,
+    iterateInstances,
     generateInstancesOfMoment,
+    countRecurring,
+    MomentIndex,
+    getMomentIndex,
     formatTodos,
     foldTodos,
     outlineTodos,
@@ -29,7 +50,16 @@ export {
     EOF_OFFSET,
     cleanDoneMoments,
     trashDoneMoments,
+    appendTrash,
+    writeFileAtomic,
     getBottomLine,
+    WhitespaceIndex,
+    LruCache,
     backup,
-    previewMoments
+    previewMoments,
+    PreviewPatch,
+    PreviewSnapshot,
+    snapshotPreview,
+    diffPreview,
+    isEmptyPatch
 }
@@ -1,29 +1,49 @@
-import { addDays, addYears, endOfDay, getDay, getDaysInMonth, isAfter, isBefore, setDay } from 'date-fns'
+import { endOfDay, isAfter, isBefore } from 'date-fns'
 import { Instance, isRecurringMoment, isSingleMoment, Moment, MomentDateTime, Recurrence, RecurrenceType, RecurringMoment, SingleMoment, WorkState } from './models'
-import { epochWeek } from './util'
+import { MomentIndex } from './MomentIndex'
 
 interface GenerateOptions {
     inclSubs?: boolean
     predicate?: (i: Instance) => boolean
 }
 
-export function generateInstances(moments: Moment[], start: Date, end: Date, options: GenerateOptions = { inclSubs: true }) {
-    return moments.flatMap(m => generateInstancesOfMoment(m, start, end, options))
+/**
+ * generates the instances of the moments between start and end. With a MomentIndex, only the moments
+ * that can have instances in the range are visited.
+ */
+export function generateInstances(moments: Moment[] | MomentIndex, start: Date, end: Date, options: GenerateOptions = { inclSubs: true }) {
+    return Array.from(iterateInstances(moments, start, end, options))
+}
+
+/**
+ * lazily generates the same instances as generateInstances, in the same order. Instances are only created
+ * when iterated, each with its sub instances, so long ranges can be consumed without keeping all of them.
+ */
+export function* iterateInstances(moments: Moment[] | MomentIndex, start: Date, end: Date, options: GenerateOptions = { inclSubs: true }): Generator<Instance> {
+    const candidates = moments instanceof MomentIndex ? moments.overlapping(start, endOfDay(end)) : moments
+    for (const moment of candidates) {
+        yield* iterateInstancesOfMoment(moment, start, end, options)
+    }
 }
 
 export function generateInstancesOfMoment(moment: Moment, start: Date, end: Date, options: GenerateOptions = { inclSubs: true }) {
+    return Array.from(iterateInstancesOfMoment(moment, start, end, options))
+}
+
+function* iterateInstancesOfMoment(moment: Moment, start: Date, end: Date, options: GenerateOptions): Generator<Instance> {
     end = endOfDay(end)
-    const instances: Instance[] = createInstances(moment, start, end).filter(i => !options.predicate || options.predicate(i))
-    if (options.inclSubs === undefined || options.inclSubs) {
-        instances.forEach(inst => {
+    for (const inst of createInstances(moment, start, end)) {
+        if (options.predicate && !options.predicate(inst)) {
+            continue
+        }
+        if (options.inclSubs === undefined || options.inclSubs) {
             inst.subInstances = generateInstances(moment.subMoments, inst.start, inst.end, options)
-        })
+        }
+        yield inst
     }
-
-    return instances
 }
 
-function createInstances(moment: Moment, start: Date, end: Date) {
+function createInstances(moment: Moment, start: Date, end: Date): Iterable<Instance> {
     if (isSingleMoment(moment)) {
         return createSingleMomentInstances(moment as SingleMoment, start, end)
     }
@@ -46,12 +66,10 @@ function createSingleMomentInstances(moment: SingleMoment, start: Date, end: Dat
     return [inst]
 }
 
-function createRecurringMomentInstances(moment: RecurringMoment, start: Date, end: Date) {
-    const instances = []
+function* createRecurringMomentInstances(moment: RecurringMoment, start: Date, end: Date): Generator<Instance> {
     for (const instStart of generateRecurring(moment.recurrence, start, end)) {
-        instances.push(createInstance(moment, instStart, endOfDay(instStart), true))
+        yield createInstance(moment, instStart, endOfDay(instStart), true)
     }
-    return instances
 }
 
 function createInstance(moment: Moment, instStart: Date, instEnd: Date, endsInRange: boolean): Instance {
@@ -115,103 +133,139 @@ function latest(t1: Date | null, t2: Date | null): Date | null {
     return isAfter(t1, t2) ? t1 : t2
 }
 
+/**
+ * returns the number of occurrences of the recurrence between start and end, without creating them.
+ */
+export function countRecurring(recurrence: Recurrence, start: Date, end: Date): number {
+    const series = recurrenceSeries(recurrence, start, end)
+    return Math.max(0, series.last - series.first + 1)
+}
+
 function* generateRecurring(recurrence: Recurrence, start: Date, end: Date): Generator<Date> {
-    let cur = addDays(start, -1)
-    while (true) {
-        cur = nextRecurring(recurrence, cur)
-        if (!isAfter(cur, end)) {
-            yield cur
-        }
-        else {
-            break
-        }
+    const series = recurrenceSeries(recurrence, start, end)
+    for (let i = series.first; i <= series.last; i++) {
+        yield series.at(i)
     }
 }
 
-function nextRecurring(recurrence: Recurrence, after: Date) {
+/**
+ * occurrences of a recurrence that can be computed directly from their index,
+ * so the ones between start and end can be created or counted without stepping through them.
+ */
+interface RecurrenceSeries {
+    // Index of the first occurrence on or after the start
+    first: number
+    // Index of the last occurrence on or before the end
+    last: number
+    at: (index: number) => Date
+}
+
+function recurrenceSeries(recurrence: Recurrence, start: Date, end: Date): RecurrenceSeries {
+    const refDate = recurrence.refDate.dt
     switch (recurrence.recurrenceType) {
-        case RecurrenceType.DAILY: return nextDaily(after, recurrence.refDate.dt)
-        case RecurrenceType.WEEKLY: return nextWeekly(after, recurrence.refDate.dt)
-        case RecurrenceType.BIWEEKLY: return nextNweekly(2, after, recurrence.refDate.dt)
-        case RecurrenceType.TRIWEEKLY: return nextNweekly(3, after, recurrence.refDate.dt)
-        case RecurrenceType.QUADRIWEEKLY: return nextNweekly(4, after, recurrence.refDate.dt)
-        case RecurrenceType.MONTHLY: return nextMonthly(after, recurrence.refDate.dt)
-        case RecurrenceType.YEARLY: return nextYearly(after, recurrence.refDate.dt)
+        case RecurrenceType.DAILY: return daySeries(start, 1, end, start)
+        case RecurrenceType.WEEKLY: return daySeries(firstWeekly(start, refDate), 7, end, start)
+        case RecurrenceType.BIWEEKLY: return daySeries(firstNweekly(2, start, refDate), 14, end, start)
+        case RecurrenceType.TRIWEEKLY: return daySeries(firstNweekly(3, start, refDate), 21, end, start)
+        case RecurrenceType.QUADRIWEEKLY: return daySeries(firstNweekly(4, start, refDate), 28, end, start)
+        case RecurrenceType.MONTHLY: return monthlySeries(start, end, refDate)
+        case RecurrenceType.YEARLY: return yearlySeries(start, end, refDate)
         default: throw Error(`Unknown recurrence type ${recurrence.recurrenceType}`)
     }
 }
 
-// eslint-disable-next-line @typescript-eslint/no-unused-vars
-function nextDaily(after: Date, _: Date) {
-    return addDays(after, 1)
-}
+/**
+ * occurrences every stepDays calendar days from first, keeping its time of day across daylight saving time changes.
+ */
+function daySeries(first: Date, stepDays: number, end: Date, timeOfDay: Date): RecurrenceSeries {
+    // Occurrences are at the time of day of the start, also after a day where that time didn't exist
+    const at = (index: number) => new Date(
+        first.getFullYear(), first.getMonth(), first.getDate() + index * stepDays,
+        timeOfDay.getHours(), timeOfDay.getMinutes(), timeOfDay.getSeconds(), timeOfDay.getMilliseconds()
+    )
 
-function nextWeekly(after: Date, refDate: Date) {
-    let date = setDay(after, getDay(refDate))
-    if (!isAfter(date, after)) {
-        date = addDays(date, 7)
+    let last = Math.floor((dayNumber(end) - dayNumber(first)) / stepDays)
+    if (last >= 0 && isAfter(at(last), end)) {
+        last--
     }
-    return date
+
+    return { first: 0, last, at }
 }
 
-function nextNweekly(nth: number, after: Date, refDate: Date) {
-    let date = setDay(after, getDay(refDate))
-    if (!isAfter(date, after)) {
-        date = addDays(date, 7)
-    }
+function firstWeekly(start: Date, refDate: Date): Date {
+    const date = new Date(start)
+    date.setDate(start.getDate() + (refDate.getDay() - start.getDay() + 7) % 7)
+    return date
+}
 
-    const offset = (epochWeek(date) - epochWeek(refDate)) % nth
+/**
+ * the first occurrence on or after start that is a multiple of nth calendar weeks from refDate. Counting local calendar
+ * days keeps the cadence the same on both sides of daylight saving time changes.
+ */
+function firstNweekly(nth: number, start: Date, refDate: Date): Date {
+    const date = firstWeekly(start, refDate)
+    // Both are on the same weekday, so this is a whole number of weeks
+    const weeks = Math.round((dayNumber(date) - dayNumber(refDate)) / 7)
+    const offset = ((weeks % nth) + nth) % nth
     if (offset > 0) {
-        date = addDays(date, 7 * (nth - offset))
-    }
-    else if (offset < 0) {
-        date = addDays(date, -7 * offset)
+        date.setDate(date.getDate() + 7 * (nth - offset))
     }
 
     return date
 }
 
-function nextMonthly(after: Date, refDate: Date) {
-    let date = new Date(
-        after.getFullYear(),
-        after.getMonth(),
-        Math.min(refDate.getDate(), getDaysInMonth(after)),
-        0,
-        0,
-        0,
-        0
-    )
+/**
+ * occurrences on the day of the month of refDate, or the last day of shorter months. Indexed by year * 12 + month.
+ */
+function monthlySeries(start: Date, end: Date, refDate: Date): RecurrenceSeries {
+    const at = (index: number) => {
+        const year = Math.floor(index / 12)
+        const month = index % 12
+        return new Date(year, month, Math.min(refDate.getDate(), daysInMonth(year, month)), 0, 0, 0, 0)
+    }
+    const indexOf = (date: Date) => date.getFullYear() * 12 + date.getMonth()
 
-    if (!isAfter(date, after)) {
-        const year = date.getMonth() === 11 ? date.getFullYear() + 1 : date.getFullYear()
-        const month = (date.getMonth() + 1) % 12
-        date = new Date(
-            year,
-            month,
-            Math.min(refDate.getDate(), getDaysInMonth(new Date(year, month, 1))),
-            0,
-            0,
-            0,
-            0
-        )
+    return indexedSeries(start, end, at, indexOf)
+}
+
+/**
+ * occurrences on the day and month of refDate, or the 28th of February in non-leap years. Indexed by year.
+ */
+function yearlySeries(start: Date, end: Date, refDate: Date): RecurrenceSeries {
+    const at = (year: number) => {
+        const month = refDate.getMonth()
+        return new Date(year, month, Math.min(refDate.getDate(), daysInMonth(year, month)), 0, 0, 0, 0)
     }
+    const indexOf = (date: Date) => date.getFullYear()
 
-    return date
+    return indexedSeries(start, end, at, indexOf)
 }
 
-function nextYearly(after: Date, refDate: Date) {
-    let date = new Date(
-        after.getFullYear(),
-        refDate.getMonth(),
-        refDate.getDate(),
-        0,
-        0,
-        0,
-        0
-    )
+function indexedSeries(start: Date, end: Date, at: (index: number) => Date, indexOf: (date: Date) => number): RecurrenceSeries {
+    // Occurrences are at midnight, so an occurrence on the start day counts even if start has a time of day
+    const dayBeforeStart = new Date(start)
+    dayBeforeStart.setDate(start.getDate() - 1)
 
-    if (!isAfter(date, after)) {
-        date = addYears(date, 1)
+    let first = indexOf(dayBeforeStart)
+    if (!isAfter(at(first), dayBeforeStart)) {
+        first++
     }
-    return date
+
+    let last = indexOf(end)
+    if (isAfter(at(last), end)) {
+        last--
+    }
+
+    return { first, last, at }
+}
+
+/**
+ * returns the number of calendar days since the epoch, ignoring the time of day and timezone.
+ */
+function dayNumber(date: Date): number {
+    return Math.round(Date.UTC(date.getFullYear(), date.getMonth(), date.getDate()) / 86400000)
+}
+
+function daysInMonth(year: number, month: number): number {
+    return new Date(year, month + 1, 0).getDate()
 }
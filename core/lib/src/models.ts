@@ -18,6 +18,8 @@ export interface ParseConfig {
     rightDateBracket: string
     dateFormats: string[]
     timeFormat: string
+    // Number of parsed date and time strings to remember, 0 to disable caching
+    dateCacheSize: number
     stateMarks: Record<string, WorkState>
     stateMarkPattern: RegExp
     weekDays: string[]
@@ -45,6 +47,7 @@ export function createParseConfig(): ParseConfig {
         rightDateBracket: ')',
         dateFormats: ['dd.MM.yy', 'dd.M.yy', 'd.M.yy', 'dd.MM.yyyy', 'd.M.yyyy', 'd.MM.yyyy'],
         timeFormat: 'HH:mm',
+        dateCacheSize: 1000,
         stateMarks: {
             x: WorkState.DONE,
             w: WorkState.WAITING,
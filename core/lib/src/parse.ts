@@ -1,11 +1,13 @@
-import { addDays, endOfDay, isValid, parse, setDay, startOfDay } from 'date-fns'
-import { LineIterator, LineIteratorImpl, StringLineIterator } from './LineIterator'
+import { addDays, endOfDay, setDay, startOfDay } from 'date-fns'
+import { parseDate, parseTime } from './dates'
+import { CompactTodos, CompactTodosBuilder } from './CompactTodos'
+import { ChunkedLines, LineIterator, LineIteratorImpl, splitLikeFile, StringLineIterator } from './LineIterator'
 import {
-    Category, createTodos, getNow, Line, Moment, MomentDateTime, ParseConfig, Recurrence, RecurrenceType,
-    RecurrenceWithoutDocPos,
-    RecurringMoment, SingleMoment, Todos, WorkState
+    Category, createTodos, DeleteEdit, DocPosition, Edit, EditType, EOF_OFFSET, getNow, InsertEdit, isRecurringMoment, isSingleMoment, Line, Moment,
+    MomentDateTime, ParseConfig, Recurrence, RecurrenceType, RecurrenceWithoutDocPos, RecurringMoment, SingleMoment, Todos, WorkState
 } from './models'
-import { epochWeek, each } from './util'
+import { epochWeek, each, applyEdits, diffEdits } from './util'
+import { CancellationToken, throwIfCancelled } from './cancellation'
 
 interface ParseState {
     config: ParseConfig
@@ -13,22 +15,283 @@ interface ParseState {
     todos: Todos
 }
 
-export function parseMomentsString(content: string, config: ParseConfig): Todos {
-    return parseMomentsLines(StringLineIterator(content), config)
+/**
+ * a category or top-level moment block of a parsed document. The parser is always at the top level
+ * when it reaches the first line of a block, so parsing can be restarted there.
+ */
+interface TopLevelBlock {
+    offset: number
+    lineNum: number
+    // Number of categories and moments that were parsed before this block
+    categoryCount: number
+    momentCount: number
+}
+
+// How long parseMomentsCancellable parses before giving the event loop a turn
+const DEFAULT_SLICE_MILLIS = 10
+// The day each parse result was parsed on, since the reference dates of recurring moments depend on it
+const parseDays = new WeakMap<Todos, number>()
+
+export function parseMomentsString(content: string, config: ParseConfig, token?: CancellationToken): Todos {
+    return parseMomentsLines(StringLineIterator(content), config, token)
 }
 
 export function parseMoments(lines: Iterator<string>, config: ParseConfig): Todos {
     return parseMomentsLines(new LineIteratorImpl(lines), config)
 }
 
-export function parseMomentsLines(lineIter: LineIterator, config: ParseConfig): Todos {
+export function parseMomentsLines(lineIter: LineIterator, config: ParseConfig, token?: CancellationToken): Todos {
+    return runSteps(parseSteps(lineIter, config), token)
+}
+
+/**
+ * parses the content like parseMomentsString, or like parseMomentsIncremental if the previous parse of the
+ * document is given. Gives the event loop a turn every sliceMillis, so the token can be cancelled meanwhile,
+ * e.g. by a newer version of the document. Rejects with a CancelledError once it is.
+ */
+export function parseMomentsCancellable(
+    content: string, config: ParseConfig, token: CancellationToken, prev?: { todos: Todos, content: string }, sliceMillis = DEFAULT_SLICE_MILLIS
+): Promise<Todos> {
+    const steps = prev
+        ? incrementalSteps(prev.todos, prev.content, diffEdits(prev.content, content), config)
+        : parseSteps(StringLineIterator(content), config)
+    return runStepsInSlices(steps, token, sliceMillis)
+}
+
+/**
+ * parses the lines, pausing after every top-level block.
+ */
+function* parseSteps(lineIter: LineIterator, config: ParseConfig): Generator<void, Todos> {
     const state: ParseState = { config, lineIter, todos: createTodos() }
     for (const line of each(state.lineIter)) {
         parseLine(line, state)
+        yield
+    }
+    parseDays.set(state.todos, parseDay(config))
+    return state.todos
+}
+
+function runSteps<T>(steps: Generator<void, T>, token?: CancellationToken): T {
+    for (let step = steps.next(); ; step = steps.next()) {
+        if (step.done) {
+            return step.value
+        }
+        throwIfCancelled(token)
+    }
+}
+
+async function runStepsInSlices<T>(steps: Generator<void, T>, token: CancellationToken, sliceMillis: number): Promise<T> {
+    let sliceEnd = Date.now() + sliceMillis
+    for (let step = steps.next(); ; step = steps.next()) {
+        if (step.done) {
+            return step.value
+        }
+        if (Date.now() >= sliceEnd) {
+            await new Promise(resolve => setImmediate(resolve))
+            sliceEnd = Date.now() + sliceMillis
+        }
+        throwIfCancelled(token)
+    }
+}
+
+/**
+ * parses the content into a CompactTodos. Moments are converted block by block, so only the moments of one
+ * top-level block exist as objects at a time.
+ */
+export function parseMomentsCompact(content: string, config: ParseConfig): CompactTodos {
+    const state: ParseState = { config, lineIter: StringLineIterator(content), todos: createTodos() }
+    const builder = new CompactTodosBuilder(content, state.todos.categories)
+    for (const line of each(state.lineIter)) {
+        parseLine(line, state)
+        state.todos.moments.forEach(mom => builder.addMoment(mom))
+        state.todos.moments.length = 0
     }
+    return builder.build()
+}
+
+/**
+ * parses a stream of chunks, e.g. a fs.ReadStream, without loading the whole content into memory.
+ * Chunks are read until the next top-level block is complete, which is then parsed like in parseMoments.
+ */
+export async function parseMomentsAsync(chunks: AsyncIterable<Buffer | string>, config: ParseConfig): Promise<Todos> {
+    const lines = new ChunkedLines(chunks)
+    const state: ParseState = { config, lineIter: new LineIteratorImpl(lines), todos: createTodos() }
+
+    while (true) {
+        await lines.fill(1)
+        const line = nextLine(state.lineIter)
+        if (line === null) {
+            break
+        }
+
+        if (isCategoryDelimiter(line, config)) {
+            // Category name and closing delimiter
+            await lines.fill(2)
+        }
+        else if (line.content.startsWith(config.leftStateBracket)) {
+            // Until the first line that isn't part of the moment anymore, see parseCommentsAndSubMoments
+            await lines.fillUntil(l => {
+                const content = l.trimEnd()
+                return !isBlank(content) && countIndent(content, config.tabSize, config.tabSize)[0] < config.tabSize
+            })
+        }
+        parseLine(line, state)
+    }
+
+    parseDays.set(state.todos, parseDay(config))
     return state.todos
 }
 
+/**
+ * parses the content resulting from applying the edits to prevContent, reusing the parse result
+ * prevTodos of prevContent. Only the top-level blocks overlapping the edits are parsed again,
+ * the categories and moments after them are taken over from prevTodos with shifted doc positions.
+ * The edits are relative to prevContent, like the ones returned by cleanDoneMoments.
+ * If prevTodos were parsed on another day, everything is parsed again.
+ */
+export function parseMomentsIncremental(prevTodos: Todos, prevContent: string, edits: Edit[], config: ParseConfig, token?: CancellationToken): Todos {
+    return runSteps(incrementalSteps(prevTodos, prevContent, edits, config), token)
+}
+
+function* incrementalSteps(prevTodos: Todos, prevContent: string, edits: Edit[], config: ParseConfig): Generator<void, Todos> {
+    if (parseDays.get(prevTodos) !== parseDay(config)) {
+        // The reference dates of the reused recurring moments would be outdated
+        return yield* parseSteps(StringLineIterator(applyEdits(prevContent, edits)), config)
+    }
+    if (!edits.length) {
+        return prevTodos
+    }
+
+    const content = applyEdits(prevContent, edits)
+    const offsetDelta = content.length - prevContent.length
+    const [editStart, editEnd] = editedRange(edits, prevContent.length)
+    const blocks = topLevelBlocks(prevTodos, prevContent)
+
+    // Restart at the last block starting on a line before the edits. Blocks starting on the same line
+    // could have been changed by the edits, and blocks after could have become part of an earlier block.
+    const editLineStart = prevContent.lastIndexOf('\n', editStart - 1) + 1
+    let restartIndex = blocks.length - 1
+    while (restartIndex >= 0 && blocks[restartIndex].offset >= editLineStart) {
+        restartIndex--
+    }
+    const restart = restartIndex >= 0 ? blocks[restartIndex] : { offset: 0, lineNum: 0, categoryCount: 0, momentCount: 0 }
+
+    const todos: Todos = {
+        categories: prevTodos.categories.slice(0, restart.categoryCount),
+        moments: prevTodos.moments.slice(0, restart.momentCount)
+    }
+    const lineIter = new LineIteratorImpl(splitLikeFile(content, restart.offset), restart.lineNum, restart.offset)
+    const state: ParseState = { config, lineIter, todos }
+
+    // Once we reach the start of a previous block after the edits, the rest of the document parses the same as before
+    const resyncOffset = editEnd + offsetDelta
+    const blocksByOffset = new Map(blocks.slice(restartIndex + 1).map(b => [b.offset, b] as [number, TopLevelBlock]))
+    for (const line of each(state.lineIter)) {
+        const block = line.offset >= resyncOffset ? blocksByOffset.get(line.offset - offsetDelta) : undefined
+        if (block) {
+            appendShiftedBlocks(state.todos, prevTodos, block, line.lineNum - block.lineNum, offsetDelta)
+            break
+        }
+        parseLine(line, state)
+        yield
+    }
+
+    parseDays.set(state.todos, parseDay(config))
+    return state.todos
+}
+
+function parseDay(config: ParseConfig): number {
+    return startOfDay(getNow(config)).getTime()
+}
+
+function editedRange(edits: Edit[], contentLength: number): [number, number] {
+    let start = Infinity
+    let end = -Infinity
+    edits.forEach(e => {
+        if (e.type === EditType.INSERT) {
+            const offset = (e as InsertEdit).offset === EOF_OFFSET ? contentLength : (e as InsertEdit).offset
+            start = Math.min(start, offset)
+            end = Math.max(end, offset)
+        }
+        else {
+            start = Math.min(start, (e as DeleteEdit).startOffset)
+            end = Math.max(end, (e as DeleteEdit).endOffset)
+        }
+    })
+    return [start, end]
+}
+
+function topLevelBlocks(todos: Todos, content: string): TopLevelBlock[] {
+    const blocks: TopLevelBlock[] = []
+    let c = 0
+    let m = 0
+    while (c < todos.categories.length || m < todos.moments.length) {
+        // A category block starts with the delimiter line before the category name
+        const catOffset = c < todos.categories.length ? content.lastIndexOf('\n', todos.categories[c].docPos.offset - 2) + 1 : Infinity
+        if (m >= todos.moments.length || catOffset < todos.moments[m].docPos.offset) {
+            blocks.push({ offset: catOffset, lineNum: todos.categories[c].docPos.lineNum - 1, categoryCount: c, momentCount: m })
+            c++
+        }
+        else {
+            blocks.push({ offset: todos.moments[m].docPos.offset, lineNum: todos.moments[m].docPos.lineNum, categoryCount: c, momentCount: m })
+            m++
+        }
+    }
+    return blocks
+}
+
+function appendShiftedBlocks(todos: Todos, prevTodos: Todos, from: TopLevelBlock, lineDelta: number, offsetDelta: number) {
+    const shift = (pos: DocPosition): DocPosition => ({
+        // The time of day of recurring moments has no line number
+        lineNum: pos.lineNum < 0 ? pos.lineNum : pos.lineNum + lineDelta,
+        offset: pos.offset + offsetDelta,
+        length: pos.length
+    })
+
+    // Moments before the first shifted category belong to whatever category now precedes them
+    const precedingCategory = todos.categories[todos.categories.length - 1]
+    const shiftedCategories = new Map<Category | null, Category>()
+    prevTodos.categories.slice(from.categoryCount).forEach(cat => {
+        const shifted = { ...cat, docPos: shift(cat.docPos) }
+        shiftedCategories.set(cat, shifted)
+        todos.categories.push(shifted)
+    })
+
+    prevTodos.moments.slice(from.momentCount).forEach(mom => {
+        todos.moments.push(shiftMoment(mom, shift, shiftedCategories.get(mom.category) ?? precedingCategory))
+    })
+}
+
+function shiftMoment(mom: Moment, shift: (pos: DocPosition) => DocPosition, category: Category | null): Moment {
+    const shifted: Moment = {
+        ...mom,
+        timeOfDay: shiftDateTime(mom.timeOfDay, shift),
+        docPos: shift(mom.docPos),
+        comments: mom.comments.map(com => ({ ...com, docPos: shift(com.docPos) })),
+        subMoments: mom.subMoments.map(sub => shiftMoment(sub, shift, category)),
+        category
+    }
+
+    if (isSingleMoment(mom)) {
+        const singleMom = shifted as SingleMoment
+        singleMom.start = shiftDateTime(singleMom.start, shift)
+        singleMom.end = shiftDateTime(singleMom.end, shift)
+    }
+    else if (isRecurringMoment(mom)) {
+        const recurMom = shifted as RecurringMoment
+        recurMom.recurrence = {
+            ...recurMom.recurrence,
+            refDate: shiftDateTime(recurMom.recurrence.refDate, shift)!
+        }
+    }
+
+    return shifted
+}
+
+function shiftDateTime(date: MomentDateTime | null, shift: (pos: DocPosition) => DocPosition): MomentDateTime | null {
+    return date ? { ...date, docPos: shift(date.docPos) } : date
+}
+
 function nextLine(lineIter: LineIterator): Line | null {
     const { value, done } = lineIter.next()
     return done ? null : value
@@ -547,24 +810,6 @@ function parseSubLine(mom: Moment, line: Line, lineContent: string, indent: numb
         })
 }
 
-function parseDate(content: string, config: ParseConfig): Date | null {
-    const stripped = content.trim()
-    for (const fmt of config.dateFormats) {
-        const dt = parse(stripped, fmt, new Date())
-        if (isValid(dt)) {
-            return dt
-        }
-    }
-
-    return null
-}
-
-function parseTime(content: string, config: ParseConfig): Date | null {
-    const stripped = content.trim()
-    const dt = parse(stripped, config.timeFormat, new Date())
-    return isValid(dt) ? dt : null
-}
-
 /**
  * counts the whitespace indent at the start of the string up to maxIndent.
  * Spaces count as 1, Tabs count as tabSize indentation.
@@ -1,87 +1,133 @@
-import { addDays, compareAsc, endOfDay, endOfWeek, format, startOfDay, startOfWeek } from 'date-fns'
-import { generateInstances } from './instantiate'
-import { Instance, Preview, PreviewCategory, PreviewOverview, Todos, WorkState, PreviewInstance, CalendarEntry } from './models'
+import { addDays, compareAsc, endOfDay, endOfWeek, format, isAfter, isBefore, startOfDay, startOfWeek } from 'date-fns'
+import { generateInstancesOfMoment } from './instantiate'
+import { getMomentIndex } from './MomentIndex'
+import { Instance, Moment, Preview, PreviewOverview, Todos, WorkState, PreviewInstance, CalendarEntry } from './models'
 
 export function previewMoments(todos: Todos, fixedTime?: Date | null): Preview {
     const now = fixedTime || new Date()
-    const [today, week] = compileReminders(todos, now)
-
-    return {
-        overview: compileTopLevelMoments(todos),
-        today,
-        week,
-        calendar: toCalendarEntries(week)
-    }
-}
-
-function compileTopLevelMoments(todos: Todos) {
     const overview: PreviewOverview = { categories: [] }
-    let category: PreviewCategory | undefined
+    const today = new ReminderList()
+    const week = new ReminderList()
+
+    // Today is within the week, so today's instances are the week's instances narrowed to today
+    const weekStart = startOfWeek(now, { weekStartsOn: 1 })
+    const weekEnd = endOfWeek(now, { weekStartsOn: 1 })
+    const todayStart = startOfDay(now)
+    const todayEnd = endOfDay(now)
     todos.moments
+        .filter(m => m.workState !== WorkState.DONE)
+        .forEach(m => addToOverview(overview, m))
+
+    // Only the moments the index finds in the week can have reminders
+    getMomentIndex(todos).overlapping(weekStart, weekEnd)
         .filter(m => m.workState !== WorkState.DONE)
         .forEach(m => {
-            const catName = m.category?.name || '_none'
-            if (!category || catName !== category.name) {
-                category = { name: catName, moments: [] }
-                overview.categories.push(category)
-            }
-            category.moments.push({
-                name: m.name,
-                workState: m.workState,
-                docPos: m.docPos
+            generateInstancesOfMoment(m, weekStart, weekEnd, { predicate: inst => !inst.done }).forEach(inst => {
+                week.add(inst, inst)
+                const todayRange = narrow(inst, todayStart, todayEnd)
+                if (todayRange) {
+                    today.add(inst, todayRange)
+                }
             })
         })
-    return overview
-}
 
-function compileReminders(todos: Todos, now: Date) {
-    const today = compileMomentsEndingInRange(todos, startOfDay(now), endOfDay(now))
-    const week = compileMomentsEndingInRange(todos, startOfWeek(now, { weekStartsOn: 1 }), endOfWeek(now, { weekStartsOn: 1 }))
-    return [
-        flattenReminders(today),
-        flattenReminders(week)
-    ]
+    const weekReminders = week.toSortedList()
+    return {
+        overview,
+        today: today.toSortedList(),
+        week: weekReminders,
+        calendar: toCalendarEntries(weekReminders)
+    }
 }
 
-function compileMomentsEndingInRange(todos: Todos, start: Date, end: Date): Instance[] {
-    const instances = filterMomentsEndingInRange(
-        generateInstances(todos.moments, start, end, { predicate: inst => !inst.done })
-    )
+function addToOverview(overview: PreviewOverview, m: Moment) {
+    const catName = m.category?.name || '_none'
+    let category = overview.categories[overview.categories.length - 1]
+    if (!category || catName !== category.name) {
+        category = { name: catName, moments: [] }
+        overview.categories.push(category)
+    }
+    category.moments.push({
+        name: m.name,
+        workState: m.workState,
+        docPos: m.docPos
+    })
+}
 
-    instances.sort((a, b) => compareAsc(a.start, b.start))
-    return instances
+interface InstanceRange {
+    start: Date
+    end: Date
+    endsInRange: boolean
 }
 
-function filterMomentsEndingInRange(instances: Instance[]): Instance[] {
-    const res: Instance[] = []
-    instances.forEach(inst => {
-        const subsEndingInRange = filterMomentsEndingInRange(inst.subInstances)
-        if (subsEndingInRange.length || inst.endsInRange) {
-            res.push({
-                ...inst,
-                subInstances: subsEndingInRange
-            })
+/**
+ * collects the reminders of top-level instances: the instances and sub instances ending in range,
+ * ordered by the start of their top-level instance.
+ */
+class ReminderList {
+    private groups: { start: Date, reminders: PreviewInstance[] }[] = []
+
+    add(inst: Instance, range: InstanceRange) {
+        const reminders: PreviewInstance[] = []
+        flattenReminders(inst, range, '', reminders)
+        if (reminders.length) {
+            this.groups.push({ start: range.start, reminders })
         }
-    })
+    }
 
-    return res
+    toSortedList(): PreviewInstance[] {
+        this.groups.sort((a, b) => compareAsc(a.start, b.start))
+        return this.groups.flatMap(g => g.reminders)
+    }
 }
 
-function flattenReminders(instances: Instance[], parentPath = ''): PreviewInstance[] {
-    return instances.flatMap(inst => {
-        const flattened: PreviewInstance[] = []
+/**
+ * adds the instance and its sub instances that end in range to reminders, each named by its path.
+ * The instance is taken as if it had been generated for the given range.
+ */
+function flattenReminders(inst: Instance, range: InstanceRange, parentPath: string, reminders: PreviewInstance[]) {
+    if (range.endsInRange) {
+        reminders.push({
+            name: parentPath + inst.name,
+            start: range.start,
+            end: range.end,
+            timeOfDay: inst.timeOfDay,
+            priority: inst.priority,
+            category: inst.category,
+            done: inst.done,
+            workState: inst.workState,
+            endsInRange: range.endsInRange,
+            originDocPos: inst.originDocPos
+        })
+    }
 
-        if (inst.endsInRange) {
-            // eslint-disable-next-line @typescript-eslint/no-unused-vars
-            const { subInstances, ...previewInst } = { ...inst }
-            previewInst.name = parentPath + inst.name
-            flattened.push(previewInst)
+    // Sub instances are generated for the range of their parent
+    const subEnd = endOfDay(range.end)
+    inst.subInstances.forEach(sub => {
+        const subRange = narrow(sub, range.start, subEnd)
+        if (subRange) {
+            flattenReminders(sub, subRange, `${parentPath}${inst.name}/`, reminders)
         }
-
-        return flattened.concat(flattenReminders(inst.subInstances, `${parentPath}${inst.name}/`))
     })
 }
 
+/**
+ * returns the range of the instance if it had been generated between start and end, a part of the range
+ * it was generated for, or undefined if it wouldn't have been generated. Since moment dates are whole days,
+ * this is the intersection with the range.
+ */
+function narrow(inst: InstanceRange, start: Date, end: Date): InstanceRange | undefined {
+    if (isBefore(inst.end, start) || isBefore(end, inst.start)) {
+        return undefined
+    }
+
+    return {
+        start: isAfter(start, inst.start) ? start : inst.start,
+        end: isBefore(end, inst.end) ? end : inst.end,
+        endsInRange: inst.endsInRange && !isAfter(inst.end, end)
+    }
+}
+
 function toCalendarEntries(instances: PreviewInstance[]): CalendarEntry[] {
     const sortedInstances = [...instances]
     sortedInstances.sort((a, b) => priority(b) - priority(a))
@@ -0,0 +1,147 @@
+import { CalendarEntry, Preview, PreviewInstance, PreviewMoment, WorkState } from './models'
+
+/**
+ * a reminder as shown in the preview.
+ */
+export interface ReminderEntry {
+    name: string
+    end: string
+    line: number
+}
+
+/**
+ * a moment of the overview as shown in the preview.
+ */
+export interface OverviewEntry {
+    name: string
+    workState: WorkState
+    line: number
+}
+
+/**
+ * the changes of a list whose entries are identified by keys.
+ */
+export interface ListPatch<T> {
+    // The keys of all entries in order, only set if entries were added, removed or reordered
+    order?: string[]
+    // The entries that were added or changed, by key
+    changed: Record<string, T>
+}
+
+export interface LanePatch {
+    name: string
+    moments: ListPatch<OverviewEntry>
+}
+
+/**
+ * the changes between two previews.
+ */
+export interface PreviewPatch {
+    today: ListPatch<ReminderEntry>
+    week: ListPatch<ReminderEntry>
+    overview: ListPatch<LanePatch>
+    calendar: ListPatch<CalendarEntry>
+}
+
+interface KeyedList<T> {
+    keys: string[]
+    values: Map<string, T>
+}
+
+interface Lane {
+    name: string
+    moments: KeyedList<OverviewEntry>
+}
+
+/**
+ * the parts of a preview that are shown, by key. Only the line of a moment's position is shown,
+ * so typing on a line doesn't change the moments after it.
+ */
+export interface PreviewSnapshot {
+    today: KeyedList<ReminderEntry>
+    week: KeyedList<ReminderEntry>
+    overview: KeyedList<Lane>
+    calendar: KeyedList<CalendarEntry>
+}
+
+export function snapshotPreview(preview: Preview): PreviewSnapshot {
+    return {
+        today: keyedList(preview.today.map(toReminderEntry), r => `${r.name}\n${r.end}`),
+        week: keyedList(preview.week.map(toReminderEntry), r => `${r.name}\n${r.end}`),
+        overview: keyedList(
+            preview.overview.categories.map(c => ({ name: c.name, moments: keyedList(c.moments.map(toOverviewEntry), m => m.name) })),
+            lane => lane.name
+        ),
+        calendar: keyedList(preview.calendar, e => `${e.title}\n${e.start}`)
+    }
+}
+
+/**
+ * returns the changes from the prev to the next snapshot. Without prev, all entries of next are added.
+ */
+export function diffPreview(prev: PreviewSnapshot | undefined, next: PreviewSnapshot): PreviewPatch {
+    return {
+        today: diffList(prev?.today, next.today, diffEntry),
+        week: diffList(prev?.week, next.week, diffEntry),
+        overview: diffList(prev?.overview, next.overview, diffLane),
+        calendar: diffList(prev?.calendar, next.calendar, diffEntry)
+    }
+}
+
+export function isEmptyPatch(patch: PreviewPatch): boolean {
+    return [patch.today, patch.week, patch.overview, patch.calendar].every(isEmptyListPatch)
+}
+
+function toReminderEntry(inst: PreviewInstance): ReminderEntry {
+    return { name: inst.name, end: inst.end.toISOString(), line: inst.originDocPos.lineNum }
+}
+
+function toOverviewEntry(mom: PreviewMoment): OverviewEntry {
+    return { name: mom.name, workState: mom.workState, line: mom.docPos.lineNum }
+}
+
+/**
+ * keys the entries by keyOf, numbering repeated keys in order.
+ */
+function keyedList<T>(entries: T[], keyOf: (entry: T) => string): KeyedList<T> {
+    const keys: string[] = []
+    const values = new Map<string, T>()
+    entries.forEach(entry => {
+        const key = keyOf(entry)
+        let uniqueKey = key
+        for (let n = 2; values.has(uniqueKey); n++) {
+            uniqueKey = `${key}\n${n}`
+        }
+        keys.push(uniqueKey)
+        values.set(uniqueKey, entry)
+    })
+    return { keys, values }
+}
+
+function diffList<T, P>(prev: KeyedList<T> | undefined, next: KeyedList<T>, diff: (prev: T | undefined, next: T) => P | undefined): ListPatch<P> {
+    const patch: ListPatch<P> = { changed: {} }
+    if (!prev || prev.keys.length !== next.keys.length || prev.keys.some((k, i) => k !== next.keys[i])) {
+        patch.order = next.keys
+    }
+    next.values.forEach((value, key) => {
+        const change = diff(prev?.values.get(key), value)
+        if (change !== undefined) {
+            patch.changed[key] = change
+        }
+    })
+    return patch
+}
+
+function diffEntry<T extends object>(prev: T | undefined, next: T): T | undefined {
+    const changed = !prev || (Object.keys(next) as (keyof T)[]).some(k => prev[k] !== next[k])
+    return changed ? next : undefined
+}
+
+function diffLane(prev: Lane | undefined, next: Lane): LanePatch | undefined {
+    const moments = diffList(prev?.moments, next.moments, diffEntry)
+    return !prev || !isEmptyListPatch(moments) ? { name: next.name, moments } : undefined
+}
+
+function isEmptyListPatch<T>(patch: ListPatch<T>): boolean {
+    return !patch.order && !Object.keys(patch.changed).length
+}
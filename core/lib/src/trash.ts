@@ -0,0 +1,24 @@
+import * as fs from 'fs'
+import { Edit, EditType, EOF_OFFSET, InsertEdit } from './models'
+
+/**
+ * appends the content of the trash edits returned by trashDoneMoments to the trash file, creating it if needed.
+ * Since they only ever insert at the end, the trash file is never read and the cost doesn't grow with its size.
+ */
+export async function appendTrash(trashFile: string, trashEdits: Edit[]): Promise<void> {
+    const content = trashEdits.map(e => {
+        if (e.type !== EditType.INSERT || (e as InsertEdit).offset !== EOF_OFFSET) {
+            throw Error('Can only append insert edits with EOF_OFFSET to trash file')
+        }
+        return (e as InsertEdit).content
+    }).join('')
+
+    const handle = await fs.promises.open(trashFile, 'a')
+    try {
+        await handle.writeFile(content)
+        await handle.sync()
+    }
+    finally {
+        await handle.close()
+    }
+}
@@ -1,5 +1,5 @@
 import { getUnixTime, minutesToHours } from 'date-fns'
-import { Moment } from './models'
+import { DeleteEdit, Edit, EditType, EOF_OFFSET, InsertEdit, Moment } from './models'
 
 /**
  * returns the number of weeks passed since January 1, 1970 UTC.
@@ -51,3 +51,180 @@ export function listFromIterator<T>(iter: Iterator<T>): T[] {
     }
     return res
 }
+
+/**
+ * returns the edits turning prevContent into content, replacing everything between their
+ * common prefix and suffix.
+ */
+export function diffEdits(prevContent: string, content: string): Edit[] {
+    const maxCommon = Math.min(prevContent.length, content.length)
+    let prefix = 0
+    while (prefix < maxCommon && prevContent[prefix] === content[prefix]) {
+        prefix++
+    }
+    let suffix = 0
+    while (suffix < maxCommon - prefix && prevContent[prevContent.length - 1 - suffix] === content[content.length - 1 - suffix]) {
+        suffix++
+    }
+
+    const edits: Edit[] = []
+    if (prefix + suffix < prevContent.length) {
+        edits.push({ type: EditType.DELETE, startOffset: prefix, endOffset: prevContent.length - suffix } as DeleteEdit)
+    }
+    if (prefix + suffix < content.length) {
+        edits.push({ type: EditType.INSERT, offset: prefix, content: content.slice(prefix, content.length - suffix) } as InsertEdit)
+    }
+    return edits
+}
+
+/**
+ * returns the content resulting from applying the edits, whose offsets are all relative to content.
+ * Inserts at the same offset are added in the order of the edits, inserts within a deleted range are kept.
+ * Throws if an edit is outside of the content or deletes overlap.
+ */
+export function applyEdits(content: string, edits: Edit[]): string {
+    const inserts = (edits.filter(e => e.type === EditType.INSERT) as InsertEdit[])
+        .map(e => ({ offset: e.offset === EOF_OFFSET ? content.length : e.offset, content: e.content }))
+        .sort((a, b) => a.offset - b.offset)
+    const deletes = (edits.filter(e => e.type === EditType.DELETE) as DeleteEdit[])
+        .sort((a, b) => a.startOffset - b.startOffset)
+    validateEdits(content, inserts, deletes)
+
+    const parts: string[] = []
+    let pos = 0
+    let i = 0
+    // Copies the content up to end, or skips it if it's deleted, adding the inserts on the way
+    const advance = (end: number, keep: boolean) => {
+        for (; i < inserts.length && inserts[i].offset <= end; i++) {
+            if (keep) {
+                parts.push(content.slice(pos, inserts[i].offset))
+            }
+            pos = inserts[i].offset
+            parts.push(inserts[i].content)
+        }
+        if (keep) {
+            parts.push(content.slice(pos, end))
+        }
+        pos = end
+    }
+
+    // Empty deletes could be within other deletes and change nothing
+    deletes.filter(del => del.startOffset < del.endOffset).forEach(del => {
+        advance(del.startOffset, true)
+        advance(del.endOffset, false)
+    })
+    advance(content.length, true)
+
+    return parts.join('')
+}
+
+function validateEdits(content: string, inserts: { offset: number }[], deletes: DeleteEdit[]) {
+    const inContent = (offset: number) => Number.isInteger(offset) && offset >= 0 && offset <= content.length
+    inserts.forEach(ins => {
+        if (!inContent(ins.offset)) {
+            throw Error(`Insert at ${ins.offset} is outside of the content of length ${content.length}`)
+        }
+    })
+    let prev: DeleteEdit | undefined
+    deletes.forEach(del => {
+        if (!inContent(del.startOffset) || !inContent(del.endOffset) || del.startOffset > del.endOffset) {
+            throw Error(`Delete of ${del.startOffset}-${del.endOffset} is outside of the content of length ${content.length}`)
+        }
+        if (del.startOffset === del.endOffset) {
+            return
+        }
+        if (prev && del.startOffset < prev.endOffset) {
+            throw Error(`Delete of ${del.startOffset}-${del.endOffset} overlaps delete of ${prev.startOffset}-${prev.endOffset}`)
+        }
+        prev = del
+    })
+}
+
+/**
+ * a Map that keeps at most maxSize entries, evicting the least recently used ones.
+ */
+export class LruCache<K, V> {
+    private entries: Map<K, V>
+    private maxSize: number
+
+    constructor(maxSize: number) {
+        this.entries = new Map()
+        this.maxSize = maxSize
+    }
+
+    get size(): number {
+        return this.entries.size
+    }
+
+    get(key: K): V | undefined {
+        const value = this.entries.get(key)
+        if (value !== undefined) {
+            // Move to the back as the most recently used entry
+            this.entries.delete(key)
+            this.entries.set(key, value)
+        }
+        return value
+    }
+
+    set(key: K, value: V) {
+        this.entries.delete(key)
+        this.entries.set(key, value)
+        if (this.entries.size > this.maxSize) {
+            this.entries.delete(this.entries.keys().next().value as K)
+        }
+    }
+
+    clear() {
+        this.entries.clear()
+    }
+}
+
+/**
+ * counts the non-whitespace characters before every position of a string, so checking whether a range
+ * contains only whitespace takes constant time.
+ */
+export class WhitespaceIndex {
+    private nonWhitespaceCounts: Uint32Array
+
+    constructor(content: string) {
+        this.nonWhitespaceCounts = new Uint32Array(content.length + 1)
+        let count = 0
+        for (let i = 0; i < content.length; i++) {
+            if (!isWhitespace(content.charCodeAt(i))) {
+                count++
+            }
+            this.nonWhitespaceCounts[i + 1] = count
+        }
+    }
+
+    /**
+     * returns the number of non-whitespace characters between start (inclusive) and end (exclusive).
+     */
+    nonWhitespaceBetween(start: number, end: number): number {
+        if (end <= start) {
+            return 0
+        }
+        if (start < 0 || end >= this.nonWhitespaceCounts.length) {
+            // Positions outside the content are never whitespace
+            return end - start
+        }
+
+        return this.nonWhitespaceCounts[end] - this.nonWhitespaceCounts[start]
+    }
+
+    onlyWhitespaceBetween(start: number, end: number): boolean {
+        return this.nonWhitespaceBetween(start, end) === 0
+    }
+}
+
+/**
+ * returns whether the character code is matched by \s in regular expressions.
+ */
+function isWhitespace(code: number): boolean {
+    if (code <= 0x20) {
+        return code === 0x20 || (code >= 0x09 && code <= 0x0d)
+    }
+
+    return code === 0xa0 || code === 0x1680 || (code >= 0x2000 && code <= 0x200a) || code === 0x2028 || code === 0x2029 ||
+        code === 0x202f || code === 0x205f || code === 0x3000 || code === 0xfeff
+}
@@ -0,0 +1,62 @@
+import { compactTodos } from '../src/CompactTodos'
+import { foldTodos, formatTodos, outlineTodos } from '../src/format'
+import { createParseConfig, ParseConfig, Todos } from '../src/models'
+import { parseMomentsCompact, parseMomentsString } from '../src/parse'
+import { previewMoments } from '../src/preview'
+import * as path from 'path'
+import * as fs from 'fs'
+
+const TEST_TODO = fs.readFileSync(path.join(__dirname, '../../../system_tests/testdata/test_todo.txt')).toString()
+const FIXED_TIME = new Date(2022, 4, 22)
+
+test('compact todos have the same moments', () => {
+  const config = testConfig()
+  const content = `\
+[] before any category (every 2nd monday 10:00)
+    comment
+
+    [x] sub !!
+        [] sub sub (1.2.22-3.2.22)
+------
+ cat [red] !
+------
+[p] foo (5.5.22 12:00)
+[] [] odd name
+`
+  for (const c of [content, TEST_TODO]) {
+    const todos = parseMomentsString(c, config)
+    const compact = parseMomentsCompact(c, config)
+
+    expect(toPlain(compact)).toEqual(toPlain(todos))
+    expect(toPlain(compactTodos(todos, c))).toEqual(toPlain(todos))
+  }
+})
+
+test('compact todos format and preview the same', () => {
+  const config = testConfig()
+  const todos = parseMomentsString(TEST_TODO, config)
+  const compact = parseMomentsCompact(TEST_TODO, config)
+
+  expect(formatTodos(compact, TEST_TODO, 'todo', FIXED_TIME)).toEqual(formatTodos(todos, TEST_TODO, 'todo', FIXED_TIME))
+  expect(foldTodos(compact)).toEqual(foldTodos(todos))
+  expect(outlineTodos(compact, TEST_TODO)).toEqual(outlineTodos(todos, TEST_TODO))
+  expect(toPlain(previewMoments(compact, FIXED_TIME))).toEqual(toPlain(previewMoments(todos, FIXED_TIME)))
+})
+
+test('compact todos return the same moment objects', () => {
+  const compact = parseMomentsCompact(TEST_TODO, testConfig())
+  const withSubs = compact.moments.find(m => m.subMoments.length > 0)!
+
+  expect(compact.moments).toBe(compact.moments)
+  expect(withSubs.subMoments[0]).toBe(withSubs.subMoments[0])
+})
+
+function toPlain(value: Todos | object) {
+  return JSON.parse(JSON.stringify(value))
+}
+
+function testConfig(): ParseConfig {
+  const config = createParseConfig()
+  config.fixedTime = FIXED_TIME
+  return config
+}
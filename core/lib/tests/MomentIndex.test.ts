@@ -0,0 +1,48 @@
+import { addDays } from 'date-fns'
+import { generateInstances } from '../src/instantiate'
+import { createParseConfig } from '../src/models'
+import { getMomentIndex, MomentIndex } from '../src/MomentIndex'
+import { parseMomentsString } from '../src/parse'
+import * as path from 'path'
+import * as fs from 'fs'
+
+const TEST_TODO = fs.readFileSync(path.join(__dirname, '../../../system_tests/testdata/test_todo.txt')).toString()
+
+test('generates same instances with index', () => {
+  const todos = parseTestTodos(TEST_TODO)
+  const index = new MomentIndex(todos.moments)
+  for (let start = new Date(2021, 11, 1); start < new Date(2022, 9, 1); start = addDays(start, 5)) {
+    for (const days of [0, 1, 6, 30, 400]) {
+      const end = addDays(start, days)
+      expect(generateInstances(index, start, end)).toStrictEqual(generateInstances(todos.moments, start, end))
+    }
+  }
+})
+
+test('finds overlapping moments in original order', () => {
+  const todos = parseTestTodos(`\
+[] undated
+[] late (10.1.22)
+[] early (1.1.22)
+[] recurring (every monday)
+[] open end (5.1.22-)
+[] open start (-3.1.22)
+[] long (1.12.21-31.1.22)
+[] past (1.6.21-2.6.21)
+`)
+  const index = getMomentIndex(todos)
+
+  expect(index.overlapping(new Date(2022, 0, 4), new Date(2022, 0, 6)).map(m => m.name))
+    .toEqual(['undated', 'recurring', 'open end', 'long'])
+  expect(index.overlapping(new Date(2022, 0, 1), new Date(2022, 0, 1, 23, 59)).map(m => m.name))
+    .toEqual(['undated', 'early', 'recurring', 'open start', 'long'])
+  expect(index.overlapping(new Date(2021, 0, 1), new Date(2021, 11, 31)).map(m => m.name))
+    .toEqual(['undated', 'recurring', 'open start', 'long', 'past'])
+  expect(getMomentIndex(todos)).toBe(index)
+})
+
+function parseTestTodos(content: string) {
+  const config = createParseConfig()
+  config.fixedTime = new Date(2022, 0, 1)
+  return parseMomentsString(content, config)
+}
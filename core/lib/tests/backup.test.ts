@@ -81,6 +81,64 @@ test('prunes backup', async () => {
   ])
 })
 
+test('skips backup of unchanged file', async () => {
+  // Given
+  const tmpDir = tmp.dirSync({ unsafeCleanup: true }).name
+  const file = path.join(tmpDir, 'todo.txt')
+  const backupDir = path.join(tmpDir, 'backups')
+  const now = new Date()
+
+  // When
+  await fs.promises.writeFile(file, DUMMY_CONTENT)
+  await backup(file, backupDir, 3, now)
+  await backup(file, backupDir, 3, addSeconds(now, 2))
+  const unchangedBackups = await listBackupsNewestFirst(backupDir)
+
+  await fs.promises.rm(unchangedBackups[0])
+  await backup(file, backupDir, 3, addSeconds(now, 4))
+
+  await fs.promises.writeFile(file, DUMMY_CONTENT + '2')
+  await backup(file, backupDir, 3, addSeconds(now, 6))
+
+  const backups = await listBackupsNewestFirst(backupDir)
+
+  // Then
+  expect(unchangedBackups).toHaveLength(1)
+  expect(backups).toHaveLength(2)
+  expect(load(backups[1])).toBe(DUMMY_CONTENT)
+  expect(load(backups[0])).toBe(DUMMY_CONTENT + '2')
+})
+
+test('prunes backups listed in manifest', async () => {
+  // Given
+  const tmpDir = tmp.dirSync({ unsafeCleanup: true }).name
+  const file = path.join(tmpDir, 'todo.txt')
+  const trashFile = path.join(tmpDir, 'todo-trash.txt')
+  const backupDir = path.join(tmpDir, 'backups')
+  const now = parse('2022-06-11_15-00-00', 'yyyy-MM-dd_HH-mm-ss', new Date())
+
+  // When
+  await fs.promises.writeFile(trashFile, DUMMY_CONTENT)
+  await backup(trashFile, backupDir, 2, now)
+  for (let i = 0; i < 5; i++) {
+    await fs.promises.writeFile(file, DUMMY_CONTENT + i)
+    await backup(file, backupDir, 2, addSeconds(now, i))
+  }
+
+  const backups = await listBackupsNewestFirst(backupDir)
+
+  // Then
+  expect(backups.map(b => path.basename(b))).toEqual([
+    'todo.2022-06-11_15-00-04.txt',
+    'todo.2022-06-11_15-00-03.txt',
+    'todo-trash.2022-06-11_15-00-00.txt'
+  ])
+  expect(JSON.parse(load(path.join(backupDir, '.todo.manifest.json'))).backups.map((b: { file: string }) => b.file)).toEqual([
+    'todo.2022-06-11_15-00-04.txt',
+    'todo.2022-06-11_15-00-03.txt'
+  ])
+})
+
 function load(file: string): string {
   return fs.readFileSync(file).toString()
 }
@@ -0,0 +1,83 @@
+import { isValid, parse } from 'date-fns'
+import { parseDate, parseTime } from '../src/dates'
+import { createParseConfig, ParseConfig } from '../src/models'
+
+const DAYS = ['0', '00', '1', '01', '9', '09', '10', '19', '28', '29', '30', '31', '32', '35', '99', '123']
+const MONTHS = ['0', '00', '1', '01', '2', '02', '09', '10', '12', '13', '19', '20']
+const YEARS = ['0', '00', '1', '19', '20', '22', '75', '76', '77', '99', '000', '022', '0000', '0022', '1900', '2000', '2022', '2024', '20222']
+
+test('parses dates like date-fns', () => {
+  const config = createParseConfig()
+  DAYS.forEach(d => MONTHS.forEach(m => YEARS.forEach(y => {
+    const content = `${d}.${m}.${y}`
+    expect(parseDate(content, config)).toEqual(parseWithDateFns(content, config.dateFormats))
+  })))
+})
+
+test('parses malformed dates like date-fns', () => {
+  const config = createParseConfig()
+  const contents = ['', '.', '1.2', '1.2.', '.1.22', '1..22', '1.2.22.', '1.2.22 ', ' 1.2.22', '1.2.22x', '1-2-22', 'a.b.cc', '１.2.22', '1.2.22-3.4.22']
+  contents.forEach(content => {
+    expect(parseDate(content, config)).toEqual(parseWithDateFns(content, config.dateFormats))
+  })
+})
+
+test('parses times like date-fns', () => {
+  const config = createParseConfig()
+  const parts = ['0', '00', '1', '05', '9', '12', '23', '24', '29', '59', '60', '99', '123', 'a']
+  parts.forEach(h => parts.forEach(m => {
+    const content = `${h}:${m}`
+    expect(parseTime(content, config)).toEqual(parseWithDateFns(content, [config.timeFormat]))
+  }))
+})
+
+test('parses custom formats', () => {
+  const config = createParseConfig()
+  config.dateFormats = ['yyyy-MM-dd', 'd/M/yy', "d 'of' M yyyy"]
+  config.timeFormat = 'H.mm'
+  const contents = ['2022-06-05', '2022-6-5', '22-06-05', '5/6/22', '05/06/2022', '5 of 6 2022', '5 6 2022']
+  contents.forEach(content => {
+    expect(parseDate(content, config)).toEqual(parseWithDateFns(content, config.dateFormats))
+  })
+  expect(parseTime('9.05', config)).toEqual(parseWithDateFns('9.05', [config.timeFormat]))
+})
+
+test('returns the same results from the cache', () => {
+  const config = createParseConfig()
+  const uncachedConfig: ParseConfig = { ...createParseConfig(), dateCacheSize: 0 }
+  const contents = ['1.2.22', '31.2.22', '29.2.24', '1.2.2022', 'foo']
+  for (let i = 0; i < 3; i++) {
+    contents.forEach(content => {
+      expect(parseDate(content, config)).toEqual(parseDate(content, uncachedConfig))
+    })
+    expect(parseTime('10:30', config)).toEqual(parseTime('10:30', uncachedConfig))
+  }
+})
+
+test('returns a copy of cached dates', () => {
+  const config = createParseConfig()
+  parseDate('1.2.22', config)?.setHours(10)
+  parseTime('10:30', config)?.setHours(12)
+
+  expect(parseDate('1.2.22', config)).toEqual(new Date(2022, 1, 1))
+  expect(parseTime('10:30', config)?.getHours()).toBe(10)
+  expect(parseDate('1.2.22', config)).not.toBe(parseDate('1.2.22', config))
+})
+
+test('uses the current formats of the config', () => {
+  const config = createParseConfig()
+  expect(parseDate('2022-06-05', config)).toBeNull()
+
+  config.dateFormats = ['yyyy-MM-dd']
+  expect(parseDate('2022-06-05', config)).toEqual(new Date(2022, 5, 5))
+})
+
+function parseWithDateFns(content: string, formats: string[]): Date | null {
+  for (const fmt of formats) {
+    const dt = parse(content.trim(), fmt, new Date())
+    if (isValid(dt)) {
+      return dt
+    }
+  }
+  return null
+}
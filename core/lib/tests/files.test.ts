@@ -0,0 +1,26 @@
+import { writeFileAtomic } from '../src/files'
+import * as tmp from 'tmp'
+import * as path from 'path'
+import * as fs from 'fs'
+
+test('writes file atomically', async () => {
+  // Given
+  const tmpDir = tmp.dirSync({ unsafeCleanup: true }).name
+  const file = path.join(tmpDir, 'todo.txt')
+  await fs.promises.writeFile(file, 'old')
+  await fs.promises.chmod(file, 0o600)
+
+  // When
+  await writeFileAtomic(file, 'updated')
+  await writeFileAtomic(path.join(tmpDir, 'new.txt'), 'new')
+
+  // Then
+  expect(load(file)).toBe('updated')
+  expect((await fs.promises.stat(file)).mode & 0o777).toBe(0o600)
+  expect(load(path.join(tmpDir, 'new.txt'))).toBe('new')
+  expect(await fs.promises.readdir(tmpDir)).toEqual(['new.txt', 'todo.txt'])
+})
+
+function load(file: string): string {
+  return fs.readFileSync(file).toString()
+}
@@ -0,0 +1,242 @@
+import { addDays, addYears, differenceInCalendarDays, getDay, getDaysInMonth, isAfter, setDay } from 'date-fns'
+import { countRecurring, generateInstances, generateInstancesOfMoment, iterateInstances } from '../src/instantiate'
+import { Instance, Recurrence, RecurrenceType, RecurringMoment, WorkState } from '../src/models'
+
+const WEEKLY_TYPES = [RecurrenceType.WEEKLY, RecurrenceType.BIWEEKLY, RecurrenceType.TRIWEEKLY, RecurrenceType.QUADRIWEEKLY]
+
+// Use a timezone with daylight saving time changes that aren't at midnight
+const originalTimezone = process.env.TZ
+beforeAll(() => {
+  process.env.TZ = 'Europe/Zurich'
+})
+afterAll(() => {
+  if (originalTimezone === undefined) {
+    delete process.env.TZ
+  }
+  else {
+    process.env.TZ = originalTimezone
+  }
+})
+
+test('generates daily and weekly occurrences like stepping through them', () => {
+  const refDates = daysBetween(new Date(2022, 0, 1), new Date(2022, 0, 28))
+  const starts = [
+    new Date(2022, 2, 20), // before the switch to summer time
+    new Date(2022, 9, 25, 10, 30), // before the switch to winter time
+    new Date(2022, 11, 29, 23, 59)
+  ]
+  for (const type of [RecurrenceType.DAILY, ...WEEKLY_TYPES]) {
+    for (const refDate of refDates) {
+      for (const start of starts) {
+        expectSameAsStepping({ recurrenceType: type, refDate: { dt: refDate } }, start, addDays(start, 70))
+      }
+    }
+  }
+})
+
+test('generates monthly occurrences like stepping through them', () => {
+  const refDates = daysBetween(new Date(2022, 0, 1), new Date(2022, 0, 31))
+  const starts = [new Date(2022, 0, 1), new Date(2022, 1, 28, 12), new Date(2024, 1, 29), new Date(2022, 9, 31)]
+  for (const refDate of refDates) {
+    for (const start of starts) {
+      expectSameAsStepping({ recurrenceType: RecurrenceType.MONTHLY, refDate: { dt: refDate } }, start, addDays(start, 800))
+    }
+  }
+})
+
+test('generates yearly occurrences like stepping through them', () => {
+  const refDates = daysBetween(new Date(2022, 0, 1), new Date(2022, 11, 31))
+  const starts = [new Date(2022, 0, 1), new Date(2022, 5, 15, 8), new Date(2023, 11, 31)]
+  for (const refDate of refDates) {
+    for (const start of starts) {
+      expectSameAsStepping({ recurrenceType: RecurrenceType.YEARLY, refDate: { dt: refDate } }, start, addYears(start, 5))
+    }
+  }
+})
+
+test('generates yearly occurrences on 29th of february', () => {
+  const recurrence = { recurrenceType: RecurrenceType.YEARLY, refDate: { dt: new Date(2024, 1, 29) } }
+  const instances = generateInstancesOfMoment(recurringMoment(recurrence), new Date(2023, 0, 1), new Date(2026, 11, 31))
+
+  expect(instances.map(i => i.start)).toEqual([
+    new Date(2023, 1, 28),
+    new Date(2024, 1, 29),
+    new Date(2025, 1, 28),
+    new Date(2026, 1, 28)
+  ])
+})
+
+test('generates occurrences across daylight saving time changes at midnight', () => {
+  // Sao Paulo skipped from 00:00 to 01:00 on 4.11.2018 and went back from 00:00 to 23:00 on 17.2.2019
+  inTimezone('America/Sao_Paulo', () => {
+    expect(new Date(2018, 10, 4).getHours()).toBe(1)
+
+    const refDates = daysBetween(new Date(2018, 9, 1), new Date(2018, 9, 31))
+    const starts = [new Date(2018, 9, 28), new Date(2018, 10, 3, 12), new Date(2019, 1, 10)]
+    for (const type of [RecurrenceType.DAILY, ...WEEKLY_TYPES, RecurrenceType.MONTHLY, RecurrenceType.YEARLY]) {
+      for (const refDate of refDates) {
+        for (const start of starts) {
+          expectSameAsStepping({ recurrenceType: type, refDate: { dt: refDate } }, start, addDays(start, 120))
+        }
+      }
+    }
+  })
+})
+
+test('keeps the n-weekly cadence across daylight saving time changes', () => {
+  // Midnight in London summer time is still the previous day in UTC
+  inTimezone('Europe/London', () => {
+    const biweekly = recurringMoment({ recurrenceType: RecurrenceType.BIWEEKLY, refDate: { dt: new Date(2022, 0, 6) } })
+    const mayStarts = (start: Date) => generateInstancesOfMoment(biweekly, start, new Date(2022, 4, 31))
+      .map(i => i.start)
+      .filter(d => d.getMonth() === 4)
+
+    expect(mayStarts(new Date(2022, 1, 1))).toEqual([new Date(2022, 4, 12), new Date(2022, 4, 26)])
+    expect(mayStarts(new Date(2022, 4, 1))).toEqual([new Date(2022, 4, 12), new Date(2022, 4, 26)])
+
+    const refDates = daysBetween(new Date(2022, 0, 1), new Date(2022, 0, 28))
+    const starts = [new Date(2022, 1, 1), new Date(2022, 2, 27), new Date(2022, 4, 1), new Date(2022, 9, 30)]
+    for (const type of WEEKLY_TYPES) {
+      for (const refDate of refDates) {
+        const end = new Date(2022, 11, 31)
+        const fromWinter = generateInstancesOfMoment(recurringMoment({ recurrenceType: type, refDate: { dt: refDate } }), starts[0], end)
+        for (const start of starts) {
+          expectSameAsStepping({ recurrenceType: type, refDate: { dt: refDate } }, start, end)
+          const fromStart = generateInstancesOfMoment(recurringMoment({ recurrenceType: type, refDate: { dt: refDate } }), start, end)
+          expect(fromStart.map(i => i.start)).toEqual(fromWinter.map(i => i.start).filter(d => !isAfter(start, d)))
+        }
+      }
+    }
+  })
+})
+
+test('counts occurrences over long ranges', () => {
+  const start = new Date(2022, 0, 1)
+  const end = new Date(2031, 11, 31)
+  const daily = { recurrenceType: RecurrenceType.DAILY, refDate: { dt: start } }
+  const biweekly = { recurrenceType: RecurrenceType.BIWEEKLY, refDate: { dt: new Date(2022, 0, 6) } }
+  const monthly = { recurrenceType: RecurrenceType.MONTHLY, refDate: { dt: new Date(2022, 0, 31) } }
+
+  expect(countRecurring(daily, start, end)).toBe(3652)
+  expect(countRecurring(biweekly, start, end)).toBe(261)
+  expect(countRecurring(monthly, start, end)).toBe(120)
+  expect(countRecurring(monthly, end, start)).toBe(0)
+})
+
+test('iterates the same instances as it generates', () => {
+  const daily = recurringMoment({ recurrenceType: RecurrenceType.DAILY, refDate: { dt: new Date(2022, 0, 1) } })
+  const monthly = recurringMoment({ recurrenceType: RecurrenceType.MONTHLY, refDate: { dt: new Date(2022, 0, 15) } })
+  monthly.subMoments = [daily]
+  const start = new Date(2022, 0, 1)
+  const end = new Date(2022, 11, 31)
+  const options = { predicate: (i: Instance) => i.start.getDate() % 2 === 1 }
+
+  expect([...iterateInstances([daily, monthly], start, end)]).toEqual(generateInstances([daily, monthly], start, end))
+  expect([...iterateInstances([daily, monthly], start, end, options)]).toEqual(generateInstances([daily, monthly], start, end, options))
+})
+
+test('iterates instances lazily', () => {
+  const daily = recurringMoment({ recurrenceType: RecurrenceType.DAILY, refDate: { dt: new Date(2022, 0, 1) } })
+  const instances = iterateInstances([daily], new Date(2022, 0, 1), new Date(99999, 0, 1))
+
+  expect(instances.next().value.start).toEqual(new Date(2022, 0, 1))
+  expect(instances.next().value.start).toEqual(new Date(2022, 0, 2))
+})
+
+function expectSameAsStepping(recurrence: Recurrence, start: Date, end: Date) {
+  const expected = [...generateRecurringByStepping(recurrence, start, end)]
+  const instances = generateInstancesOfMoment(recurringMoment(recurrence), start, end)
+
+  expect(instances.map(i => i.start)).toEqual(expected)
+  expect(countRecurring(recurrence, start, end)).toBe(expected.length)
+}
+
+function inTimezone(timezone: string, fn: () => void) {
+  const previous = process.env.TZ
+  process.env.TZ = timezone
+  try {
+    fn()
+  }
+  finally {
+    process.env.TZ = previous
+  }
+}
+
+function recurringMoment(recurrence: Recurrence): RecurringMoment {
+  return {
+    name: 'foo',
+    comments: [],
+    subMoments: [],
+    workState: WorkState.NEW,
+    priority: 0,
+    category: null,
+    timeOfDay: null,
+    docPos: { lineNum: 0, offset: 0, length: 0 },
+    recurrence
+  }
+}
+
+function daysBetween(start: Date, end: Date): Date[] {
+  const days = []
+  for (let day = start; !isAfter(day, end); day = addDays(day, 1)) {
+    days.push(day)
+  }
+  return days
+}
+
+// Reference implementation stepping from one occurrence to the next
+function* generateRecurringByStepping(recurrence: Recurrence, start: Date, end: Date): Generator<Date> {
+  const end2 = new Date(end)
+  end2.setHours(23, 59, 59, 999)
+  let cur = addDays(start, -1)
+  while (true) {
+    cur = nextRecurring(recurrence, cur)
+    if (recurrence.recurrenceType !== RecurrenceType.MONTHLY && recurrence.recurrenceType !== RecurrenceType.YEARLY) {
+      // Daily and weekly occurrences are at the time of day of the start, even after a day where it didn't exist
+      cur = new Date(cur.getFullYear(), cur.getMonth(), cur.getDate(), start.getHours(), start.getMinutes(), start.getSeconds(), start.getMilliseconds())
+    }
+    if (isAfter(cur, end2)) {
+      break
+    }
+    yield cur
+  }
+}
+
+function nextRecurring(recurrence: Recurrence, after: Date): Date {
+  const refDate = recurrence.refDate.dt
+  switch (recurrence.recurrenceType) {
+    case RecurrenceType.DAILY: return addDays(after, 1)
+    case RecurrenceType.WEEKLY: return nextNweekly(1, after, refDate)
+    case RecurrenceType.BIWEEKLY: return nextNweekly(2, after, refDate)
+    case RecurrenceType.TRIWEEKLY: return nextNweekly(3, after, refDate)
+    case RecurrenceType.QUADRIWEEKLY: return nextNweekly(4, after, refDate)
+    case RecurrenceType.MONTHLY: {
+      let date = new Date(after.getFullYear(), after.getMonth(), Math.min(refDate.getDate(), getDaysInMonth(after)))
+      if (!isAfter(date, after)) {
+        const month = new Date(date.getFullYear(), date.getMonth() + 1, 1)
+        date = new Date(month.getFullYear(), month.getMonth(), Math.min(refDate.getDate(), getDaysInMonth(month)))
+      }
+      return date
+    }
+    case RecurrenceType.YEARLY: {
+      const date = new Date(after.getFullYear(), refDate.getMonth(), refDate.getDate())
+      return isAfter(date, after) ? date : addYears(date, 1)
+    }
+    default: throw Error(`Unknown recurrence type ${recurrence.recurrenceType}`)
+  }
+}
+
+function nextNweekly(nth: number, after: Date, refDate: Date): Date {
+  let date = setDay(after, getDay(refDate))
+  if (!isAfter(date, after)) {
+    date = addDays(date, 7)
+  }
+
+  // Every nth calendar week from the reference date
+  const weeks = differenceInCalendarDays(date, refDate) / 7
+  const offset = ((weeks % nth) + nth) % nth
+  if (offset > 0) {
+    date = addDays(date, 7 * (nth - offset))
+  }
+  return date
+}
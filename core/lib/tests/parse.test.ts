@@ -0,0 +1,249 @@
+import { parseMomentsAsync, parseMomentsCancellable, parseMomentsIncremental, parseMomentsString } from '../src/parse'
+import { CancelledError } from '../src/cancellation'
+import { formatTodos } from '../src/format'
+import { createParseConfig, DeleteEdit, Edit, EditType, InsertEdit, ParseConfig, Todos } from '../src/models'
+import { diffEdits } from '../src/util'
+import * as path from 'path'
+import * as fs from 'fs'
+
+const TEST_TODO = fs.readFileSync(path.join(__dirname, '../../../system_tests/testdata/test_todo.txt')).toString().replace(/\r/g, '')
+
+test('incremental parse without edits returns previous result', () => {
+  const config = testConfig()
+  const todos = parseMomentsString(TEST_TODO, config)
+
+  expect(parseMomentsIncremental(todos, TEST_TODO, [], config)).toBe(todos)
+})
+
+test('incremental parse of edited moment', () => {
+  const content = `\
+[] foo
+    comment
+[] bar (1.2.22)
+[] baz (every monday 10:00)
+`
+  expectSameAsFullParse(content, [insert(content.indexOf('comment'), 'new ')])
+})
+
+test('incremental parse of moment becoming a sub moment', () => {
+  const content = `\
+[] foo
+    comment
+[] bar (1.2.22)
+    [] sub
+[] baz
+`
+  expectSameAsFullParse(content, [insert(content.indexOf('[] bar'), '    ')])
+})
+
+test('incremental parse of new category', () => {
+  const content = `\
+------
+ cat1
+------
+[] foo
+[] bar (1.2.22-3.2.22)
+------
+ cat2
+------
+[] baz
+`
+  expectSameAsFullParse(content, [insert(content.indexOf('[] bar'), '------\n new cat\n------\n')])
+})
+
+test('incremental parse of removed category', () => {
+  const content = `\
+------
+ cat1
+------
+[] foo
+------
+ cat2
+------
+[] bar
+------
+ cat3
+------
+[] baz
+`
+  const start = content.indexOf('------\n cat2')
+  expectSameAsFullParse(content, [del(start, content.indexOf('[] bar'))])
+})
+
+test('incremental parse of multiple edits', () => {
+  const content = TEST_TODO
+  expectSameAsFullParse(content, [
+    insert(100, 'foo'),
+    del(2000, 2010),
+    insert(2500, '\n[] bar\n'),
+    insert(-1, '\n[] at the end\n')
+  ])
+})
+
+test('incremental parse of deleting each line', () => {
+  const config = testConfig()
+  const todos = parseMomentsString(TEST_TODO, config)
+  lineOffsets(TEST_TODO).forEach(([start, end]) => {
+    expectIncrementalParse(todos, TEST_TODO, [del(start, end)], config)
+  })
+})
+
+test('incremental parse of indenting and unindenting each line', () => {
+  const config = testConfig()
+  const todos = parseMomentsString(TEST_TODO, config)
+  lineOffsets(TEST_TODO).forEach(([start]) => {
+    expectIncrementalParse(todos, TEST_TODO, [insert(start, '\t')], config)
+    if (TEST_TODO[start] === '\t') {
+      expectIncrementalParse(todos, TEST_TODO, [del(start, start + 1)], config)
+    }
+  })
+})
+
+test('incremental parse of typed text', () => {
+  const config = testConfig()
+  let content = TEST_TODO
+  let todos = parseMomentsString(content, config)
+  const typed = '[] new (3.4.22)\n\t[x] sub\n\tcomment\n\n------\n cat\n------\n'
+  for (let i = 0; i < typed.length; i++) {
+    const updated = content.slice(0, 1500) + typed.slice(0, i + 1) + content.slice(1500 + i)
+    todos = expectIncrementalParse(todos, content, diffEdits(content, updated), config)
+    content = updated
+  }
+})
+
+test('incremental parse on another day', () => {
+  const config = testConfig()
+  const content = TEST_TODO
+  const todos = parseMomentsString(content, config)
+  const updated = content.slice(0, 1500) + 'x' + content.slice(1500)
+
+  config.fixedTime = new Date(2023, 0, 2)
+  expect(parseMomentsIncremental(todos, content, [], config)).toStrictEqual(parseMomentsString(content, config))
+  expect(parseMomentsIncremental(todos, content, diffEdits(content, updated), config)).toStrictEqual(parseMomentsString(updated, config))
+})
+
+test('async parse of chunks', async () => {
+  const config = testConfig()
+  const content = TEST_TODO + '[] ünïcödé 🎉 (1.2.22)\n\t€ comment\n------\n catégorie\n------\n[] last'
+  const expected = parseMomentsString(content, config)
+  const bytes = Buffer.from(content)
+  for (const chunkSize of [1, 2, 3, 5, 64, 1000, bytes.length]) {
+    expect(await parseMomentsAsync(chunked(bytes, chunkSize), config)).toStrictEqual(expected)
+  }
+})
+
+test('async parse of string chunks', async () => {
+  const config = testConfig()
+  for (const content of ['', '\n', '[] foo', '[] foo\n', '[] foo\n\tbar\n\n', '------\n', '------\n cat\n------', '[] foo\n\t[] sub\n\t\tcomment\n[] bar\n']) {
+    async function* chunks() {
+      for (let i = 0; i < content.length; i += 2) {
+        yield content.slice(i, i + 2)
+      }
+    }
+    expect(await parseMomentsAsync(chunks(), config)).toStrictEqual(parseMomentsString(content, config))
+  }
+})
+
+test('async parse of file', async () => {
+  const config = testConfig()
+  const file = path.join(__dirname, '../../../system_tests/testdata/test_todo.txt')
+  const todos = await parseMomentsAsync(fs.createReadStream(file, { highWaterMark: 100 }), config)
+
+  expect(todos).toStrictEqual(parseMomentsString(fs.readFileSync(file).toString(), config))
+})
+
+test('cancellable parse', async () => {
+  const config = testConfig()
+  const token = { isCancellationRequested: false }
+  const expected = parseMomentsString(TEST_TODO, config)
+
+  expect(await parseMomentsCancellable(TEST_TODO, config, token)).toStrictEqual(expected)
+
+  const updated = TEST_TODO.slice(0, 1500) + '[] new\n' + TEST_TODO.slice(1500)
+  const prev = { todos: expected, content: TEST_TODO }
+  expect(await parseMomentsCancellable(updated, config, token, prev)).toStrictEqual(parseMomentsString(updated, config))
+})
+
+test('cancelled parse', async () => {
+  const config = testConfig()
+  const token = { isCancellationRequested: true }
+
+  expect(() => parseMomentsString(TEST_TODO, config, token)).toThrow(CancelledError)
+  expect(() => formatTodos(parseMomentsString(TEST_TODO, config), TEST_TODO, undefined, null, token)).toThrow(CancelledError)
+  await expect(parseMomentsCancellable(TEST_TODO, config, token)).rejects.toThrow('Cancelled')
+})
+
+test('cancellable parse gives way to cancellation', async () => {
+  const config = testConfig()
+  const token = { isCancellationRequested: false }
+  const content = TEST_TODO.repeat(20)
+
+  // Without time slices, the parse yields after every block
+  const parse = parseMomentsCancellable(content, config, token, undefined, 0)
+  setImmediate(() => { token.isCancellationRequested = true })
+  await expect(parse).rejects.toThrow('Cancelled')
+})
+
+async function* chunked(bytes: Buffer, chunkSize: number) {
+  for (let i = 0; i < bytes.length; i += chunkSize) {
+    yield bytes.subarray(i, i + chunkSize)
+  }
+}
+
+function expectSameAsFullParse(content: string, edits: Edit[]) {
+  const config = testConfig()
+  expectIncrementalParse(parseMomentsString(content, config), content, edits, config)
+}
+
+function expectIncrementalParse(prevTodos: Todos, prevContent: string, edits: Edit[], config: ParseConfig): Todos {
+  const todos = parseMomentsIncremental(prevTodos, prevContent, edits, config)
+  expect(todos).toStrictEqual(parseMomentsString(applyTestEdits(prevContent, edits), config))
+  return todos
+}
+
+function applyTestEdits(content: string, edits: Edit[]): string {
+  // Apply back to front so the offsets stay valid
+  const sorted = [...edits].sort((a, b) => editOffset(b, content) - editOffset(a, content))
+  return sorted.reduce((updated, e) => {
+    if (e.type === EditType.DELETE) {
+      const d = e as DeleteEdit
+      return updated.slice(0, d.startOffset) + updated.slice(d.endOffset)
+    }
+    const i = e as InsertEdit
+    const offset = editOffset(i, content)
+    return updated.slice(0, offset) + i.content + updated.slice(offset)
+  }, content)
+}
+
+function editOffset(e: Edit, content: string): number {
+  if (e.type === EditType.DELETE) {
+    return (e as DeleteEdit).startOffset
+  }
+  const offset = (e as InsertEdit).offset
+  return offset < 0 ? content.length : offset
+}
+
+function lineOffsets(content: string): number[][] {
+  const offsets = []
+  let start = 0
+  while (start < content.length) {
+    const end = content.indexOf('\n', start) + 1 || content.length
+    offsets.push([start, end])
+    start = end
+  }
+  return offsets
+}
+
+function insert(offset: number, content: string): InsertEdit {
+  return { type: EditType.INSERT, offset, content }
+}
+
+function del(startOffset: number, endOffset: number): DeleteEdit {
+  return { type: EditType.DELETE, startOffset, endOffset }
+}
+
+function testConfig(): ParseConfig {
+  const config = createParseConfig()
+  config.fixedTime = new Date(2022, 4, 22)
+  return config
+}
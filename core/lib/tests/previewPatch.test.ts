@@ -0,0 +1,93 @@
+import { createParseConfig } from '../src/models'
+import { parseMomentsString } from '../src/parse'
+import { previewMoments } from '../src/preview'
+import { diffPreview, isEmptyPatch, ListPatch, PreviewPatch, snapshotPreview } from '../src/previewPatch'
+import * as path from 'path'
+import * as fs from 'fs'
+import { endOfDay } from 'date-fns'
+
+const TEST_TODO = fs.readFileSync(path.join(__dirname, '../../../system_tests/testdata/test_todo.txt')).toString().replace(/\r/g, '')
+const FIXED_TIME = new Date(2022, 4, 22)
+
+test('patches from nothing add all entries', () => {
+  const snapshot = snapshotOf('[] foo (22.5.22)\n[] foo (22.5.22)\n------\n cat\n------\n[w] bar\n')
+  const patch = diffPreview(undefined, snapshot)
+
+  const end = endOfDay(FIXED_TIME).toISOString()
+  expect(patch.today).toEqual({
+    order: [`foo\n${end}`, `foo\n${end}\n2`],
+    changed: {
+      [`foo\n${end}`]: { name: 'foo', end, line: 0 },
+      [`foo\n${end}\n2`]: { name: 'foo', end, line: 1 }
+    }
+  })
+  expect(patch.overview.order).toEqual(['_none', 'cat'])
+  expect(patch.overview.changed.cat).toEqual({
+    name: 'cat',
+    moments: { order: ['bar'], changed: { bar: { name: 'bar', workState: 'waiting', line: 5 } } }
+  })
+})
+
+test('patches only the changed entries', () => {
+  const content = '[] foo (22.5.22)\n[] bar (23.5.22)\n[] baz\n'
+  const prev = snapshotOf(content)
+
+  expect(isEmptyPatch(diffPreview(prev, snapshotOf(content)))).toBe(true)
+
+  const patch = diffPreview(prev, snapshotOf(content.replace('[] bar', '[p] bar')))
+  expect(patch.today).toEqual({ changed: {} })
+  expect(patch.week).toEqual({ changed: {} })
+  expect(patch.overview).toEqual({
+    changed: { _none: { name: '_none', moments: { changed: { bar: { name: 'bar', workState: 'inProgress', line: 1 } } } } }
+  })
+})
+
+test('patches turn the previous preview into the next one', () => {
+  let content = TEST_TODO
+  let prev = snapshotOf(content)
+  const state = toPlainSnapshot(diffPreview(undefined, prev))
+  const typed = '[] new (22.5.22)\n\t[] sub\n------\n cat\n------\n'
+  for (let i = 0; i < typed.length; i++) {
+    content = content.slice(0, 1500) + typed.slice(0, i + 1) + content.slice(1500 + i)
+    const next = snapshotOf(content)
+    applyPatch(state, diffPreview(prev, next))
+    expect(state).toEqual(toPlainSnapshot(diffPreview(undefined, next)))
+    prev = next
+  }
+})
+
+function snapshotOf(content: string) {
+  return snapshotPreview(previewMoments(parseMomentsString(content, createParseConfig()), FIXED_TIME))
+}
+
+type PlainList = [string, unknown][]
+
+function toPlainSnapshot(fullPatch: PreviewPatch) {
+  const plain = (patch: ListPatch<unknown>) => (patch.order ?? []).map(k => [k, patch.changed[k]] as [string, unknown])
+  return {
+    today: plain(fullPatch.today),
+    week: plain(fullPatch.week),
+    overview: plain(fullPatch.overview),
+    calendar: plain(fullPatch.calendar)
+  }
+}
+
+function applyPatch(state: Record<string, PlainList>, patch: PreviewPatch) {
+  (['today', 'week', 'overview', 'calendar'] as (keyof PreviewPatch)[]).forEach(list => {
+    state[list] = applyListPatch(state[list], patch[list], (prev, next) => {
+      if (list !== 'overview') {
+        return next
+      }
+      const lane = next as { name: string, moments: ListPatch<unknown> }
+      const prevMoments = (prev as { moments?: ListPatch<unknown> } | undefined)?.moments
+      const moments = applyListPatch(prevMoments?.order?.map(k => [k, prevMoments.changed[k]]) ?? [], lane.moments, (_p, n) => n)
+      return { name: lane.name, moments: { order: moments.map(([k]) => k), changed: Object.fromEntries(moments) } }
+    })
+  })
+}
+
+function applyListPatch(entries: PlainList, patch: ListPatch<unknown>, apply: (prev: unknown, next: unknown) => unknown): PlainList {
+  const values = new Map(entries)
+  Object.entries(patch.changed).forEach(([k, v]) => values.set(k, apply(values.get(k), v)))
+  return (patch.order ?? entries.map(([k]) => k)).map(k => [k, values.get(k)])
+}
@@ -0,0 +1,37 @@
+import { appendTrash } from '../src/trash'
+import { trashDoneMoments } from '../src/clean'
+import { EditType, EOF_OFFSET, InsertEdit } from '../src/models'
+import * as tmp from 'tmp'
+import * as path from 'path'
+import * as fs from 'fs'
+import { parse } from 'date-fns'
+
+const TODO_CONTENT = '[] foo\n[x] bar\n\tcomment\n[] baz\n'
+
+test('appends trash', async () => {
+  // Given
+  const tmpDir = tmp.dirSync({ unsafeCleanup: true }).name
+  const trashFile = path.join(tmpDir, 'todo-trash.txt')
+  const [, trashEdits] = trashDoneMoments(TODO_CONTENT, undefined, parse('2022-06-05', 'yyyy-MM-dd', new Date()))
+
+  // When
+  await appendTrash(trashFile, trashEdits)
+  await appendTrash(trashFile, trashEdits)
+
+  // Then
+  const trash = '------------------\n  Trash from 05.06.2022 00:00:00\n------------------\n[x] bar\n\tcomment\n'
+  expect(load(trashFile)).toBe(trash + trash)
+})
+
+test('only appends edits at the end', async () => {
+  const tmpDir = tmp.dirSync({ unsafeCleanup: true }).name
+  const trashFile = path.join(tmpDir, 'todo-trash.txt')
+
+  await expect(appendTrash(trashFile, [{ type: EditType.INSERT, offset: 0, content: 'x' } as InsertEdit])).rejects.toThrow('EOF_OFFSET')
+  await appendTrash(trashFile, [{ type: EditType.INSERT, offset: EOF_OFFSET, content: 'x' } as InsertEdit])
+  expect(load(trashFile)).toBe('x')
+})
+
+function load(file: string): string {
+  return fs.readFileSync(file).toString()
+}
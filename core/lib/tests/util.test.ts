@@ -0,0 +1,50 @@
+import { DeleteEdit, Edit, EditType, EOF_OFFSET, InsertEdit } from '../src/models'
+import { applyEdits, WhitespaceIndex } from '../src/util'
+
+const ins = (offset: number, content: string) => ({ type: EditType.INSERT, offset, content } as InsertEdit)
+const del = (startOffset: number, endOffset: number) => ({ type: EditType.DELETE, startOffset, endOffset } as DeleteEdit)
+
+test('finds whitespace only ranges like regex', () => {
+  const content = 'a b\t\r\n  c  　d﻿​e  \n'
+  const index = new WhitespaceIndex(content)
+  for (let start = -1; start <= content.length + 1; start++) {
+    for (let end = start; end <= content.length + 1; end++) {
+      const expected = [...Array(end - start).keys()].every(i => /\s/.test(content[start + i]))
+      expect(index.onlyWhitespaceBetween(start, end)).toBe(expected)
+    }
+  }
+})
+
+test('counts non-whitespace characters', () => {
+  const index = new WhitespaceIndex('[] foo\n\tbar baz\n')
+
+  expect(index.nonWhitespaceBetween(0, 16)).toBe(11)
+  expect(index.nonWhitespaceBetween(6, 8)).toBe(0)
+  expect(index.nonWhitespaceBetween(8, 6)).toBe(0)
+})
+
+test('applies edits relative to the original content', () => {
+  const content = 'a~b~c\nd'
+  const edits: Edit[] = [ins(EOF_OFFSET, '!'), del(4, 6), ins(1, 'x'), del(0, 1), ins(1, 'y'), ins(5, 'z')]
+
+  expect(applyEdits(content, edits)).toBe('xy~b~zd!')
+  expect(applyEdits('', [ins(EOF_OFFSET, 'a'), ins(EOF_OFFSET, 'b')])).toBe('ab')
+  expect(applyEdits(content, [])).toBe(content)
+})
+
+test('inserts at the borders of adjacent deletes', () => {
+  const content = 'ab~cd\nef~gh\nij'
+  for (let start = 0; start <= content.length; start++) {
+    for (let end = start; end <= content.length; end++) {
+      const edits = [del(end, Math.min(end + 2, content.length)), ins(start, '>'), del(start, end), ins(end, '<')]
+      const expected = content.slice(0, start) + '><' + content.slice(Math.min(end + 2, content.length))
+      expect(applyEdits(content, edits)).toBe(expected)
+    }
+  }
+})
+
+test('rejects invalid edits', () => {
+  expect(() => applyEdits('abc', [ins(4, 'x')])).toThrow('outside')
+  expect(() => applyEdits('abc', [del(2, 1)])).toThrow('outside')
+  expect(() => applyEdits('abc', [del(0, 2), del(1, 3)])).toThrow('overlaps')
+})
@@ -19,6 +19,8 @@ module.exports = {
         // "date-fns": "commonjs date-fns",
         fs: "commonjs fs",
         path: "commonjs path",
+        crypto: "commonjs crypto",
+        string_decoder: "commonjs string_decoder",
     },
     module: {
         rules: [
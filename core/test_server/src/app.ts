@@ -1,163 +1,110 @@
-import {
-    parseMomentsString, inLocalTimezone, generateInstances, isoTimezoneOffset, formatTodos, createParseConfig,
-    TODO_FORMAT, foldTodos, outlineTodos, cleanDoneMoments, trashDoneMoments, EditType, InsertEdit, DeleteEdit, Edit, EOF_OFFSET, previewMoments
-} from '@commonplace/lib'
+import { createParseConfig, cleanDoneMoments, trashDoneMoments, applyEdits, appendTrash, writeFileAtomic } from '@commonplace/lib'
 import express from 'express'
-import { format, parse } from 'date-fns'
+import { parse } from 'date-fns'
 import * as fs from 'fs'
 import * as path from 'path'
+import { BodyEncoding } from './parseCache'
+import { createRenderer } from './renderers'
+import { ViewJob, ViewRequest } from './views'
 
 const app = express()
-app.use(express.text({ type: '*/*' }))
-const port = 3000
+// Bodies are read as buffers, inflating gzip and deflate content encodings.
+// The limit is large enough for the benchmark files with a million lines.
+app.use(express.raw({ type: '*/*', limit: '256mb' }))
+const RAW_CONTENT_TYPES = ['application/octet-stream', 'text/plain']
+const port = parseInt(process.env.PORT ?? '3000', 10)
+// Computes the views, in worker threads if configured
+const renderer = createRenderer()
 
 app.get('/', (_req, res) => {
     res.send('Hello World!')
 })
 
-function useLocalTimezoneDates(this: any, k: any, v: any) {
-    if (this?.[k] instanceof Date) {
-        if (k === 'timeOfDay') {
-            return format(this?.[k], 'HH:mm:ss')
-        }
-        else {
-            return inLocalTimezone(this?.[k]).toISOString().replace(/Z$/, isoTimezoneOffset(this?.[k]))
-        }
-    }
-    return v
-}
+app.get('/cache/stats', (_req, res) => {
+    renderer.stats()
+        .then(stats => res.json(stats))
+        .catch(e => {
+            console.error('could not get cache stats', e)
+            res.json({})
+        })
+})
 
 app.post('/parse', (req, res) => {
-    const body = Buffer.from(req.body, 'base64').toString('utf8')
-
-    try {
-        const cfg = createParseConfig()
-        if (req.query.fixedTime || req.query.fixed_time) {
-            cfg.fixedTime = parse((req.query.fixedTime ?? req.query.fixed_time) as string, 'yyyy-MM-dd', new Date())
-        }
-
-        const todos = parseMomentsString(body, cfg)
-
-        res.send(JSON.stringify(todos, req.query.localTime ? useLocalTimezoneDates : undefined))
-    }
-    catch (e) {
-        console.error('could not parse', e)
-        res.json({})
-    }
+    sendView(res, createJob(req, { view: 'parse' }), 'could not parse')
 })
 
+/**
+ * returns the instances between start and end. With ?stream=ndjson, the instances are streamed
+ * as they are generated, one JSON object per line.
+ */
 app.post('/instances', (req, res) => {
-    const body = Buffer.from(req.body, 'base64').toString('utf8')
-
-    try {
-        const cfg = createParseConfig()
-        if (req.query.fixedTime || req.query.fixed_time) {
-            cfg.fixedTime = parse((req.query.fixedTime ?? req.query.fixed_time) as string, 'yyyy-MM-dd', new Date())
-        }
-
-        const todos = parseMomentsString(body, cfg)
-
-        const start = parse(req.query.start as string, 'yyyy-MM-dd', new Date())
-        const end = parse(req.query.end as string, 'yyyy-MM-dd', new Date())
-        const instances = generateInstances(todos.moments, start, end)
-
-        res.send(JSON.stringify(instances, req.query.localTime ? useLocalTimezoneDates : undefined))
+    const job = createJob(req, { view: 'instances', start: req.query.start as string, end: req.query.end as string })
+    if (req.query.stream === 'ndjson') {
+        streamView(res, job, 'could not instantiate')
     }
-    catch (e) {
-        console.error('could not instantiate', e)
-        res.json({})
+    else {
+        sendView(res, job, 'could not instantiate')
     }
 })
 
 app.post('/format', (req, res) => {
-    const body = Buffer.from(req.body, 'base64').toString('utf8')
-
-    try {
-        const cfg = createParseConfig()
-        if (req.query.fixedTime || req.query.fixed_time) {
-            cfg.fixedTime = parse((req.query.fixedTime ?? req.query.fixed_time) as string, 'yyyy-MM-dd', new Date())
-        }
-
-        const todos = parseMomentsString(body, cfg)
-
-        const formatType = req.query.type as string ?? TODO_FORMAT
-        const styles = formatTodos(todos, body, formatType, cfg.fixedTime)
-        res.send(styles.reduce((p, c) => `${p}${c.start},${c.end},${c.style}\n`, ''))
-    }
-    catch (e) {
-        console.error('could not instantiate', e)
-        res.json({})
-    }
+    sendView(res, createJob(req, { view: 'format', type: req.query.type as string }), 'could not instantiate')
 })
 
 app.post('/folding', (req, res) => {
-    const body = Buffer.from(req.body, 'base64').toString('utf8')
-
-    try {
-        const cfg = createParseConfig()
-        if (req.query.fixedTime || req.query.fixed_time) {
-            cfg.fixedTime = parse((req.query.fixedTime ?? req.query.fixed_time) as string, 'yyyy-MM-dd', new Date())
-        }
-
-        const todos = parseMomentsString(body, cfg)
-
-        const folds = foldTodos(todos)
-        res.send(folds.reduce((p, [start, end]) => `${p}${start}-${end}\n`, ''))
-    }
-    catch (e) {
-        console.error('could not instantiate', e)
-        res.json({})
-    }
+    sendView(res, createJob(req, { view: 'folding' }), 'could not instantiate')
 })
 
 app.post('/outline', (req, res) => {
-    const body = Buffer.from(req.body, 'base64').toString('utf8')
-
-    try {
-        const cfg = createParseConfig()
-        if (req.query.fixedTime || req.query.fixed_time) {
-            cfg.fixedTime = parse((req.query.fixedTime ?? req.query.fixed_time) as string, 'yyyy-MM-dd', new Date())
-        }
-
-        const todos = parseMomentsString(body, cfg)
-
-        const formatType = req.query.type as string ?? TODO_FORMAT
-        const outline = outlineTodos(todos, body, formatType)
-        res.json({ outline })
-    }
-    catch (e) {
-        console.error('could not instantiate', e)
-        res.json({})
-    }
+    sendView(res, createJob(req, { view: 'outline', type: req.query.type as string }), 'could not instantiate', true)
 })
 
 app.post('/preview', (req, res) => {
-    const body = Buffer.from(req.body, 'base64').toString('utf8')
+    sendView(res, createJob(req, { view: 'preview' }), 'could not instantiate')
+})
 
+/**
+ * returns several views of one document, parsing it only once. The body is the document like for the single view
+ * endpoints, and the views query parameter the JSON list of views, for example
+ * /batch?fixed_time=2022-06-05&views=[{"view": "format", "type": "todo"}, {"view": "folding"}].
+ * For the first clients, a JSON body with the base64 encoded content, an optional fixedTime and the views is
+ * also accepted: {"content": "...", "fixedTime": "2022-06-05", "views": [...]}.
+ * The results are in the same order as the views and are the same as the responses of the single view endpoints.
+ */
+app.post('/batch', (req, res) => {
+    let job: ViewJob
     try {
-        const cfg = createParseConfig()
-        if (req.query.fixedTime || req.query.fixed_time) {
-            cfg.fixedTime = parse((req.query.fixedTime ?? req.query.fixed_time) as string, 'yyyy-MM-dd', new Date())
+        if (isJsonBody(req)) {
+            const batch = JSON.parse(req.body.toString('utf8'))
+            job = {
+                content: batch.content,
+                encoding: 'base64',
+                fixedTime: batch.fixedTime || undefined,
+                views: batch.views,
+                localTime: !!req.query.localTime
+            }
         }
-
-        const todos = parseMomentsString(body, cfg)
-        const preview = previewMoments(todos, cfg.fixedTime)
-        res.send(JSON.stringify(preview, req.query.localTime ? useLocalTimezoneDates : undefined))
+        else {
+            job = createJob(req, ...JSON.parse(req.query.views as string))
+        }
+        job.batch = true
     }
     catch (e) {
-        console.error('could not instantiate', e)
+        console.error('could not process batch', e)
         res.json({})
+        return
     }
+
+    sendView(res, job, 'could not process batch')
 })
 
-app.post('/clean', (_req, res) => {
+app.post('/clean', async (_req, res) => {
     try {
         const testTodoDir = getTestTodoDir()
         const todoFile = path.join(testTodoDir, 'todo.txt')
-        const content = fs.readFileSync(todoFile).toString()
+        const content = (await fs.promises.readFile(todoFile)).toString()
         const edits = cleanDoneMoments(content)
-        const updated = applyEdits(content, edits)
-        fs.writeFileSync(todoFile, updated)
+        await writeFileAtomic(todoFile, applyEdits(content, edits))
         res.sendStatus(200)
     }
     catch (e) {
@@ -166,7 +113,7 @@ app.post('/clean', (_req, res) => {
     }
 })
 
-app.post('/trash', (req, res) => {
+app.post('/trash', async (req, res) => {
     try {
         const cfg = createParseConfig()
         if (req.query.fixedTime || req.query.fixed_time) {
@@ -176,14 +123,12 @@ app.post('/trash', (req, res) => {
         const testTodoDir = getTestTodoDir()
         const todoFile = path.join(testTodoDir, 'todo.txt')
         const trashFile = path.join(testTodoDir, 'todo-trash.txt')
-        const content = fs.readFileSync(todoFile).toString()
+        const content = (await fs.promises.readFile(todoFile)).toString()
         const [todoEdits, trashEdits] = trashDoneMoments(content, cfg, cfg.fixedTime)
 
-        const updatedTodo = applyEdits(content, todoEdits)
-        const updatedTrash = applyEdits('', trashEdits)
-
-        fs.writeFileSync(todoFile, updatedTodo)
-        fs.writeFileSync(trashFile, updatedTrash)
+        // Trash first, so a failure can at worst duplicate moments in the trash instead of losing them
+        await appendTrash(trashFile, trashEdits)
+        await writeFileAtomic(todoFile, applyEdits(content, todoEdits))
 
         res.sendStatus(200)
     }
@@ -193,33 +138,61 @@ app.post('/trash', (req, res) => {
     }
 })
 
-function getTestTodoDir() {
-    return path.join(process.platform === 'win32' ? 'c:/temp' : '/tmp', 'commonplace_system_test')
+function createJob(req: express.Request, ...views: ViewRequest[]): ViewJob {
+    return {
+        content: req.body,
+        encoding: bodyEncoding(req),
+        fixedTime: (req.query.fixedTime || req.query.fixed_time || undefined) as string | undefined,
+        views,
+        localTime: !!req.query.localTime
+    }
+}
+
+/**
+ * returns the encoding of the document in the body. Bodies of these content types are the UTF-8 content,
+ * all others are base64 encoded, as sent by the first clients.
+ */
+function bodyEncoding(req: express.Request): BodyEncoding {
+    return RAW_CONTENT_TYPES.includes(contentType(req)) ? 'utf8' : 'base64'
 }
 
-function applyEdits(content: string, edits: Edit[]): string {
-    const inserts = edits.filter(e => e.type === EditType.INSERT)
-    const deletes = edits.filter(e => e.type === EditType.DELETE)
+function isJsonBody(req: express.Request): boolean {
+    return contentType(req) === 'application/json'
+}
 
-    let updated = content;
-    (deletes as DeleteEdit[]).forEach(del => {
-        updated = updated.slice(0, del.startOffset) + '~'.repeat(del.endOffset - del.startOffset) + updated.slice(del.endOffset)
-    });
+function contentType(req: express.Request): string {
+    return (req.get('Content-Type') ?? '').split(';')[0].trim().toLowerCase()
+}
 
-    (inserts as InsertEdit[]).forEach(i => (i.offset = i.offset === EOF_OFFSET ? content.length : i.offset))
+function sendView(res: express.Response, job: ViewJob, errorMessage: string, json = false) {
+    renderer.render(job)
+        .then(body => (json ? res.type('json') : res).send(body))
+        .catch(e => {
+            console.error(errorMessage, e)
+            res.json({})
+        })
+}
 
-    for (let i = 0; i < inserts.length; i++) {
-        const insert = inserts[i] as InsertEdit
-        updated = updated.slice(0, insert.offset) + insert.content + updated.slice(insert.offset)
-        for (let j = i + 1; j < inserts.length; j++) {
-            const nextInsert = inserts[j] as InsertEdit
-            if (nextInsert.offset >= insert.offset) {
-                nextInsert.offset += insert.content.length
+function streamView(res: express.Response, job: ViewJob, errorMessage: string) {
+    const write = (chunk: string) => res.write(chunk) ? Promise.resolve() : new Promise<void>(resolve => res.once('drain', resolve))
+
+    res.type('application/x-ndjson')
+    renderer.stream(job, write)
+        .then(() => res.end())
+        .catch(e => {
+            console.error(errorMessage, e)
+            // Once parts were sent, the response can only be cut short
+            if (res.headersSent) {
+                res.end()
             }
-        }
-    }
+            else {
+                res.json({})
+            }
+        })
+}
 
-    return updated.replace(/~/g, '')
+function getTestTodoDir() {
+    return process.env.COMMONPLACE_TEST_DIR ?? path.join(process.platform === 'win32' ? 'c:/temp' : '/tmp', 'commonplace_system_test')
 }
 
 app.listen(port, () => {
@@ -0,0 +1,120 @@
+import { createParseConfig, parseMomentsString, LruCache } from '@commonplace/lib'
+import { ParseConfig, Todos } from '@commonplace/lib/models'
+import { format, parse } from 'date-fns'
+import { createHash } from 'crypto'
+
+const DEFAULT_CACHE_SIZE = 100
+// Views kept per document. Besides the fixed views, this leaves room for a few instance ranges.
+const MAX_VIEWS_PER_DOCUMENT = 16
+
+/**
+ * how a request body encodes the document: base64 text, or the UTF-8 content itself.
+ */
+export type BodyEncoding = 'base64' | 'utf8'
+
+/**
+ * a parsed request body, with the most recently used views derived from it.
+ */
+export interface ParsedDocument {
+    content: string
+    cfg: ParseConfig
+    todos: Todos
+    views: LruCache<string, unknown>
+}
+
+export interface ParseCacheStats {
+    size: number
+    hits: number
+    misses: number
+    viewHits: number
+    viewMisses: number
+    viewEvictions: number
+}
+
+/**
+ * keeps the most recently parsed request bodies, so repeated requests with the same document
+ * don't parse it again. Entries are keyed by a hash of the (still encoded) body and its encoding,
+ * the fixed time and the parse config.
+ */
+export class ParseCache {
+    private entries: LruCache<string, ParsedDocument>
+    private configKey: string
+    private stats: ParseCacheStats
+
+    constructor(maxSize: number) {
+        this.entries = new LruCache(maxSize)
+        this.configKey = configFingerprint(createParseConfig())
+        this.stats = { size: 0, hits: 0, misses: 0, viewHits: 0, viewMisses: 0, viewEvictions: 0 }
+    }
+
+    /**
+     * returns the parsed body, parsing it if it isn't cached yet.
+     */
+    get(body: Uint8Array | string, encoding: BodyEncoding, fixedTime?: string): ParsedDocument {
+        // Without a fixed time, parsing depends on the current day
+        const day = fixedTime ?? format(new Date(), 'yyyy-MM-dd')
+        const key = `${createHash('sha1').update(body).digest('hex')}:${encoding}:${day}:${this.configKey}`
+
+        let doc = this.entries.get(key)
+        if (doc) {
+            this.stats.hits++
+            return doc
+        }
+
+        this.stats.misses++
+        const content = decodeBody(body, encoding)
+        const cfg = createParseConfig()
+        if (fixedTime) {
+            cfg.fixedTime = parse(fixedTime, 'yyyy-MM-dd', new Date())
+        }
+        doc = { content, cfg, todos: parseMomentsString(content, cfg), views: new LruCache(MAX_VIEWS_PER_DOCUMENT) }
+        this.entries.set(key, doc)
+        return doc
+    }
+
+    /**
+     * returns the view of the document with the given key, computing it on first use.
+     * Views are shared between requests and must not be modified.
+     */
+    view<T>(doc: ParsedDocument, key: string, compute: () => T): T {
+        const cached = doc.views.get(key)
+        if (cached !== undefined) {
+            this.stats.viewHits++
+            return cached as T
+        }
+
+        this.stats.viewMisses++
+        const view = compute()
+        if (doc.views.size === MAX_VIEWS_PER_DOCUMENT) {
+            // Adding the view evicts the least recently used one
+            this.stats.viewEvictions++
+        }
+        doc.views.set(key, view)
+        return view
+    }
+
+    getStats(): ParseCacheStats {
+        return { ...this.stats, size: this.entries.size }
+    }
+}
+
+export function createParseCache(): ParseCache {
+    const size = parseInt(process.env.PARSE_CACHE_SIZE ?? '', 10)
+    return new ParseCache(isNaN(size) ? DEFAULT_CACHE_SIZE : size)
+}
+
+function decodeBody(body: Uint8Array | string, encoding: BodyEncoding): string {
+    if (typeof body === 'string') {
+        return encoding === 'base64' ? Buffer.from(body, 'base64').toString('utf8') : body
+    }
+
+    // Bodies passed to a worker thread arrive as plain Uint8Arrays
+    const buffer = Buffer.isBuffer(body) ? body : Buffer.from(body.buffer, body.byteOffset, body.byteLength)
+    return encoding === 'base64' ? Buffer.from(buffer.toString('latin1'), 'base64').toString('utf8') : buffer.toString('utf8')
+}
+
+function configFingerprint(cfg: ParseConfig): string {
+    return createHash('sha1')
+        .update(JSON.stringify(cfg, (_k, v) => v instanceof RegExp ? v.toString() : v))
+        .digest('hex')
+}
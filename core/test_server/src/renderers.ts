@@ -0,0 +1,158 @@
+import { Worker } from 'worker_threads'
+import * as os from 'os'
+import * as path from 'path'
+import { createParseCache, ParseCache, ParseCacheStats } from './parseCache'
+import { renderJob, streamJob, ViewJob, WorkerRequest, WorkerResponse } from './views'
+
+/**
+ * computes the responses of view jobs.
+ */
+export interface ViewRenderer {
+    render(job: ViewJob): Promise<string>
+    /**
+     * computes a streamed response, passing its parts to write. The next part is only computed
+     * once the promise returned by write resolves.
+     */
+    stream(job: ViewJob, write: (chunk: string) => Promise<void>): Promise<void>
+    stats(): Promise<ParseCacheStats>
+}
+
+/**
+ * creates the renderer configured by the WORKERS environment variable: the number of worker threads,
+ * or "auto" for one per core. Without workers, jobs are computed on the event loop.
+ */
+export function createRenderer(): ViewRenderer {
+    const workers = process.env.WORKERS === 'auto' ? os.cpus().length : parseInt(process.env.WORKERS ?? '0', 10)
+    if (isNaN(workers) || workers <= 0) {
+        return new InlineRenderer(createParseCache())
+    }
+
+    return new WorkerPool(path.join(__dirname, 'viewWorker.js'), workers)
+}
+
+/**
+ * computes jobs on the event loop.
+ */
+export class InlineRenderer implements ViewRenderer {
+    private parseCache: ParseCache
+
+    constructor(parseCache: ParseCache) {
+        this.parseCache = parseCache
+    }
+
+    render(job: ViewJob): Promise<string> {
+        return new Promise(resolve => resolve(renderJob(this.parseCache, job)))
+    }
+
+    async stream(job: ViewJob, write: (chunk: string) => Promise<void>): Promise<void> {
+        for (const chunk of streamJob(this.parseCache, job)) {
+            await write(chunk)
+        }
+    }
+
+    stats(): Promise<ParseCacheStats> {
+        return Promise.resolve(this.parseCache.getStats())
+    }
+}
+
+interface PendingRequest {
+    resolve: (result: unknown) => void
+    reject: (error: Error) => void
+    onChunk?: (chunk: string) => void
+}
+
+interface PoolWorker {
+    worker: Worker
+    pending: Map<number, PendingRequest>
+}
+
+/**
+ * computes jobs in worker threads, so they use all cores and a large document doesn't block the event loop.
+ * A job goes to the worker with the fewest pending jobs. Workers that die are replaced, failing their pending jobs.
+ * Workers compute the next part of a streamed response only once the previous one is written, so a slow client
+ * doesn't make the response pile up in memory.
+ */
+export class WorkerPool implements ViewRenderer {
+    private script: string
+    private workers: PoolWorker[]
+    private nextId: number
+
+    constructor(script: string, size: number) {
+        this.script = script
+        this.nextId = 0
+        this.workers = Array.from({ length: size }, () => this.spawn())
+    }
+
+    render(job: ViewJob): Promise<string> {
+        return this.send(this.leastBusy(), { id: this.nextId++, type: 'render', job }) as Promise<string>
+    }
+
+    async stream(job: ViewJob, write: (chunk: string) => Promise<void>): Promise<void> {
+        const poolWorker = this.leastBusy()
+        const id = this.nextId++
+        // The worker waits for a credit after every part, so there is only ever one part being written
+        await this.send(poolWorker, { id, type: 'stream', job }, chunk => {
+            write(chunk).then(
+                () => poolWorker.worker.postMessage({ id, type: 'credit' }),
+                () => poolWorker.worker.postMessage({ id, type: 'cancel' })
+            )
+        })
+    }
+
+    async stats(): Promise<ParseCacheStats> {
+        const stats = await Promise.all(this.workers.map(w => this.send(w, { id: this.nextId++, type: 'stats' }))) as ParseCacheStats[]
+        return stats.reduce((a, b) => ({
+            size: a.size + b.size,
+            hits: a.hits + b.hits,
+            misses: a.misses + b.misses,
+            viewHits: a.viewHits + b.viewHits,
+            viewMisses: a.viewMisses + b.viewMisses,
+            viewEvictions: a.viewEvictions + b.viewEvictions
+        }))
+    }
+
+    private leastBusy(): PoolWorker {
+        return this.workers.reduce((a, b) => b.pending.size < a.pending.size ? b : a)
+    }
+
+    private send(poolWorker: PoolWorker, req: WorkerRequest, onChunk?: (chunk: string) => void): Promise<unknown> {
+        return new Promise((resolve, reject) => {
+            poolWorker.pending.set(req.id, { resolve, reject, onChunk })
+            poolWorker.worker.postMessage(req)
+        })
+    }
+
+    private spawn(): PoolWorker {
+        const poolWorker: PoolWorker = { worker: new Worker(this.script), pending: new Map() }
+        poolWorker.worker.on('message', (res: WorkerResponse) => {
+            const pending = poolWorker.pending.get(res.id)
+            if (res.chunk !== undefined) {
+                pending?.onChunk?.(res.chunk)
+                return
+            }
+
+            poolWorker.pending.delete(res.id)
+            if (res.error !== undefined) {
+                pending?.reject(Error(res.error))
+            }
+            else {
+                pending?.resolve(res.result)
+            }
+        })
+        poolWorker.worker.on('error', e => this.replace(poolWorker, e))
+        poolWorker.worker.on('exit', code => this.replace(poolWorker, Error(`Worker exited with code ${code}`)))
+        return poolWorker
+    }
+
+    private replace(poolWorker: PoolWorker, error: Error) {
+        const index = this.workers.indexOf(poolWorker)
+        // An error is followed by an exit, the worker is only replaced once
+        if (index < 0) {
+            return
+        }
+
+        console.error('worker failed', error)
+        poolWorker.pending.forEach(pending => pending.reject(error))
+        this.workers[index] = this.spawn()
+    }
+}
@@ -0,0 +1,62 @@
+import { parentPort } from 'worker_threads'
+import { createParseCache } from './parseCache'
+import { renderJob, streamJob, WorkerRequest, WorkerResponse } from './views'
+
+// Every worker has its own cache of the documents it parsed
+const parseCache = createParseCache()
+// Streams waiting for the credit to send their next part, by request id
+const streams = new Map<number, Generator<string>>()
+
+parentPort!.on('message', (req: WorkerRequest) => {
+    if (req.type === 'stream') {
+        streams.set(req.id, streamJob(parseCache, req.job))
+        sendNextPart(req.id)
+        return
+    }
+    if (req.type === 'credit') {
+        sendNextPart(req.id)
+        return
+    }
+    if (req.type === 'cancel') {
+        const stream = streams.get(req.id)
+        streams.delete(req.id)
+        stream?.return(undefined)
+        parentPort!.postMessage({ id: req.id, error: 'Stream cancelled' })
+        return
+    }
+
+    let res: WorkerResponse
+    try {
+        res = { id: req.id, result: req.type === 'stats' ? parseCache.getStats() : renderJob(parseCache, req.job) }
+    }
+    catch (e) {
+        res = errorResponse(req.id, e)
+    }
+    parentPort!.postMessage(res)
+})
+
+function sendNextPart(id: number) {
+    const stream = streams.get(id)
+    if (!stream) {
+        return
+    }
+
+    let res: WorkerResponse
+    try {
+        const next = stream.next()
+        if (!next.done) {
+            parentPort!.postMessage({ id, chunk: next.value })
+            return
+        }
+        res = { id, result: '' }
+    }
+    catch (e) {
+        res = errorResponse(id, e)
+    }
+    streams.delete(id)
+    parentPort!.postMessage(res)
+}
+
+function errorResponse(id: number, e: unknown): WorkerResponse {
+    return { id, error: e instanceof Error ? e.stack ?? e.message : String(e) }
+}
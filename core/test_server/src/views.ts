@@ -0,0 +1,138 @@
+import {
+    inLocalTimezone, generateInstances, iterateInstances, isoTimezoneOffset, formatTodos, TODO_FORMAT, foldTodos, outlineTodos,
+    previewMoments, getMomentIndex
+} from '@commonplace/lib'
+import { format, parse } from 'date-fns'
+import { BodyEncoding, ParseCache, ParseCacheStats, ParsedDocument } from './parseCache'
+
+// Streamed responses are written in chunks of about this many characters
+const STREAM_CHUNK_SIZE = 64 * 1024
+
+export interface ViewRequest {
+    view: string
+    type?: string
+    start?: string
+    end?: string
+}
+
+/**
+ * views of one document to compute, in the server or in a worker.
+ */
+export interface ViewJob {
+    content: Uint8Array | string
+    encoding: BodyEncoding
+    fixedTime?: string
+    views: ViewRequest[]
+    // Whether to return all views as {results}, like the /batch endpoint, instead of only the first one
+    batch?: boolean
+    localTime?: boolean
+}
+
+/**
+ * requests to a view worker. A stream sends its first part, then the next one after every credit, so parts are
+ * only computed as fast as they are written. A cancel drops a stream.
+ */
+export type WorkerRequest = { id: number, type: 'render' | 'stream', job: ViewJob } | { id: number, type: 'stats' | 'credit' | 'cancel' }
+
+export interface WorkerResponse {
+    id: number
+    // A part of a streamed response, followed by more parts and finally the result
+    chunk?: string
+    result?: string | ParseCacheStats
+    error?: string
+}
+
+/**
+ * returns the response body for the job. Views that are text are returned as they are, all others as JSON.
+ */
+export function renderJob(cache: ParseCache, job: ViewJob): string {
+    const doc = cache.get(job.content, job.encoding, job.fixedTime)
+    const replacer = job.localTime ? useLocalTimezoneDates : undefined
+    if (job.batch) {
+        return JSON.stringify({ results: job.views.map(view => renderView(cache, doc, view)) }, replacer)
+    }
+
+    const view = renderView(cache, doc, job.views[0])
+    return typeof view === 'string' ? view : JSON.stringify(view, replacer)
+}
+
+/**
+ * returns the instances of the job's instances view as NDJSON, one instance per line. The instances are generated
+ * while the chunks are consumed, so they are never all in memory.
+ */
+export function* streamJob(cache: ParseCache, job: ViewJob): Generator<string> {
+    const doc = cache.get(job.content, job.encoding, job.fixedTime)
+    const view = job.views[0]
+    if (view.view !== 'instances') {
+        throw Error(`View ${view.view} can't be streamed`)
+    }
+
+    const replacer = job.localTime ? useLocalTimezoneDates : undefined
+    const instances = iterateInstances(
+        getMomentIndex(doc.todos),
+        parse(view.start as string, 'yyyy-MM-dd', new Date()),
+        parse(view.end as string, 'yyyy-MM-dd', new Date())
+    )
+
+    let chunk = ''
+    for (const inst of instances) {
+        chunk += `${JSON.stringify(inst, replacer)}\n`
+        if (chunk.length >= STREAM_CHUNK_SIZE) {
+            yield chunk
+            chunk = ''
+        }
+    }
+    if (chunk) {
+        yield chunk
+    }
+}
+
+function useLocalTimezoneDates(this: any, k: any, v: any) {
+    if (this?.[k] instanceof Date) {
+        if (k === 'timeOfDay') {
+            return format(this?.[k], 'HH:mm:ss')
+        }
+        else {
+            return inLocalTimezone(this?.[k]).toISOString().replace(/Z$/, isoTimezoneOffset(this?.[k]))
+        }
+    }
+    return v
+}
+
+function renderView(cache: ParseCache, doc: ParsedDocument, request: ViewRequest): unknown {
+    switch (request.view) {
+        case 'parse': return doc.todos
+        case 'instances': return instancesView(cache, doc, request.start as string, request.end as string)
+        case 'format': return formatView(cache, doc, request.type)
+        case 'folding': return foldingView(cache, doc)
+        case 'outline': return outlineView(cache, doc, request.type)
+        case 'preview': return previewView(cache, doc)
+        default: throw Error(`Unknown view ${request.view}`)
+    }
+}
+
+function instancesView(cache: ParseCache, doc: ParsedDocument, start: string, end: string) {
+    return cache.view(doc, `instances:${start}:${end}`, () => generateInstances(
+        getMomentIndex(doc.todos),
+        parse(start, 'yyyy-MM-dd', new Date()),
+        parse(end, 'yyyy-MM-dd', new Date())
+    ))
+}
+
+function formatView(cache: ParseCache, doc: ParsedDocument, formatType = TODO_FORMAT): string {
+    return cache.view(doc, `format:${formatType}`, () => formatTodos(doc.todos, doc.content, formatType, doc.cfg.fixedTime)
+        .reduce((p, c) => `${p}${c.start},${c.end},${c.style}\n`, ''))
+}
+
+function foldingView(cache: ParseCache, doc: ParsedDocument): string {
+    return cache.view(doc, 'folding', () => foldTodos(doc.todos)
+        .reduce((p, [start, end]) => `${p}${start}-${end}\n`, ''))
+}
+
+function outlineView(cache: ParseCache, doc: ParsedDocument, formatType = TODO_FORMAT) {
+    return cache.view(doc, `outline:${formatType}`, () => ({ outline: outlineTodos(doc.todos, doc.content, formatType) }))
+}
+
+function previewView(cache: ParseCache, doc: ParsedDocument) {
+    return cache.view(doc, 'preview', () => previewMoments(doc.todos, doc.cfg.fixedTime))
+}
@@ -0,0 +1,70 @@
+import base64
+import json
+import os
+
+from system_tests.sys_test_util import (TESTDATA_DIR, dedent, get_session, get_url, request_batch, request_fold, request_format,
+                                        request_instances, request_outline, request_parse, request_preview)
+
+
+def test_batch_same_as_single_requests():
+    # Given
+    with open(os.path.join(TESTDATA_DIR, "test_todo.txt"), "rb") as file:
+        # Remove carrier returns to get same offsets on windows and linux.
+        todo = file.read().decode("utf8").replace("\r", "")
+
+    # When
+    results = request_batch(todo, [
+        {"view": "format", "type": "todo"},
+        {"view": "format", "type": "trash"},
+        {"view": "folding"},
+        {"view": "outline"},
+        {"view": "preview"},
+    ], fixed_time="2022-06-05")
+
+    # Then
+    assert results == [
+        request_format(todo),
+        request_format(todo, format_type="trash"),
+        request_fold(todo),
+        request_outline(todo),
+        request_preview(todo, fixed_time="2022-06-05"),
+    ]
+
+
+def test_batch_parse_and_instances():
+    # Given
+    content = dedent("""\
+        ------------------
+        cat1
+        ------------------
+        [] bla (18.06.2016-25.06.2016)
+            [x] sub (20.06.2016)
+        [] foo (01.07.2016)
+        """)
+
+    # When
+    results = request_batch(content, [
+        {"view": "parse"},
+        {"view": "instances", "start": "2016-06-20", "end": "2016-06-30"},
+    ], fixed_time="2022-05-22")
+
+    # Then
+    assert results == [request_parse(content), request_instances(content, "20.06.2016", "30.06.2016")]
+
+
+def test_batch_with_json_body():
+    # Given
+    content = "[] foo (22.05.2022)\n\t[] bar\n"
+    body = {
+        "content": base64.b64encode(content.encode("utf8")).decode("ascii"),
+        "fixedTime": "2022-06-05",
+        "views": [{"view": "folding"}]
+    }
+
+    # When
+    resp = get_session().post(f"{get_url('commonplace_js')}/batch",
+                              data=json.dumps(body),
+                              headers={"Content-Type": "application/json"})
+
+    # Then
+    assert resp.json()["results"] == request_batch(content, [{"view": "folding"}], fixed_time="2022-06-05")
@@ -46,6 +46,22 @@ def test_clean(test_app_todo_dir):
 """
 
 
+def test_clean_keeps_tildes(test_app_todo_dir):
+    # Given
+    todo_file = test_app_todo_dir / "todo.txt"
+    with open(todo_file, "w", encoding="utf8") as file:
+        file.write("[] ~/notes\n[x] ~done~\n    ~ comment\n[] ~\n")
+
+    # When
+    request_clean()
+
+    with open(todo_file, "r", encoding="utf8") as file:
+        updated_content = file.read()
+
+    # Then
+    assert updated_content == "[] ~/notes\n[] ~\n[x] ~done~\n    ~ comment\n"
+
+
 def test_trash(test_app_todo_dir):
     # Given
     todo_file = test_app_todo_dir / "todo.txt"
@@ -53,6 +69,8 @@ def test_trash(test_app_todo_dir):
 
     with open(todo_file, "w", encoding="utf8") as file:
         file.write(TEST_INPUT)
+    # Trashing appends, so start without the trash of earlier tests
+    trash_file.unlink(missing_ok=True)
 
     # When
     request_trash()
@@ -82,3 +100,29 @@ def test_trash(test_app_todo_dir):
     comments2
     comments3
 """
+
+
+def test_trash_appends(test_app_todo_dir):
+    # Given
+    todo_file = test_app_todo_dir / "todo.txt"
+    trash_file = test_app_todo_dir / "todo-trash.txt"
+
+    with open(todo_file, "w", encoding="utf8") as file:
+        file.write("[] foo\n[x] bar\n")
+    with open(trash_file, "w", encoding="utf8") as file:
+        file.write("earlier trash\n")
+
+    # When
+    request_trash()
+
+    with open(trash_file, "r", encoding="utf8") as file:
+        trash_content = file.read()
+
+    # Then
+    assert trash_content == """\
+earlier trash
+------------------
+  Trash from 05.06.2022 00:00:00
+------------------
+[x] bar
+"""
@@ -6,11 +6,49 @@ from pathlib import Path
 
 import pytest
 
+from system_tests.sys_test_util import close_session, set_url, start_test_server
+
+# Started servers listen on this port plus the index of the test worker
+BASE_PORT = 3001
+
+
+def pytest_addoption(parser):
+    parser.addoption("--start-server",
+                     action="store_true",
+                     help="start a commonplace_js test server instead of using the running one. "
+                     "Always done when running in parallel with pytest-xdist, with one server per worker.")
+
+
+def get_worker_id() -> typing.Optional[str]:
+    """Returns the id of the pytest-xdist worker running the tests, e.g. gw2, or None if not running in parallel."""
+    return os.environ.get("PYTEST_XDIST_WORKER")
+
+
+def get_test_app_todo_dir() -> Path:
+    tmp_dir = Path("c:\\temp") if platform.system() == "Windows" else Path("/tmp")
+    worker_id = get_worker_id()
+    return tmp_dir / (f"commonplace_system_test_{worker_id}" if worker_id else "commonplace_system_test")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def commonplace_js_server(request) -> typing.Generator[None, None, None]:
+    worker_id = get_worker_id()
+    start_server = request.config.getoption("start_server") or (worker_id and "COMMONPLACE_JS_URL" not in os.environ)
+    if not start_server:
+        yield
+        close_session()
+        return
+
+    port = BASE_PORT + (int(worker_id[2:]) if worker_id else 0)
+    with start_test_server(port, get_test_app_todo_dir()):
+        set_url("commonplace_js", f"http://127.0.0.1:{port}")
+        yield
+        close_session()
+
 
 @pytest.fixture(scope="module")
 def test_app_todo_dir() -> typing.Generator[Path, None, None]:
-    tmp_dir = Path("c:\\temp\\commonplace_system_test") if platform.system() == "Windows" else Path(
-        "/tmp/commonplace_system_test")
+    tmp_dir = get_test_app_todo_dir()
     shutil.rmtree(tmp_dir, ignore_errors=True)
     os.makedirs(tmp_dir)
     yield tmp_dir
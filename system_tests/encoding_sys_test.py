@@ -0,0 +1,37 @@
+import base64
+import gzip
+import os
+import zlib
+
+import pytest
+
+from system_tests.sys_test_util import TESTDATA_DIR, get_session, get_url, request_format
+
+
+@pytest.mark.parametrize(
+    "content_type,content_encoding,encode",
+    [
+        ("application/text", None, lambda data: base64.b64encode(data)),
+        ("application/octet-stream", None, lambda data: data),
+        ("text/plain", None, lambda data: data),
+        ("application/octet-stream", "gzip", gzip.compress),
+        ("application/octet-stream", "deflate", zlib.compress),
+        ("application/text", "gzip", lambda data: gzip.compress(base64.b64encode(data))),
+    ],
+)
+def test_body_encodings(content_type, content_encoding, encode):
+    # Given
+    with open(os.path.join(TESTDATA_DIR, "test_todo.txt"), "rb") as file:
+        # Remove carrier returns to get same offsets on windows and linux.
+        todo = file.read().decode("utf8").replace("\r", "")
+    headers = {"Content-Type": content_type}
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+
+    # When
+    resp = get_session().post(f"{get_url('commonplace_js')}/format?fixed_time=2022-06-05",
+                              data=encode(todo.encode("utf8")),
+                              headers=headers)
+
+    # Then
+    assert resp.content.decode("utf8") == request_format(todo)
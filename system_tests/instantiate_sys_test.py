@@ -3,7 +3,7 @@ from datetime import datetime
 import pytest
 
 from system_tests.models import Category, Instance
-from system_tests.sys_test_util import (dataclass_to_dict, dedent, parse_dmy, request_instances)
+from system_tests.sys_test_util import (dataclass_to_dict, dedent, iter_instances, parse_dmy, request_instances)
 
 
 def with_end_of_day(date: datetime) -> datetime:
@@ -376,6 +376,34 @@ def test_instantiate(content, start, end, expected_instances):
     assert [without_doc_pos(r) for r in result] == [without_doc_pos(dataclass_to_dict(i)) for i in expected_instances]
 
 
+@pytest.mark.parametrize(
+    "content,start,end",
+    [
+        (
+            """\
+            ------------------
+            cat1
+            ------------------
+            [] daily (every day)
+                [] sub (every day)
+            [] weekly (every 2nd tuesday 10:00)
+            [] range (18.06.2016-25.07.2017)
+            [x] done (21.06.2016)
+            """,
+            "01.01.2016",
+            "31.12.2017",
+        ),
+        ("[] bla (18.06.2016-25.06.2016)", "01.07.2016", "02.07.2016"),
+    ],
+)
+def test_instantiate_streamed(content, start, end):
+    # When
+    streamed = list(iter_instances(dedent(content), start, end))
+
+    # Then
+    assert streamed == request_instances(dedent(content), start, end)
+
+
 def without_doc_pos(inst: dict):
     del inst["origin_doc_pos"]
     if inst.get("category"):
@@ -87,6 +87,19 @@ def test_parse_category(content, expected_category):
     assert category == dataclass_to_dict(expected_category)
 
 
+def test_parse_keeps_names_like_keys():
+    # When
+    result = request_parse(dedent("""\
+        [] docPos refDate subMoments at 10.000
+            inProgress "recurrence": "daily"
+        """))
+
+    # Then
+    moment = result["moments"][0]
+    assert moment["name"] == "docPos refDate subMoments at 10.000"
+    assert moment["comments"][0]["content"] == 'inProgress "recurrence": "daily"'
+
+
 @pytest.mark.golden_test("testdata/parse.golden.yml")
 def test_full_parse(golden):
     # Given
@@ -1,156 +1,325 @@
 import base64
 import dataclasses
+import gzip
 from datetime import datetime
 import json
 import os
 import re
-from functools import reduce
-from time import time
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from time import monotonic, sleep, time
 
 import requests
+from requests.adapters import HTTPAdapter
 
 TESTDATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "testdata")
-SIBYL_URL = "http://localhost:8082"
-COMMONPLACE_URL = "http://127.0.0.1:5000"
-COMMONPLACE_JS_URL = "http://127.0.0.1:3000"
+SIBYL_URL = os.environ.get("SIBYL_URL", "http://localhost:8082")
+COMMONPLACE_URL = os.environ.get("COMMONPLACE_URL", "http://127.0.0.1:5000")
+COMMONPLACE_JS_URL = os.environ.get("COMMONPLACE_JS_URL", "http://127.0.0.1:3000")
+TEST_SERVER_SCRIPT = Path(__file__).resolve().parent.parent / "core" / "test_server" / "dist" / "app.js"
+TEST_SERVER_START_TIMEOUT = 10
+# Bodies sent to commonplace_js that are larger than this many bytes are gzip compressed
+COMPRESS_THRESHOLD = int(os.environ.get("COMPRESS_THRESHOLD", 16 * 1024))
+
+_base_urls = {
+    "sibyl": SIBYL_URL,
+    "commonplace": COMMONPLACE_URL,
+    "commonplace_js": COMMONPLACE_JS_URL,
+}
+_session = None
+
+
+def set_url(target, url):
+    """Changes the base URL of a target, e.g. to the server of the current test worker."""
+    get_url(target)
+    _base_urls[target] = url
+
+
+def get_session():
+    """Returns the session shared by all requests, keeping connections to the servers alive."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(_base_urls), pool_maxsize=10)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+
+def close_session():
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
+
+
+@contextmanager
+def start_test_server(port, todo_dir, env=None):
+    """Starts a commonplace_js test server on the port, stopping it again on exit. Yields the server process.
+    The server script can be changed with the COMMONPLACE_JS_SERVER environment variable."""
+    env = {**os.environ, **(env or {}), "PORT": str(port), "COMMONPLACE_TEST_DIR": str(todo_dir)}
+    script = os.environ.get("COMMONPLACE_JS_SERVER", str(TEST_SERVER_SCRIPT))
+    with subprocess.Popen(["node", script], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) as server:
+        try:
+            _wait_for_server(f"http://127.0.0.1:{port}", server)
+            yield server
+        finally:
+            server.terminate()
+
+
+def _wait_for_server(url, server):
+    deadline = monotonic() + TEST_SERVER_START_TIMEOUT
+    while True:
+        try:
+            get_session().get(url)
+            return
+        except requests.ConnectionError as e:
+            if server.poll() is not None:
+                raise RuntimeError(f"Test server exited with code {server.returncode}") from e
+            if monotonic() > deadline:
+                raise RuntimeError(f"Test server did not start on {url}") from e
+            sleep(0.1)
+
+
+def encode_body(content, target):
+    """Returns the request body with the content and its headers. commonplace_js takes the UTF-8 content,
+    compressed if it is large, the other targets the base64 encoded content."""
+    if target != "commonplace_js":
+        return base64.b64encode(content.encode("utf8")), {"Content-Type": "application/text"}
+
+    data = content.encode("utf8")
+    headers = {"Content-Type": "application/octet-stream"}
+    if len(data) > COMPRESS_THRESHOLD:
+        data = gzip.compress(data, compresslevel=1)
+        headers["Content-Encoding"] = "gzip"
+    return data, headers
 
 
 def request_parse(content, target="commonplace_js"):
-    resp = requests.post(f"{get_url(target)}/parse?fixed_time=2022-05-22&localTime=true",
-                         data=base64.b64encode(content.encode("utf8")),
-                         headers={"Content-Type": "application/text"})
+    data, headers = encode_body(content, target)
+    resp = get_session().post(f"{get_url(target)}/parse?fixed_time=2022-05-22&localTime=true",
+                              data=data,
+                              headers=headers)
     if target == "sibyl":
         return align_sibylgo_result(resp.json())
     if target == "commonplace_js":
-        return align_commonplace_js_result(resp.json())
+        return resp.json(object_pairs_hook=COMMONPLACE_JS_MAPPING.object_pairs_hook)
 
     return resp.json()
 
 
 def request_instances(content, start: str, end: str, target="commonplace_js"):
-    resp = requests.post(f"{get_url(target)}/instances?start={reformat_to_ymd(start)}&end={reformat_to_ymd(end)}&localTime=true",
-                         data=base64.b64encode(content.encode("utf8")),
-                         headers={"Content-Type": "application/text"})
+    data, headers = encode_body(content, target)
+    url = f"{get_url(target)}/instances?start={reformat_to_ymd(start)}&end={reformat_to_ymd(end)}&localTime=true"
+    resp = get_session().post(url, data=data, headers=headers)
 
     if target == "sibyl":
         return align_sibylgo_result(resp.json())
     if target == "commonplace_js":
-        res = align_commonplace_js_result(resp.json())
+        res = resp.json(object_pairs_hook=COMMONPLACE_JS_MAPPING.object_pairs_hook)
         add_null_categories(res)
         return res
     return resp.json()
 
 
+def iter_instances(content, start: str, end: str, target="commonplace_js"):
+    """Like request_instances, but yields the instances one by one while commonplace_js streams them."""
+    if target != "commonplace_js":
+        yield from request_instances(content, start, end, target)
+        return
+
+    data, headers = encode_body(content, target)
+    url = f"{get_url(target)}/instances?start={reformat_to_ymd(start)}&end={reformat_to_ymd(end)}&localTime=true&stream=ndjson"
+    with get_session().post(url, data=data, headers=headers, stream=True) as resp:
+        for line in resp.iter_lines():
+            if line:
+                res = [json.loads(line, object_pairs_hook=COMMONPLACE_JS_MAPPING.object_pairs_hook)]
+                add_null_categories(res)
+                yield res[0]
+
+
 def request_format(content, format_type="todo", fixed_time="2022-06-05", target="commonplace_js"):
-    resp = requests.post(f"{get_url(target)}/format?fixed_time={fixed_time}&type={format_type}",
-                         data=base64.b64encode(content.encode("utf8")),
-                         headers={"Content-Type": "application/text"})
+    data, headers = encode_body(content, target)
+    resp = get_session().post(f"{get_url(target)}/format?fixed_time={fixed_time}&type={format_type}",
+                              data=data,
+                              headers=headers)
 
     return resp.content.decode("utf8")
 
 
 def request_fold(content, target="commonplace_js"):
-    resp = requests.post(f"{get_url(target)}/folding",
-                         data=base64.b64encode(content.encode("utf8")),
-                         headers={"Content-Type": "application/text"})
+    data, headers = encode_body(content, target)
+    resp = get_session().post(f"{get_url(target)}/folding",
+                              data=data,
+                              headers=headers)
 
     return resp.content.decode("utf8")
 
 
 def request_outline(content, format_type="todo", target="commonplace_js"):
-    resp = requests.post(f"{get_url(target)}/outline?type={format_type}",
-                         data=base64.b64encode(content.encode("utf8")),
-                         headers={"Content-Type": "application/text"})
+    data, headers = encode_body(content, target)
+    resp = get_session().post(f"{get_url(target)}/outline?type={format_type}",
+                              data=data,
+                              headers=headers)
 
     return resp.json()
 
 
 def request_preview(content, target="commonplace_js", fixed_time="2021-04-17"):
-    resp = requests.post(f"{get_url(target)}/preview?fixed_time={fixed_time}&localTime=true",
-                         data=base64.b64encode(content.encode("utf8")),
-                         headers={"Content-Type": "application/text"})
+    data, headers = encode_body(content, target)
+    resp = get_session().post(f"{get_url(target)}/preview?fixed_time={fixed_time}&localTime=true",
+                              data=data,
+                              headers=headers)
 
     return resp.json()
 
 
+def request_batch(content, views, fixed_time=None, target="commonplace_js"):
+    """Requests several views of the content with a single upload and parse. The content is sent like
+    for the single view requests, the views as JSON in the query.
+    Views are dicts like {"view": "format", "type": "todo"} or {"view": "instances", "start": "2022-06-01", "end": "2022-06-30"}.
+    Returns the results in the same order as the views, aligned like the results of the single view requests."""
+    data, headers = encode_body(content, target)
+    params = {"localTime": "true", "views": json.dumps(views)}
+    if fixed_time:
+        params["fixed_time"] = fixed_time
+    resp = get_session().post(f"{get_url(target)}/batch", params=params, data=data, headers=headers)
+
+    results = resp.json()["results"]
+    for i, view in enumerate(views):
+        if view["view"] == "parse":
+            results[i] = align_commonplace_js_result(results[i])
+        elif view["view"] == "instances":
+            results[i] = align_commonplace_js_result(results[i])
+            add_null_categories(results[i])
+    return results
+
+
 def request_clean(target="commonplace_js"):
-    requests.post(f"{get_url(target)}/clean")
+    get_session().post(f"{get_url(target)}/clean")
 
 
 def request_trash(fixed_time="2022-06-05", target="commonplace_js"):
-    requests.post(f"{get_url(target)}/trash?fixed_time={fixed_time}")
+    get_session().post(f"{get_url(target)}/trash?fixed_time={fixed_time}")
 
 
 def get_url(target):
-    if target == "commonplace":
-        return COMMONPLACE_URL
-    elif target == "sibyl":
-        return SIBYL_URL
-    elif target == "commonplace_js":
-        print("ja")
-        return COMMONPLACE_JS_URL
-    else:
-        assert False, f"Invalid target {target}"
+    assert target in _base_urls, f"Invalid target {target}"
+    return _base_urls[target]
+
+
+class KeyMapping:
+    """Renames the keys of decoded JSON objects and normalizes their values in a single traversal.
+    Unlike replacing substrings of the encoded JSON, names and comments that happen to contain a key stay as they are."""
+
+    def __init__(self, keys, string_keys=None, list_keys=(), values=None, normalize_string=None):
+        # Renamed keys
+        self.keys = keys
+        # Renamed keys if their value is a string
+        self.string_keys = string_keys or {}
+        # Keys (after renaming) whose null values become empty lists
+        self.list_keys = frozenset(list_keys)
+        # Renamed string values per key (after renaming)
+        self.values = values or {}
+        self.normalize_string = normalize_string
+
+    def apply(self, data):
+        """Returns the decoded JSON data with mapped keys and values."""
+        if isinstance(data, dict):
+            return self.object_pairs_hook((k, self.apply(v)) for k, v in data.items())
+        if isinstance(data, list):
+            return [self.apply(v) for v in data]
+        return data
+
+    def object_pairs_hook(self, pairs):
+        """Maps a single object whose values are already mapped. Can be passed to json.loads
+        to map the data while decoding it."""
+        obj = {}
+        for key, value in pairs:
+            if isinstance(value, str):
+                key = self.string_keys.get(key) or self.keys.get(key, key)
+                value = self.values.get(key, {}).get(value, value)
+                if self.normalize_string:
+                    value = self.normalize_string(value)
+            else:
+                key = self.keys.get(key, key)
+                if value is None and key in self.list_keys:
+                    value = []
+            obj[key] = value
+        return obj
+
+
+SIBYLGO_TIMESTAMP = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6})999(?=[+-]\d{2}:\d{2}$|Z$)")
+COMMONPLACE_JS_TIMESTAMP = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})\.(000|999)(?=[+-]\d{2}:\d{2}$|Z$)")
+WORK_STATE_VALUES = {"inProgress": "in_progress"}
+
+
+def normalize_sibylgo_string(value):
+    # Nanoseconds to microseconds
+    return SIBYLGO_TIMESTAMP.sub(r"\1", value)
+
+
+def normalize_commonplace_js_string(value):
+    # Milliseconds to the microseconds of python's isoformat
+    return COMMONPLACE_JS_TIMESTAMP.sub(lambda m: m.group(1) if m.group(2) == "000" else f"{m.group(1)}.999999", value)
+
+
+SIBYLGO_MAPPING = KeyMapping(
+    keys={
+        "Categories": "categories",
+        "Name": "name",
+        "DocPos": "doc_pos",
+        "Priority": "priority",
+        "Color": "color",
+        "lineNumber": "line_num",
+        "Comments": "comments",
+        "Category": "category",
+        "Content": "content",
+        "Moments": "moments",
+        "TimeOfDay": "time_of_day",
+        "Start": "start",
+        "End": "end",
+        "WorkState": "work_state",
+        "Time": "dt",
+        "SubMoments": "sub_moments",
+        "Recurrence": "recurrence",
+        "RefDate": "ref_date",
+    },
+    string_keys={"Recurrence": "recurrence_type"},
+    list_keys=["sub_moments", "comments"],
+    values={"work_state": WORK_STATE_VALUES},
+    normalize_string=normalize_sibylgo_string,
+)
+
+COMMONPLACE_JS_MAPPING = KeyMapping(
+    keys={
+        "docPos": "doc_pos",
+        "lineNum": "line_num",
+        "timeOfDay": "time_of_day",
+        "workState": "work_state",
+        "subMoments": "sub_moments",
+        "refDate": "ref_date",
+        "recurrenceType": "recurrence_type",
+        "originDocPos": "origin_doc_pos",
+        "subInstances": "sub_instances",
+        "endsInRange": "ends_in_range",
+    },
+    string_keys={"recurrence": "recurrence_type"},
+    list_keys=["sub_moments", "comments"],
+    values={"work_state": WORK_STATE_VALUES},
+    normalize_string=normalize_commonplace_js_string,
+)
 
 
 def align_sibylgo_result(data):
-    repls = [
-        ('"Categories"', '"categories"'),
-        ('"Name"', '"name"'),
-        ('"DocPos"', '"doc_pos"'),
-        ('"Priority"', '"priority"'),
-        ('"Color"', '"color"'),
-        ('"lineNumber"', '"line_num"'),
-        ('"Comments"', '"comments"'),
-        ('"Category"', '"category"'),
-        ('"Content"', '"content"'),
-        ('"Moments"', '"moments"'),
-        ('"TimeOfDay"', '"time_of_day"'),
-        ('"Start"', '"start"'),
-        ('"End"', '"end"'),
-        ('"WorkState"', '"work_state"'),
-        ('"Time"', '"dt"'),
-        ('"SubMoments"', '"sub_moments"'),
-        ('"sub_moments": null', '"sub_moments": []'),
-        ('"comments": null', '"comments": []'),
-        ("999+02:00", "+02:00"),
-        ("999+01:00", "+01:00"),
-        ('"Recurrence": {', '"recurrence": {'),
-        ('"Recurrence": "', '"recurrence_type": "'),
-        ("RefDate", "ref_date"),
-        ("inProgress", "in_progress"),
-    ]
-
+    data = dict(data)
     del data["MomentsByID"]
-    j = json.dumps(data, indent=2, sort_keys=True)
-    aligned = reduce(lambda c, r: c.replace(r[0], r[1]), repls, j)
-    return json.loads(aligned)
+    return SIBYLGO_MAPPING.apply(data)
 
 
 def align_commonplace_js_result(data):
-    repls = [
-        ('"docPos"', '"doc_pos"'),
-        ('"lineNum"', '"line_num"'),
-        ('"timeOfDay"', '"time_of_day"'),
-        ('"workState"', '"work_state"'),
-        ('"subMoments"', '"sub_moments"'),
-        ('"sub_moments": null', '"sub_moments": []'),
-        ('"comments": null', '"comments": []'),
-        (".000", ""),
-        (".999", ".999999"),
-        ('"recurrence": {', '"recurrence": {'),
-        ('"recurrence": "', '"recurrence_type": "'),
-        ("refDate", "ref_date"),
-        ("inProgress", "in_progress"),
-        ("recurrenceType", "recurrence_type"),
-        ("originDocPos", "origin_doc_pos"),
-        ("subInstances", "sub_instances"),
-        ("endsInRange", "ends_in_range"),
-    ]
-
-    j = json.dumps(data, indent=2, sort_keys=True)
-    aligned = reduce(lambda c, r: c.replace(r[0], r[1]), repls, j)
-    return json.loads(aligned)
+    return COMMONPLACE_JS_MAPPING.apply(data)
 
 
 def add_null_categories(instances):
@@ -5,10 +5,8 @@
     // @ts-ignore
     const vscode = acquireVsCodeApi();
 
-    let calEvents = [];
-    function calendarEvents(start, end, timezone, callback) {
-        callback(calEvents);
-    }
+    // Version of the preview shown, patches only apply to it
+    let version = 0;
 
     $('#calendar').fullCalendar({
         header: {
@@ -17,72 +15,168 @@
             right: ''
         },
         defaultView: 'basicWeek',
-        events: calendarEvents,
         firstDay: 1,
         height: 150
     });
 
+    const today = keyedList($('#due-today'), r => createMomentCell(r.name, r.line).addClass('due-today'));
+    const week = keyedList($('#due-week'), r => createMomentCell(`${r.name} (${formatDate(r.end)})`, r.line).addClass('due-week'));
+    const overview = keyedList($('#overview'), createOverviewLane, updateOverviewLane);
+    // Keys of the calendar events, which are also their ids
+    const calendar = new Set();
+
     // Handle messages sent from the extension to the webview
     window.addEventListener('message', event => {
         const message = event.data; // The json data that the extension sent
-        console.log('', message.preview.calendar)
         switch (message.command) {
-            case 'update':
-                $('#due-today').empty().append(createInstanceList(message.preview.today, 'due-today'));
-                $('#due-week').empty().append(createInstanceList(message.preview.week, 'due-week', true));
-                $('#overview').empty().append(createOverviewBoard(message.preview.overview));
-                calEvents = message.preview.calendar;
-                $('#calendar').fullCalendar('refetchEvents');
+            case 'patch':
+                if (message.baseVersion === 0) {
+                    [today, week, overview].forEach(list => list.clear());
+                    $('#calendar').fullCalendar('removeEvents');
+                    calendar.clear();
+                }
+                else if (message.baseVersion !== version) {
+                    // Missed a patch, start over
+                    vscode.postMessage({ command: 'resync' });
+                    return;
+                }
+                today.apply(message.patch.today);
+                week.apply(message.patch.week);
+                overview.apply(message.patch.overview);
+                patchCalendar(message.patch.calendar);
+                version = message.version;
                 break;
         }
     });
 
-    function createInstanceList(instances, listEleClassName, showEndDate) {
-        return instances.map(m => {
-            let text = m.name;
-            if (showEndDate) {
-                text += ` (${formatDate(m.end)})`;
+    /**
+     * keeps an element per entry of a list in the container, updated with patches of the form {order, changed}.
+     * Changed entries are created again, unless update handles them.
+     */
+    function keyedList(container, create, update) {
+        const elements = new Map();
+        return {
+            clear() {
+                container.empty();
+                elements.clear();
+            },
+            apply(patch) {
+                if (patch.order) {
+                    const keys = new Set(patch.order);
+                    elements.forEach((ele, key) => {
+                        if (!keys.has(key)) {
+                            ele.remove();
+                            elements.delete(key);
+                        }
+                    });
+                }
+                Object.entries(patch.changed).forEach(([key, value]) => {
+                    const ele = elements.get(key);
+                    if (ele && update) {
+                        update(ele, value);
+                    }
+                    else {
+                        const newEle = create(value);
+                        if (ele) {
+                            ele.replaceWith(newEle);
+                        }
+                        elements.set(key, newEle);
+                    }
+                });
+                if (patch.order) {
+                    reorder(container[0], patch.order.map(key => elements.get(key)[0]));
+                }
             }
-            return createMomentCell(text, m.originDocPos.lineNum).addClass(listEleClassName);
-        });
+        };
     }
 
-    function createOverviewBoard(overview) {
-        return overview.categories.map(createOverviewLane);
+    /**
+     * moves the elements into the container in the given order, leaving the ones already in place.
+     */
+    function reorder(container, elements) {
+        let prev = null;
+        elements.forEach(ele => {
+            const expected = prev ? prev.nextSibling : container.firstChild;
+            if (ele !== expected) {
+                container.insertBefore(ele, expected);
+            }
+            prev = ele;
+        });
     }
 
-    function createOverviewLane(cat) {
-        const div = $('<div class="kanban-lane" />');
-        if (cat.name !== '_none') {
-            div.append($('<h3/>').text(cat.name));
-        }
-        const cols = {
-            'new': {
-                title: 'New',
-                ele: $('<td/>')
-            },
-            'waiting': {
-                title: 'Waiting',
-                ele: $('<td/>')
-            },
-            'inProgress': {
-                title: 'In Progress',
-                ele: $('<td/>')
+    function patchCalendar(patch) {
+        const cal = $('#calendar');
+        const keys = new Set(patch.order ?? calendar.keys());
+        const removed = [...calendar.keys()].filter(key => !keys.has(key));
+        removed.concat(Object.keys(patch.changed)).forEach(key => {
+            if (calendar.delete(key)) {
+                cal.fullCalendar('removeEvents', key);
             }
-        };
+        });
+        const added = Object.entries(patch.changed).map(([key, entry]) => {
+            calendar.add(key);
+            return { ...entry, id: key };
+        });
+        if (added.length) {
+            cal.fullCalendar('renderEvents', added, true);
+        }
+    }
 
-        const header = $('<tr/>').append($.map(cols, c => $('<th>').text(c.title)));
+    const COLUMNS = {
+        'new': 'New',
+        'waiting': 'Waiting',
+        'inProgress': 'In Progress'
+    };
 
-        cat.moments.forEach(m => {
-            const col = cols[m.workState];
-            col.ele.append(createMomentCell(m.name, m.docPos.lineNum));
+    function createOverviewLane(lane) {
+        const div = $('<div class="kanban-lane" />');
+        if (lane.name !== '_none') {
+            div.append($('<h3/>').text(lane.name));
+        }
+        const header = $('<tr/>').append($.map(COLUMNS, title => $('<th>').text(title)));
+        const cols = {};
+        $.each(COLUMNS, state => {
+            cols[state] = $('<td/>');
         });
-        const body = $('<tr/>').append($.map(cols, c => c.ele));
+        const body = $('<tr/>').append($.map(cols, col => col));
 
         const table = $('<table class="kanban-table"></table>')
             .append(header)
             .append(body);
-        return div.append(table);
+        div.append(table).data('lane', { cols, order: [], cells: new Map(), states: new Map() });
+        updateOverviewLane(div, lane);
+        return div;
+    }
+
+    function updateOverviewLane(div, lane) {
+        const data = div.data('lane');
+        const { cols, cells, states } = data;
+        const patch = lane.moments;
+        if (patch.order) {
+            data.order = patch.order;
+            const keys = new Set(patch.order);
+            cells.forEach((cell, key) => {
+                if (!keys.has(key)) {
+                    cell.remove();
+                    cells.delete(key);
+                    states.delete(key);
+                }
+            });
+        }
+        Object.entries(patch.changed).forEach(([key, m]) => {
+            const cell = createMomentCell(m.name, m.line);
+            if (cells.has(key)) {
+                cells.get(key).replaceWith(cell);
+            }
+            cells.set(key, cell);
+            states.set(key, m.workState);
+        });
+        if (patch.order || Object.keys(patch.changed).length) {
+            // Changed moments may have moved to another column
+            $.each(cols, (state, col) => {
+                reorder(col[0], data.order.filter(key => states.get(key) === state).map(key => cells.get(key)[0]));
+            });
+        }
     }
 
     function createMomentCell(text, line) {
@@ -3,11 +3,15 @@ import * as vscode from 'vscode'
 export interface CommonplaceConfig {
     getTicketPattern(): string;
     getTicketUrl(): string;
+    getShowViewTimings(): boolean;
+    getParseInWorker(): boolean;
 }
 
 export const VSCodeCommonplaceConfig: CommonplaceConfig = {
     getTicketPattern: () => getConfig('ticketPattern'),
-    getTicketUrl: () => getConfig('ticketUrl')
+    getTicketUrl: () => getConfig('ticketUrl'),
+    getShowViewTimings: () => getConfig('showViewTimings'),
+    getParseInWorker: () => getConfig('parseInWorker')
 }
 
 function getConfig<T>(key: string): T {
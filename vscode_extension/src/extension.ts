@@ -6,6 +6,7 @@ import * as commands from './commands'
 import * as preview from './preview'
 import * as links from './links'
 import { VSCodeCommonplaceConfig } from './config'
+import * as lib from './lib'
 
 // this method is called when vs code is activated
 export function activate(context: vscode.ExtensionContext) {
@@ -15,4 +16,5 @@ export function activate(context: vscode.ExtensionContext) {
     commands.activate(context)
     preview.activate(context)
     links.activate(VSCodeCommonplaceConfig)
+    lib.activate(context)
 }
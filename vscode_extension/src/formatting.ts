@@ -8,8 +8,6 @@ type FormatDefinition = {
     hoverMessage?: string;
 }
 
-type Format = FormatDefinition & { list: vscode.DecorationOptions[] };
-
 function initFormats(context: vscode.ExtensionContext): Record<string, FormatDefinition> {
     const priorityStyle = { border: 'solid 1px red' }
     const newStyle = { color: 'inherit; font-weight: bold' }
@@ -116,22 +114,61 @@ function initFormats(context: vscode.ExtensionContext): Record<string, FormatDef
     return fmts
 }
 
-function applyFormatting(styles: FormatStyle[], formats: Record<string, FormatDefinition>, document: vscode.TextDocument): Record<string, Format> {
-    const res: Record<string, Format> = {}
-    for (const key in formats) {
-        res[key] = {
-            ...formats[key],
-            list: []
+// How long to wait after showing the visible decorations before decorating the rest of the document
+const idleMillis = 100
+
+/**
+ * the start offsets of the lines of a document version, to convert many offsets to positions at once
+ * instead of asking the document for each of them.
+ */
+class LineOffsets {
+    private starts: number[] = [0]
+
+    constructor(content: string) {
+        for (let i = content.indexOf('\n'); i >= 0; i = content.indexOf('\n', i + 1)) {
+            this.starts.push(i + 1)
         }
     }
 
-    styles.forEach(style => {
-        const fmt = res[style.style]
+    positionAt(offset: number): vscode.Position {
+        let low = 0
+        let high = this.starts.length - 1
+        while (low < high) {
+            const mid = (low + high + 1) >> 1
+            if (this.starts[mid] <= offset) {
+                low = mid
+            }
+            else {
+                high = mid - 1
+            }
+        }
+        return new vscode.Position(low, offset - this.starts[low])
+    }
 
-        if (fmt) {
-            fmt.list.push({
-                range: new vscode.Range(document.positionAt(style.start), document.positionAt(style.end)),
-                hoverMessage: fmt.hoverMessage
+    lineStart(line: number): number {
+        return line < this.starts.length ? this.starts[line] : Number.MAX_SAFE_INTEGER
+    }
+}
+
+/**
+ * the decorations of the styles overlapping the lines, or of all styles without lines.
+ */
+function applyFormatting(
+    styles: FormatStyle[], formats: Record<string, FormatDefinition>, offsets: LineOffsets, lines?: [number, number]
+): Record<string, vscode.DecorationOptions[]> {
+    const res: Record<string, vscode.DecorationOptions[]> = {}
+    for (const key in formats) {
+        res[key] = []
+    }
+
+    const startOffset = lines ? offsets.lineStart(lines[0]) : 0
+    const endOffset = lines ? offsets.lineStart(lines[1] + 1) : Number.MAX_SAFE_INTEGER
+    styles.forEach(style => {
+        const list = res[style.style]
+        if (list && style.end >= startOffset && style.start < endOffset) {
+            list.push({
+                range: new vscode.Range(offsets.positionAt(style.start), offsets.positionAt(style.end)),
+                hoverMessage: formats[style.style].hoverMessage
             })
         }
     })
@@ -139,9 +176,30 @@ function applyFormatting(styles: FormatStyle[], formats: Record<string, FormatDe
     return res
 }
 
+function sameRanges(a: vscode.DecorationOptions[], b: vscode.DecorationOptions[]): boolean {
+    return a.length === b.length && a.every((dec, i) => dec.range.isEqual(b[i].range))
+}
+
+/**
+ * the decorations of the lines, keeping the previous decorations outside of them.
+ */
+function mergeLines(
+    lineDecorations: vscode.DecorationOptions[], previous: vscode.DecorationOptions[], lines: [number, number]
+): vscode.DecorationOptions[] {
+    return [
+        ...previous.filter(dec => dec.range.end.line < lines[0]),
+        ...lineDecorations,
+        ...previous.filter(dec => dec.range.start.line > lines[1])
+    ]
+}
+
 export function activate(context: vscode.ExtensionContext) {
     const formats = initFormats(context)
     let activeEditor: vscode.TextEditor | null = null
+    // The decorations last set on the active editor, by format
+    let applied: Record<string, vscode.DecorationOptions[]> = {}
+    let pendingFill: (() => void) | null = null
+    let fillTimer: ReturnType<typeof setTimeout> | null = null
 
     setActiveEditor(vscode.window.activeTextEditor)
     updateDecorations()
@@ -157,8 +215,18 @@ export function activate(context: vscode.ExtensionContext) {
         }
     }, null, context.subscriptions)
 
+    vscode.window.onDidChangeTextEditorVisibleRanges(event => {
+        // Don't wait for the idle time if scrolling reveals lines that aren't decorated yet
+        if (event.textEditor === activeEditor && pendingFill) {
+            pendingFill()
+        }
+    }, null, context.subscriptions)
+
     function setActiveEditor(editor: vscode.TextEditor) {
         activeEditor = isTodoEditor(editor) ? editor : null
+        // A newly shown editor has no decorations yet
+        applied = {}
+        cancelFill()
     }
 
     function isTodoEditor(editor: vscode.TextEditor) {
@@ -169,15 +237,60 @@ export function activate(context: vscode.ExtensionContext) {
     async function updateDecorations() {
         if (!activeEditor) return
 
-        requestFormat(activeEditor.document)
+        const editor = activeEditor
+        requestFormat(editor.document)
             .then(styles => {
-                const fmts = applyFormatting(styles, formats, activeEditor.document)
-                for (const key in fmts) {
-                    const fmt = fmts[key]
-                    // Note: it's important to also set if the list is empty, to disable old decorations on the line.
-                    activeEditor.setDecorations(fmt.dec, fmt.list)
+                if (editor !== activeEditor) return
+                cancelFill()
+
+                const version = editor.document.version
+                const offsets = new LineOffsets(editor.document.getText())
+                const visible = visibleLines(editor)
+                if (visible) {
+                    // Decorate what the user sees first, the rest of the document when idle. Off-screen decorations
+                    // are kept until then, so the fill only sets formats that changed off-screen too.
+                    const decorations = applyFormatting(styles, formats, offsets, visible)
+                    for (const key in decorations) {
+                        decorations[key] = mergeLines(decorations[key], applied[key] ?? [], visible)
+                    }
+                    setChangedDecorations(editor, decorations, key => !sameRanges(decorations[key], applied[key] ?? []))
+                }
+
+                pendingFill = () => {
+                    cancelFill()
+                    if (editor !== activeEditor || editor.document.version !== version) return
+                    const decorations = applyFormatting(styles, formats, offsets)
+                    setChangedDecorations(editor, decorations, key => !sameRanges(decorations[key], applied[key] ?? []))
                 }
+                fillTimer = setTimeout(pendingFill, visible ? idleMillis : 0)
             })
             .catch(() => { /* ignore if rejected because of newer doc version */ })
     }
+
+    function setChangedDecorations(
+        editor: vscode.TextEditor, decorations: Record<string, vscode.DecorationOptions[]>, changed: (key: string) => boolean
+    ) {
+        for (const key in decorations) {
+            // Note: it's important to also set if the list became empty, to disable old decorations on the line.
+            // Formats that were never set count as empty.
+            if ((applied[key] || decorations[key].length) && changed(key)) {
+                editor.setDecorations(formats[key].dec, decorations[key])
+                applied[key] = decorations[key]
+            }
+        }
+    }
+
+    function cancelFill() {
+        if (fillTimer) {
+            clearTimeout(fillTimer)
+        }
+        fillTimer = null
+        pendingFill = null
+    }
+}
+
+function visibleLines(editor: vscode.TextEditor): [number, number] | null {
+    const ranges = editor.visibleRanges
+    if (!ranges || !ranges.length) return null
+    return [ranges[0].start.line, ranges[ranges.length - 1].end.line]
 }
@@ -1,23 +1,101 @@
 import {
-    cleanDoneMoments, createParseConfig, DeleteEdit, Edit, EditType, EOF_OFFSET, foldTodos, FormatStyle, formatTodos, InsertEdit, Outline, outlineTodos,
-    parseMomentsString, TODO_FORMAT, trashDoneMoments, TRASH_FORMAT, backup, previewMoments
+    cleanDoneMoments, DeleteEdit, Edit, EditType, EOF_OFFSET, FormatStyle, InsertEdit, Outline,
+    CancelledError, TODO_FORMAT, trashDoneMoments, TRASH_FORMAT, backup, appendTrash
 } from '@commonplace/lib'
 import * as vscode from 'vscode'
 import * as path from 'path'
 import * as fs from 'fs'
+import { performance } from 'perf_hooks'
 import { trashLangId } from './util'
-import { Todos } from '@commonplace/lib/models'
+import { VSCodeCommonplaceConfig } from './config'
+import { Preview, Todos } from '@commonplace/lib/models'
+import { DocumentParser, PackedFormat, PackedTodos, ParsedDocument, unpackFormat, unpackTodos } from './views'
+import { ViewWorker } from './viewWorkerClient'
 
 interface CacheEntry {
     version: number;
-    promise?: Promise<Object>;
+    promise?: Promise<DocumentViews>;
     resolve?: Function;
+    // Cancelled once a newer version of the document is fetched
+    cancellation: vscode.CancellationTokenSource;
+}
+
+/**
+ * the views of a parsed document version, computed when they are first requested.
+ */
+interface DocumentViews {
+    readonly version: number;
+    get(key: string): Promise<unknown>;
 }
 
 const cache: Record<string, CacheEntry> = {}
-const debounceMillis = 250
+// Measured parse cost per document, smoothed over the recent versions
+const parseMillis: Record<string, number> = {}
+const defaultDebounceMillis = 250
+const minDebounceMillis = 30
+const maxDebounceMillis = 1000
+const parser = new DocumentParser()
+const viewWorker = new ViewWorker()
+const timingLog = vscode.window.createOutputChannel('commonplace.views')
+
+/**
+ * views computed on the extension host thread.
+ */
+class LocalViews implements DocumentViews {
+    private doc: ParsedDocument
+
+    constructor(doc: ParsedDocument) {
+        this.doc = doc
+    }
+
+    get version(): number {
+        return this.doc.version
+    }
+
+    async get(key: string): Promise<unknown> {
+        return this.doc.get(key, millis => logTiming(`${key} of version ${this.version}`, millis))
+    }
+}
+
+/**
+ * views computed in the view worker. Only the results are sent back, in a form that's cheap to copy.
+ */
+class WorkerViews implements DocumentViews {
+    readonly version: number
+    private docUri: string
+    private content: string
+    private views = new Map<string, Promise<unknown>>()
+
+    constructor(docUri: string, version: number, content: string) {
+        this.docUri = docUri
+        this.version = version
+        this.content = content
+    }
 
-async function fetchAll(doc: vscode.TextDocument): Promise<Object> {
+    get(key: string): Promise<unknown> {
+        if (!this.views.has(key)) {
+            this.views.set(key, viewWorker.view(this.docUri, this.version, key).then(res => {
+                if (res.millis !== undefined) {
+                    logTiming(`${key} of version ${this.version} in worker`, res.millis)
+                }
+                return this.unpack(key, res.result)
+            }))
+        }
+        return this.views.get(key)
+    }
+
+    private unpack(key: string, result: unknown): unknown {
+        if (key === 'format') {
+            return unpackFormat(result as PackedFormat)
+        }
+        if (key === 'todos') {
+            return unpackTodos(result as PackedTodos, this.content)
+        }
+        return result
+    }
+}
+
+async function fetchAll(doc: vscode.TextDocument): Promise<DocumentViews> {
     const docVersion = doc.version
     const docUri = doc.uri.toString()
 
@@ -27,8 +105,10 @@ async function fetchAll(doc: vscode.TextDocument): Promise<Object> {
         return entry.promise
     }
 
-    // 2) Otherwise, create a promise to fetch so other callbacks for this doc version can wait for you:
-    entry = { version: docVersion }
+    // 2) Otherwise, create a promise to fetch so other callbacks for this doc version can wait for you,
+    // and abandon the work for the older version:
+    entry?.cancellation.cancel()
+    entry = { version: docVersion, cancellation: new vscode.CancellationTokenSource() }
     // eslint-disable-next-line @typescript-eslint/no-unused-vars
     entry.promise = new Promise((resolve, _reject) => {
         entry.resolve = resolve
@@ -37,7 +117,7 @@ async function fetchAll(doc: vscode.TextDocument): Promise<Object> {
 
     // 3) Debounce: wait a bit, if newer version of doc is already being processed, use those results instead:
     // eslint-disable-next-line @typescript-eslint/no-unused-vars
-    await new Promise((resolve, _reject) => setTimeout(resolve, debounceMillis))
+    await new Promise((resolve, _reject) => setTimeout(resolve, debounceMillisFor(docUri)))
 
     const newerEntry = cache[docUri]
     if (newerEntry && newerEntry.version > docVersion) {
@@ -49,22 +129,68 @@ async function fetchAll(doc: vscode.TextDocument): Promise<Object> {
     }
     else {
         // 5) If no one has fetched it yet, finally fetch it yourself:
-        const data = await doFetchAll(doc)
+        let data: DocumentViews
+        try {
+            data = await doFetchAll(doc, entry.cancellation.token)
+        }
+        catch (err) {
+            const newestEntry = cache[docUri]
+            if (!(err instanceof CancelledError) || !newestEntry || newestEntry === entry) {
+                // Also if the document was closed in the meantime
+                throw err
+            }
+            // 6) A newer doc version came in while parsing, use its result instead:
+            data = await newestEntry.promise
+        }
         entry.resolve(data)
         return data
     }
 }
 
-async function doFetchAll(doc: vscode.TextDocument) {
-    const todos = parseMomentsString(doc.getText(), createParseConfig())
+async function doFetchAll(doc: vscode.TextDocument, token: vscode.CancellationToken): Promise<DocumentViews> {
+    const version = doc.version
+    const docUri = doc.uri.toString()
+    const content = doc.getText()
     const formatType = doc.languageId === trashLangId ? TRASH_FORMAT : TODO_FORMAT
-    return {
-        todos,
-        format: formatTodos(todos, doc.getText(), formatType),
-        fold: foldTodos(todos),
-        outline: outlineTodos(todos, doc.getText(), formatType),
-        preview: previewMoments(todos)
+    const start = performance.now()
+
+    let views: DocumentViews
+    if (VSCodeCommonplaceConfig.getParseInWorker()) {
+        const workerMillis = await viewWorker.parse(docUri, version, content, formatType, token)
+        logTiming(`parse of version ${version} in worker`, workerMillis)
+        views = new WorkerViews(docUri, version, content)
     }
+    else {
+        views = new LocalViews(await parser.parse(docUri, version, content, formatType, token))
+    }
+
+    const took = performance.now() - start
+    recordParseMillis(docUri, took)
+    logTiming(`parse of version ${version}`, took, `, debouncing ${debounceMillisFor(docUri).toFixed(0)} ms`)
+    return views
+}
+
+function logTiming(what: string, millis: number, details = '') {
+    if (VSCodeCommonplaceConfig.getShowViewTimings()) {
+        timingLog.appendLine(`${what} took ${millis.toFixed(1)} ms${details}`)
+    }
+}
+
+/**
+ * waits about twice as long as the document takes to parse, so small documents update right away and
+ * large ones aren't parsed again on every keystroke.
+ */
+function debounceMillisFor(docUri: string): number {
+    const cost = parseMillis[docUri]
+    if (cost === undefined) {
+        return defaultDebounceMillis
+    }
+    return Math.min(maxDebounceMillis, Math.max(minDebounceMillis, 2 * cost))
+}
+
+function recordParseMillis(docUri: string, millis: number) {
+    const prev = parseMillis[docUri]
+    parseMillis[docUri] = prev === undefined ? millis : 0.7 * prev + 0.3 * millis
 }
 
 function getter<T>(key: string): (document: vscode.TextDocument) => Promise<T> {
@@ -76,16 +202,29 @@ function getter<T>(key: string): (document: vscode.TextDocument) => Promise<T> {
             // race conditions where it may use the result of an older doc version.
             return Promise.reject(new Error('Newer doc version'))
         }
-        return Promise.resolve(res[key])
+        return res.get(key) as Promise<T>
     }
 }
 
 export const requestFormat = getter<FormatStyle[]>('format')
 export const requestFold = getter<number[][]>('fold')
 export const requestOutline = getter<Outline[]>('outline')
-export const requestPreview = getter('preview')
+export const requestPreview = getter<Preview>('preview')
 export const requestTodos = getter<Todos>('todos')
 
+export function activate(context: vscode.ExtensionContext) {
+    vscode.workspace.onDidCloseTextDocument(doc => forgetDocument(doc.uri.toString()), null, context.subscriptions)
+    context.subscriptions.push({ dispose: () => viewWorker.dispose() })
+}
+
+function forgetDocument(docUri: string) {
+    cache[docUri]?.cancellation.cancel()
+    delete cache[docUri]
+    delete parseMillis[docUri]
+    parser.forget(docUri)
+    viewWorker.close(docUri)
+}
+
 export async function cleanTodos(document: vscode.TextDocument): Promise<void> {
     await doBackup(document.uri.fsPath)
 
@@ -103,19 +242,19 @@ export async function trashTodos(document: vscode.TextDocument): Promise<void> {
     ])
 
     const [todoEdits, trashEdits] = trashDoneMoments(document.getText())
-    const todoWorkspaceEdit = toTodoWorkspaceEdit(todoEdits, document)
-    const trashWorkspaceEdit = toTrashWorkspaceEdits(trashEdits, trashFileUri)
-
-    await Promise.all([
-        vscode.workspace.applyEdit(trashWorkspaceEdit),
-        vscode.workspace.applyEdit(todoWorkspaceEdit)
-    ])
-
     const trashDoc = vscode.workspace.textDocuments.find(doc => doc.uri.toString() === trashFileUri.toString())
-    await Promise.all([
-        trashDoc.save(),
-        document.save()
-    ])
+    if (trashDoc) {
+        // The open trash document may have unsaved changes, edit it like the todo document
+        await vscode.workspace.applyEdit(toTrashWorkspaceEdits(trashEdits, trashFileUri))
+        await trashDoc.save()
+    }
+    else {
+        // Otherwise append to the file, without loading the whole trash history
+        await appendTrash(trashFileUri.fsPath, trashEdits)
+    }
+
+    await vscode.workspace.applyEdit(toTodoWorkspaceEdit(todoEdits, document))
+    await document.save()
 }
 
 function toTodoWorkspaceEdit(edits: Edit[], document: vscode.TextDocument): vscode.WorkspaceEdit {
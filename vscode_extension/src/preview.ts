@@ -1,4 +1,5 @@
 import * as vscode from 'vscode'
+import { diffPreview, isEmptyPatch, PreviewSnapshot, snapshotPreview } from '@commonplace/lib'
 import { requestPreview } from './lib'
 
 export function activate(context: vscode.ExtensionContext) {
@@ -35,6 +36,9 @@ class CommonplacePreviewPanel {
     private readonly _extensionUri: vscode.Uri
     private readonly _editor: vscode.TextEditor
     private _disposables: vscode.Disposable[] = []
+    // Version of the last preview sent to the webview, which only applies patches to this version
+    private _version = 0
+    private _sent: PreviewSnapshot | undefined
 
     public static createOrShow(extensionUri: vscode.Uri, editor: vscode.TextEditor) {
         const column = vscode.ViewColumn.Two
@@ -101,6 +105,10 @@ class CommonplacePreviewPanel {
                     this._editor.selections = [new vscode.Selection(pos, pos)]
                     this._editor.revealRange(new vscode.Range(pos, pos), vscode.TextEditorRevealType.AtTop)
                 }
+                else if (message.command === 'resync') {
+                    this._sent = undefined
+                    this.updatePreview()
+                }
             },
             null,
             this._disposables
@@ -116,10 +124,25 @@ class CommonplacePreviewPanel {
             this._disposables)
     }
 
+    /**
+     * sends the changes since the last sent preview to the webview. Patches are based on the version the webview
+     * should have, baseVersion 0 replaces everything. The webview asks for a resync if it has another version.
+     */
     public async updatePreview() {
         try {
-            const previewResp = await requestPreview(this._editor.document)
-            this._panel.webview.postMessage({ command: 'update', preview: previewResp })
+            const snapshot = snapshotPreview(await requestPreview(this._editor.document))
+            const patch = diffPreview(this._sent, snapshot)
+            if (this._sent && isEmptyPatch(patch)) {
+                return
+            }
+
+            const baseVersion = this._sent ? this._version : 0
+            this._version++
+            this._sent = snapshot
+            const delivered = await this._panel.webview.postMessage({ command: 'patch', version: this._version, baseVersion, patch })
+            if (!delivered && this._sent === snapshot) {
+                this._sent = undefined
+            }
         }
         catch (err) {
             // Ignore
@@ -143,6 +166,8 @@ class CommonplacePreviewPanel {
     private _updateWebview(webview: vscode.Webview) {
         this._panel.title = 'Commonplace Preview'
         this._panel.webview.html = this._getHtmlForWebview(webview)
+        // The reloaded webview has no preview yet
+        this._sent = undefined
         this.updatePreview()
     }
 
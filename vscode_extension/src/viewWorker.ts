@@ -0,0 +1,76 @@
+import { parentPort } from 'worker_threads'
+import { performance } from 'perf_hooks'
+import { CancelledError, FormatStyle } from '@commonplace/lib'
+import { Todos } from '@commonplace/lib/models'
+import {
+    DocumentParser, packedBuffers, packFormat, packTodos, ParsedDocument, ParseRequest, ViewRequest, WorkerRequest, WorkerResponse
+} from './views'
+
+// Entry point of the worker thread that parses documents and computes their views, see ViewWorker
+
+interface WorkerDocument {
+    version: number
+    token: { isCancellationRequested: boolean }
+    parsed: Promise<ParsedDocument>
+}
+
+const parser = new DocumentParser()
+const docs: Record<string, WorkerDocument> = {}
+
+parentPort.on('message', (req: WorkerRequest) => {
+    if (req.type === 'cancel') {
+        const doc = docs[req.docUri]
+        if (doc && doc.version === req.version) {
+            doc.token.isCancellationRequested = true
+        }
+        return
+    }
+    if (req.type === 'close') {
+        const doc = docs[req.docUri]
+        if (doc) {
+            doc.token.isCancellationRequested = true
+        }
+        delete docs[req.docUri]
+        parser.forget(req.docUri)
+        return
+    }
+
+    handle(req)
+        .catch(err => err instanceof CancelledError ? { id: req.id, cancelled: true } : { id: req.id, error: String(err?.stack ?? err) })
+        // Hand over the buffers of packed views instead of copying them
+        .then(res => parentPort.postMessage(res, packedBuffers(res.result)))
+})
+
+async function handle(req: ParseRequest | ViewRequest): Promise<WorkerResponse> {
+    if (req.type === 'parse') {
+        const prev = docs[req.docUri]
+        if (prev) {
+            prev.token.isCancellationRequested = true
+        }
+        const start = performance.now()
+        const token = { isCancellationRequested: false }
+        const doc = { version: req.version, token, parsed: parser.parse(req.docUri, req.version, req.content, req.formatType, token) }
+        docs[req.docUri] = doc
+        await doc.parsed
+        return { id: req.id, millis: performance.now() - start }
+    }
+
+    const doc = docs[req.docUri]
+    if (!doc || doc.version !== req.version) {
+        throw new CancelledError()
+    }
+    let millis: number | undefined
+    const parsed = await doc.parsed
+    const view = parsed.get(req.key, m => { millis = m })
+    return { id: req.id, result: pack(req.key, view, parsed.content), millis }
+}
+
+function pack(key: string, view: unknown, content: string): unknown {
+    if (key === 'format') {
+        return packFormat(view as FormatStyle[])
+    }
+    if (key === 'todos') {
+        return packTodos(view as Todos, content)
+    }
+    return view
+}
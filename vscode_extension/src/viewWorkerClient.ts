@@ -0,0 +1,109 @@
+import { Worker } from 'worker_threads'
+import * as path from 'path'
+import * as vscode from 'vscode'
+import { CancelledError } from '@commonplace/lib'
+import { ParseRequest, ViewRequest, WorkerRequest, WorkerResponse } from './views'
+
+interface PendingRequest {
+    resolve: (res: WorkerResponse) => void
+    reject: (err: Error) => void
+}
+
+/**
+ * runs parsing and view computation in a long-lived worker thread, off the extension host thread.
+ * The worker keeps the previous parse of each document, so it only re-parses what changed.
+ */
+export class ViewWorker {
+    private worker?: Worker
+    private nextId = 1
+    private pending = new Map<number, PendingRequest>()
+    // Forwards the cancellation of the latest parse of each document to the worker
+    private cancelListeners = new Map<string, vscode.Disposable>()
+
+    /**
+     * parses the document version in the worker, returning how long that took there.
+     * Rejects with a CancelledError if the token is cancelled in the meantime.
+     */
+    async parse(docUri: string, version: number, content: string, formatType: string, token: vscode.CancellationToken): Promise<number> {
+        // Stays subscribed after the parse, so views being computed for this version are cancelled too,
+        // until the next version of the document is parsed
+        this.cancelListeners.get(docUri)?.dispose()
+        this.cancelListeners.set(docUri, token.onCancellationRequested(() => this.post({ type: 'cancel', docUri, version })))
+        const res = await this.request({ type: 'parse', docUri, version, content, formatType })
+        return res.millis
+    }
+
+    async view(docUri: string, version: number, key: string): Promise<WorkerResponse> {
+        return this.request({ type: 'view', docUri, version, key })
+    }
+
+    /**
+     * drops the parse of the closed document in the worker.
+     */
+    close(docUri: string) {
+        this.cancelListeners.get(docUri)?.dispose()
+        this.cancelListeners.delete(docUri)
+        // A worker started later hasn't seen the document
+        this.worker?.postMessage({ type: 'close', docUri })
+    }
+
+    dispose() {
+        this.cancelListeners.forEach(listener => listener.dispose())
+        this.cancelListeners.clear()
+        const worker = this.worker
+        this.onExit(worker, new Error('View worker disposed'))
+        worker?.terminate()
+    }
+
+    private request(req: Omit<ParseRequest, 'id'> | Omit<ViewRequest, 'id'>): Promise<WorkerResponse> {
+        const id = this.nextId++
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, { resolve, reject })
+            this.post({ ...req, id } as WorkerRequest)
+        })
+    }
+
+    private post(req: WorkerRequest) {
+        this.ensureWorker().postMessage(req)
+    }
+
+    private ensureWorker(): Worker {
+        if (!this.worker) {
+            const worker = new Worker(path.join(__dirname, 'viewWorker.js'))
+            // Don't keep the extension host alive for the worker
+            worker.unref()
+            worker.on('message', (res: WorkerResponse) => this.onResponse(res))
+            worker.on('error', err => this.onExit(worker, err))
+            worker.on('exit', code => this.onExit(worker, new Error(`View worker exited with code ${code}`)))
+            this.worker = worker
+        }
+        return this.worker
+    }
+
+    private onResponse(res: WorkerResponse) {
+        const pending = this.pending.get(res.id)
+        this.pending.delete(res.id)
+        if (!pending) {
+            return
+        }
+        if (res.cancelled) {
+            pending.reject(new CancelledError())
+        }
+        else if (res.error !== undefined) {
+            pending.reject(new Error(res.error))
+        }
+        else {
+            pending.resolve(res)
+        }
+    }
+
+    private onExit(worker: Worker | undefined, err: Error) {
+        if (!worker || this.worker !== worker) {
+            return
+        }
+        // The next request starts a new worker, which parses the documents from scratch
+        this.worker = undefined
+        this.pending.forEach(pending => pending.reject(err))
+        this.pending.clear()
+    }
+}
@@ -0,0 +1,174 @@
+import {
+    CancellationToken, CompactTodos, compactTodos, createParseConfig, foldTodos, FormatStyle, formatTodos, MomentColumns, outlineTodos,
+    parseMomentsCancellable, previewMoments
+} from '@commonplace/lib'
+import { Todos } from '@commonplace/lib/models'
+import { performance } from 'perf_hooks'
+
+// Doesn't depend on vscode, so it can run both on the extension host and in the view worker
+
+const viewComputers: Record<string, (doc: ParsedDocument) => unknown> = {
+    todos: d => d.todos,
+    format: d => formatTodos(d.todos, d.content, d.formatType, null, d.token),
+    fold: d => foldTodos(d.todos),
+    outline: d => outlineTodos(d.todos, d.content, d.formatType),
+    preview: d => previewMoments(d.todos)
+}
+
+/**
+ * the parsed version of a document, with the views derived from it. Views are computed when they are
+ * first requested, so views nobody looks at, like the preview with its panel closed, cost nothing.
+ */
+export class ParsedDocument {
+    readonly version: number
+    readonly content: string
+    readonly todos: Todos
+    readonly formatType: string
+    readonly token: CancellationToken
+    private views = new Map<string, unknown>()
+
+    constructor(version: number, content: string, todos: Todos, formatType: string, token: CancellationToken) {
+        this.version = version
+        this.content = content
+        this.todos = todos
+        this.formatType = formatType
+        this.token = token
+    }
+
+    /**
+     * returns the view, computing it if it wasn't requested before. onComputed gets how long that took.
+     */
+    get(key: string, onComputed?: (millis: number) => void): unknown {
+        if (!this.views.has(key)) {
+            const start = performance.now()
+            this.views.set(key, viewComputers[key](this))
+            onComputed?.(performance.now() - start)
+        }
+        return this.views.get(key)
+    }
+}
+
+/**
+ * parses versions of documents. Only the part that changed since the last parse of a document is re-parsed.
+ */
+export class DocumentParser {
+    private parsed: Record<string, { content: string, todos: Todos }> = {}
+    // Shared across parses so the parsed dates and times are cached between document versions
+    private parseConfig = createParseConfig()
+
+    async parse(docUri: string, version: number, content: string, formatType: string, token: CancellationToken): Promise<ParsedDocument> {
+        const todos = await parseMomentsCancellable(content, this.parseConfig, token, this.parsed[docUri])
+        this.parsed[docUri] = { content, todos }
+        return new ParsedDocument(version, content, todos, formatType, token)
+    }
+
+    forget(docUri: string) {
+        delete this.parsed[docUri]
+    }
+}
+
+/**
+ * parses a document version in the view worker, cancelling the previous parse of the document.
+ */
+export interface ParseRequest {
+    type: 'parse'
+    id: number
+    docUri: string
+    version: number
+    content: string
+    formatType: string
+}
+
+export interface ViewRequest {
+    type: 'view'
+    id: number
+    docUri: string
+    version: number
+    key: string
+}
+
+export interface CancelRequest {
+    type: 'cancel'
+    docUri: string
+    version: number
+}
+
+/**
+ * drops the parse of a closed document in the view worker.
+ */
+export interface CloseRequest {
+    type: 'close'
+    docUri: string
+}
+
+export type WorkerRequest = ParseRequest | ViewRequest | CancelRequest | CloseRequest
+
+export interface WorkerResponse {
+    id: number
+    result?: unknown
+    // How long the parse or view took in the worker, unset if the view was computed before
+    millis?: number
+    cancelled?: boolean
+    error?: string
+}
+
+/**
+ * format styles as sent by the view worker: the style names, and a [style index, start, end] triple per style.
+ */
+export interface PackedFormat {
+    styles: string[]
+    spans: Int32Array
+}
+
+export function packFormat(formatStyles: FormatStyle[]): PackedFormat {
+    const styleIndex = new Map<string, number>()
+    const styles: string[] = []
+    const spans = new Int32Array(formatStyles.length * 3)
+    formatStyles.forEach((s, i) => {
+        let index = styleIndex.get(s.style)
+        if (index === undefined) {
+            index = styles.push(s.style) - 1
+            styleIndex.set(s.style, index)
+        }
+        spans[i * 3] = index
+        spans[i * 3 + 1] = s.start
+        spans[i * 3 + 2] = s.end
+    })
+    return { styles, spans }
+}
+
+export function unpackFormat(packed: PackedFormat): FormatStyle[] {
+    const formatStyles: FormatStyle[] = new Array(packed.spans.length / 3)
+    for (let i = 0; i < formatStyles.length; i++) {
+        formatStyles[i] = { style: packed.styles[packed.spans[i * 3]], start: packed.spans[i * 3 + 1], end: packed.spans[i * 3 + 2] }
+    }
+    return formatStyles
+}
+
+/**
+ * todos as sent by the view worker: the columns of their CompactTodos, without the content, which the
+ * extension host has already.
+ */
+export type PackedTodos = Omit<MomentColumns, 'content'>
+
+export function packTodos(todos: Todos, content: string): PackedTodos {
+    // eslint-disable-next-line @typescript-eslint/no-unused-vars
+    const { content: _content, ...columns } = compactTodos(todos, content).toColumns()
+    return columns
+}
+
+export function unpackTodos(packed: PackedTodos, content: string): Todos {
+    return new CompactTodos({ ...packed, content })
+}
+
+/**
+ * returns the buffers of the typed arrays of a packed view, to hand them over instead of copying them.
+ */
+export function packedBuffers(packed: unknown): ArrayBuffer[] {
+    if (!packed || typeof packed !== 'object') {
+        return []
+    }
+    return Object.values(packed)
+        .filter(value => ArrayBuffer.isView(value))
+        .map(value => (value as ArrayBufferView).buffer as ArrayBuffer)
+}